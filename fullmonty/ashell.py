@@ -9,6 +9,7 @@ The *run* will send to the stream while the command is executing while *system*
 before sending the output to the stream.
 """
 import os
+import re
 import sys
 
 __docformat__ = 'restructuredtext en'
@@ -172,19 +173,43 @@ class AShell(object):
     def _system(self, command_line):
         raise NotImplementedError
 
+    def _pipe(self, command_line, input_text):
+        """
+        Execute the given command line with input_text on its stdin and wait for completion.
+
+        :param command_line: command line to execute
+        :type command_line: str
+        :param input_text: text to send to the command's stdin
+        :type input_text: str
+        :returns: the combined stdout and stderr of the command
+        :rtype: str
+        """
+        raise NotImplementedError
+
     # noinspection PyMethodMayBeStatic
     def logout(self):
         """log out of the current shell if any"""
         pass
 
-    def mysql(self, user, password, sql=None):
+    def mysql(self, user, password, sql=None, batch=False, verbose=False):
         """
         run mysql commands.
 
+        Each line of the sql is a statement.  Normally each statement is ran with it's own mysql client.  In batch
+        mode all of the statements are streamed to a single mysql client and the results are split per statement.
+
         :param user: mysql user
         :param password: mysql user's password
         :param sql: mysql to run
+        :param batch: run all of the statements with a single mysql client
+        :type batch: bool
+        :param verbose: in batch mode, output the results
+        :type verbose: bool
+        :returns: in batch mode, the output of each statement
+        :rtype: list[str]
         """
+        if sql and batch:
+            return self._mysql_batch(user, password, sql, verbose=verbose)
         if sql:
             pid = os.getpid()
             config = ".my.cnf.{pid}".format(pid=pid)
@@ -209,3 +234,60 @@ class AShell(object):
                     do_query(query)
             finally:
                 self.system('rm -f {config}'.format(config=config))
+
+    def _mysql_batch(self, user, password, sql, verbose=False):
+        """
+        Stream the sql statements to one mysql client.  A marker query follows each statement so the client's output
+        can be split into the output of each statement.  A statement that fails does not stop the later statements,
+        it's error message is in it's output.
+
+        :param user: mysql user
+        :param password: mysql user's password
+        :param sql: mysql to run, one statement per line
+        :param verbose: output the results
+        :returns: the output of each statement
+        :rtype: list[str]
+        """
+        pid = os.getpid()
+        config = ".my.cnf.{pid}".format(pid=pid)
+        marker = "--fullmonty-mysql-{pid}--".format(pid=pid)
+
+        queries = [query for query in map(str.strip, sql.format(user=user, password=password).split("\n")) if query]
+        script = []
+        for index, query in enumerate(queries):
+            if not query.endswith(';'):
+                query += ';'
+            script.append(query)
+            script.append("SELECT '{marker}-{index}' AS '{marker}';".format(marker=marker, index=index))
+
+        try:
+            # the config file is written from stdin by a shell with a restrictive umask so the password
+            # is neither readable by others nor visible on a command line.
+            self._pipe('umask 077 && cat >{config}'.format(config=config),
+                       "# mysql_secure_installation config file\n"
+                       "[mysql]\n"
+                       "user={user}\n"
+                       "password={password}\n".format(user=user, password=password))
+            # the errors are on stderr, merged with stdout.  --unbuffered flushes stdout after each statement so
+            # the error of a statement comes before the marker that ends it.
+            output = self._pipe('mysql --defaults-file={config} --batch --force --unbuffered'.format(config=config),
+                                '\n'.join(script) + '\n')
+        finally:
+            self._system('rm -f {config}'.format(config=config))
+
+        # the marker query outputs a header line with the marker and a value line with the marker and index
+        end_regex = re.compile(re.escape(marker) + r'-(\d+)')
+        results = [''] * len(queries)
+        lines = []
+        for line in output.splitlines(True):
+            match = end_regex.search(line)
+            if match:
+                results[int(match.group(1))] = ''.join(lines)
+                lines = []
+            elif marker not in line:
+                lines.append(line)
+        if lines and results:
+            results[-1] += ''.join(lines)
+        for query, result in zip(queries, results):
+            self.display("{query}\n{result}".format(query=query, result=result), verbose=verbose)
+        return results
@@ -0,0 +1,398 @@
+# coding=utf-8
+
+"""
+An asyncio interface to a remote shell over ssh.
+
+AsyncRemoteShell offers the AShell contract (run, system, put, get) as coroutines plus an *async for* streaming
+generator.  Commands run on exec channels multiplexed over one pooled paramiko transport per host.  Channel output is
+awaited by registering the channel's file descriptor with the event loop, so a running command does not hold a
+thread and one process can drive hundreds of remote sessions.  Connecting, opening channels and SFTP transfers are
+blocking in paramiko and are ran in the loop's default executor.
+
+Python 3.6+ only, the module uses async generators and is a SyntaxError to import on older Pythons.  It is not
+imported by any other fullmonty module.
+
+Usage
+-----
+
+.. code-block:: python
+
+    async def main():
+        async with AsyncRemoteShell('web1', user='deploy', password=password) as remote:
+            print(await remote.run('uptime'))
+            async for line in remote.run_generator('tail -n 100 /var/log/syslog'):
+                print(line, end='')
+            await remote.put('dist/app.tar.gz', '/tmp/app.tar.gz')
+
+"""
+import asyncio
+import re
+import sys
+from collections import OrderedDict
+from functools import partial
+from getpass import getuser
+from time import time
+
+from .ashell import AShell
+from .channel_io import LineDecoder, channel_finished, env_command_line, ready_chunks
+from .remote_shell import ExecResult, default_pattern_responses
+from .sftp_transfer import SFTPTransfer
+from .transport_pool import TransportPool
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('AsyncRemoteShell',)
+
+# get_running_loop is new in 3.7, on 3.6 get_event_loop returns the running loop inside a coroutine
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+class _Prompter(object):
+    """
+    Answer the prompts in a command's output on it's stdin.  A prompt is usually not a complete line, so the
+    output since the last answered prompt is searched as each chunk arrives.
+
+    :param channel: the command's channel
+    :type channel: paramiko.Channel
+    :param pattern_response: the response by regular expression pattern, a None response answers nothing
+    :type pattern_response: dict[str, str]
+    """
+
+    #: the characters of unanswered output kept for matching
+    LIMIT = 4096
+
+    def __init__(self, channel, pattern_response):
+        self.channel = channel
+        self.responses = [(re.compile(pattern), response) for pattern, response in pattern_response.items()]
+        self._text = ''
+
+    def feed(self, chunk):
+        """
+        :param chunk: the next output from the command
+        :type chunk: bytes
+        """
+        self._text = (self._text + chunk.decode('utf-8', 'replace'))[-self.LIMIT:]
+        while True:
+            matches = [(match.start(), match, response) for match, response in
+                       ((regex.search(self._text), response) for regex, response in self.responses) if match]
+            if not matches:
+                return
+            start, match, response = min(matches, key=lambda found: found[0])
+            self._text = self._text[match.end():]
+            if response is not None:
+                # the default responses end with the terminal's enter key, a pipe wants a newline
+                self.channel.sendall((response.rstrip('\r') + '\n').encode('utf-8'))
+
+
+class AsyncRemoteShell(AShell):
+    """
+    Provides an asyncio run interface over an ssh connection.
+
+    The __aenter__() and __aexit__() methods provide support for the **async with** syntax.
+
+    :param host: the remote host
+    :type host: str
+    :param user: the remote user, defaults to the local user
+    :type user: str
+    :param password: the user's password, None to use keys only
+    :type password: str
+    :param port: the ssh port
+    :type port: int
+    :param logfile: file to append the displayed output to
+    :type logfile: str
+    :param verbose: if verbose, then echo the commands and their output
+    :type verbose: bool
+    :param keepalive: seconds between keepalive packets on the transport
+    :type keepalive: int
+    :param connect_timeout: seconds to give the connection to be established
+    :type connect_timeout: float
+    """
+
+    def __init__(self, host, user=None, password=None, port=22, logfile=None, verbose=False, keepalive=30,
+                 connect_timeout=None):
+        super(AsyncRemoteShell, self).__init__(is_remote=True, verbose=verbose)
+        if host is None or not host:
+            raise AttributeError("You must provide a non-empty string for 'host'")
+        self.address = host
+        self.user = user or getuser()
+        self.password = password
+        self.port = port
+        self.logfile = logfile
+        self.transport_pool = TransportPool(keepalive=keepalive, connect_timeout=connect_timeout)
+        self.exit_status = None
+        """:type exit_status: int"""
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    # noinspection PyUnusedLocal
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        self.logout()
+
+    async def _in_executor(self, func, *args):
+        return await _running_loop().run_in_executor(None, partial(func, *args))
+
+    async def connect(self):
+        """
+        Connect the pooled transport, if not already connected.
+
+        :rtype: paramiko.Transport
+        """
+        return await self._in_executor(self.transport_pool.get, self.address, self.port, self.user, self.password)
+
+    async def _open_channel(self, command_line, env=None, combine_stderr=False):
+        command_line = env_command_line(command_line, env)
+        transport = await self.connect()
+
+        # noinspection PyDocstring
+        def open_channel():
+            channel = transport.open_session()
+            channel.set_combine_stderr(combine_stderr)
+            channel.exec_command(command_line)
+            channel.setblocking(0)
+            return channel
+
+        return await self._in_executor(open_channel)
+
+    # noinspection PyMethodMayBeStatic
+    async def _readable(self, channel, timeout=None):
+        """
+        Wait until the channel has stdout or stderr data, an exit status, or is closed.
+
+        :returns: False if the timeout expired
+        :rtype: bool
+        """
+        if channel.recv_ready() or channel.recv_stderr_ready() or channel.exit_status_ready():
+            return True
+        loop = _running_loop()
+        ready = loop.create_future()
+        fd = channel.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(True))
+        try:
+            await asyncio.wait_for(ready, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    async def _chunks(self, channel, timeout=None):
+        """
+        Yield (is_stderr, bytes) as the data arrives on the channel until the command exits.
+        On timeout the channel is closed.
+        """
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            for chunk in ready_chunks(channel):
+                yield chunk
+            if channel_finished(channel):
+                break
+            wait = None
+            if deadline is not None:
+                wait = deadline - time()
+            if (wait is not None and wait <= 0) or not await self._readable(channel, wait):
+                channel.close()
+                return
+        # drain whatever arrived with the exit status
+        for chunk in ready_chunks(channel):
+            yield chunk
+
+    async def exec_command(self, cmd_args, out_stream=sys.stdout, env=None, verbose=False,
+                           prefix=None, postfix=None, timeout=None):
+        """
+        Run the command on it's own exec channel.
+
+        :param cmd_args: list of command arguments or str command line
+        :type cmd_args: list or str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param env: the environment variables for the command to use.
+        :type env: dict
+        :param verbose: if verbose, then echo the command and it's output to stdout.
+        :type verbose: bool
+        :param prefix: list of command arguments to prepend to the command line
+        :type prefix: list[str]
+        :param postfix: list of command arguments to append to the command line
+        :type postfix: list[str]
+        :param timeout: the maximum time in seconds to give the command, None waits forever.
+            On timeout the channel is closed and the exit status is -1.
+        :type timeout: float
+        :returns: the stdout, stderr and exit status of the command
+        :rtype: ExecResult
+        """
+        command_line = self._command_line(cmd_args, prefix, postfix)
+        self.display("{line}\n".format(line=command_line), out_stream=out_stream, verbose=verbose)
+        channel = await self._open_channel(command_line, env=env)
+        try:
+            stdout = []
+            stderr = []
+            async for is_stderr, chunk in self._chunks(channel, timeout):
+                (stderr if is_stderr else stdout).append(chunk)
+            exit_status = channel.recv_exit_status() if channel.exit_status_ready() else -1
+        finally:
+            channel.close()
+        result = ExecResult(b''.join(stdout).decode('utf-8', 'replace'),
+                            b''.join(stderr).decode('utf-8', 'replace'),
+                            exit_status)
+        self.display(result.stdout + result.stderr, out_stream=out_stream, verbose=verbose)
+        return result
+
+    async def run(self, cmd_args, out_stream=sys.stdout, env=None, verbose=True,
+                  prefix=None, postfix=None, accept_defaults=False, pattern_response=None, timeout=120,
+                  timeout_interval=.001, debug=False):
+        """
+        Runs the command and returns the output (stdout and stderr combined), writing the output to out_stream if
+        verbose is True.
+
+        :param cmd_args: list of command arguments or str command line
+        :type cmd_args: list or str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param env: the environment variables for the command to use.
+        :type env: dict
+        :param verbose: if verbose, then echo the command and it's output to stdout.
+        :type verbose: bool
+        :param prefix: list of command arguments to prepend to the command line
+        :type prefix: list[str]
+        :param postfix: list of command arguments to append to the command line
+        :type postfix: list[str]
+        :param accept_defaults: accept responses to default regexes, see remote_shell.default_pattern_responses.
+        :type accept_defaults: bool
+        :param pattern_response: dictionary whose key is a regular expression pattern that when matched in the
+            output results in the value and a newline being sent to the command's stdin.  If the value is None,
+            then no response is sent.  There is no terminal, so only prompts written to a pipe can be answered.
+        :type pattern_response: dict[str, str]
+        :param timeout: the maximum time to give the process to complete
+        :type timeout: int
+        :param timeout_interval: unused, output is awaited instead of polled
+        :type timeout_interval: int
+        :param debug: emit debugging info
+        :type debug: bool
+
+        :returns: the output of the command
+        :rtype: str
+        """
+        responses = OrderedDict(pattern_response or {})
+        if accept_defaults:
+            responses.update(default_pattern_responses(self.user, self.password))
+        lines = []
+        async for line in self.run_generator(cmd_args, out_stream=out_stream, env=env, verbose=verbose,
+                                             prefix=prefix, postfix=postfix, timeout=timeout, debug=debug,
+                                             pattern_response=responses):
+            lines.append(line)
+        return ''.join(lines)
+
+    async def run_generator(self, cmd_args, out_stream=sys.stdout, env=None, verbose=True,
+                            prefix=None, postfix=None, timeout=0, debug=False, pattern_response=None):
+        """
+        Runs the command and yields each line of output (stdout and stderr combined) as it arrives, writing the
+        output to out_stream if verbose is True.  When the command completes it's exit status is in *exit_status*,
+        which is None if the timeout expired.
+
+        :param cmd_args: list of command arguments or str command line
+        :type cmd_args: list or str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param env: the environment variables for the command to use.
+        :type env: dict
+        :param verbose: if verbose, then echo the command and it's output to stdout.
+        :type verbose: bool
+        :param prefix: list of command arguments to prepend to the command line
+        :type prefix: list[str]
+        :param postfix: list of command arguments to append to the command line
+        :type postfix: list[str]
+        :param timeout: max time in seconds for command to run, 0 means no limit
+        :type timeout: int
+        :param debug: debug log messages
+        :type debug: bool
+        :param pattern_response: the responses to send to the command's stdin by regular expression, see run
+        :type pattern_response: dict[str, str]
+        """
+        command_line = self._command_line(cmd_args, prefix, postfix)
+        self.display("run_generator(%s, %s)\n\n" % (cmd_args, env), out_stream=out_stream, verbose=debug)
+        self.display("{line}\n\n".format(line=command_line), out_stream=out_stream, verbose=verbose)
+        self.exit_status = None
+        channel = await self._open_channel(command_line, env=env, combine_stderr=True)
+        prompter = _Prompter(channel, pattern_response) if pattern_response else None
+        decoder = LineDecoder()
+        try:
+            async for is_stderr, chunk in self._chunks(channel, timeout or None):
+                if prompter is not None:
+                    prompter.feed(chunk)
+                for line in decoder.decode(chunk):
+                    self.display(line, out_stream=out_stream, verbose=verbose)
+                    yield line
+            for line in decoder.finish():
+                self.display(line, out_stream=out_stream, verbose=verbose)
+                yield line
+            if channel.exit_status_ready():
+                self.exit_status = channel.recv_exit_status()
+        finally:
+            channel.close()
+
+    async def system(self, cmd_line, out_stream=sys.stdout, prefix=None, postfix=None, verbose=True):
+        """
+        Execute the given command line and wait for completion.
+
+        :param cmd_line: command line to execute
+        :type cmd_line: str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param prefix: list of command arguments to prepend to the command line
+        :type prefix: list[str]
+        :param postfix: list of command arguments to append to the command line
+        :type postfix: list[str]
+        :param verbose: asserted to echo command and results
+        :type verbose: bool
+        :returns: the output of the command
+        :rtype: str
+        """
+        self.display("system(%s)\n\n" % cmd_line, out_stream=out_stream, verbose=verbose)
+        result = await self.exec_command([cmd_line], prefix=prefix, postfix=postfix)
+        output = result.stdout + result.stderr
+        self.display(output + '\n', out_stream=out_stream, verbose=verbose)
+        return output
+
+    async def put(self, files, remote_path=None, out_stream=sys.stdout, verbose=False, channels=4, progress=None):
+        """
+        Copy files from the local system to the remote system.  See RemoteShell.put.
+
+        :returns: the local files copied
+        :rtype: str
+        """
+        if remote_path is None:
+            remote_path = files
+        self.display("sftp put '{src}' '{dest}'\n".format(src=files, dest=remote_path),
+                     out_stream=out_stream, verbose=verbose)
+        transfer = SFTPTransfer(await self.connect(), channels=channels, progress=progress)
+        output = repr(await self._in_executor(transfer.put, files, remote_path))
+        self.display(output + '\n', out_stream=out_stream, verbose=verbose)
+        return output
+
+    async def get(self, remote_path, local_path=None, out_stream=sys.stdout, verbose=False, channels=4,
+                  progress=None):
+        """
+        Copy files from the remote system to the local system.  See RemoteShell.get.
+
+        :returns: the remote files copied
+        :rtype: str
+        """
+        if local_path is None:
+            local_path = remote_path
+        self.display("sftp get '{src}' '{dest}'\n".format(src=remote_path, dest=local_path),
+                     out_stream=out_stream, verbose=verbose)
+        transfer = SFTPTransfer(await self.connect(), channels=channels, progress=progress)
+        output = repr(await self._in_executor(transfer.get, remote_path, local_path))
+        self.display(output + '\n', out_stream=out_stream, verbose=verbose)
+        return output
+
+    def _command_line(self, cmd_args, prefix, postfix):
+        if isinstance(cmd_args, str):
+            cmd_args = [cmd_args]
+        return ' '.join(self.expand_args(cmd_args, prefix=prefix, postfix=postfix))
+
+    def logout(self):
+        """
+        Close the transport.
+        """
+        self.transport_pool.close_all()
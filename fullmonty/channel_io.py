@@ -0,0 +1,192 @@
+# coding=utf-8
+
+"""
+Helpers for running commands on paramiko exec channels, shared by RemoteShell and AsyncRemoteShell.
+
+*ready_chunks* reads the stdout and stderr that has arrived without waiting and *channel_finished* tells when
+to stop waiting for more, so a blocking or an asyncio read loop only differs in how it waits.  LineDecoder turns
+the chunks into complete lines.
+
+A channel's stdout and stderr share one flow control window.  The window is only reopened as the data is read, so
+a command whose stderr is left unread stops once it has written a window's worth (about 2MB), even while it's
+stdout is being read.  StderrDrain reads stderr on a background thread as it arrives, keeping a bounded tail of it.
+
+Usage
+-----
+
+.. code-block:: python
+
+    channel.exec_command(env_command_line('make', {'JOBS': 8}))
+    drain = StderrDrain(channel)
+    for chunk in iter(lambda: channel.recv(32768), b''):
+        ...
+    if channel.recv_exit_status() != 0:
+        raise IOError(drain.text())
+
+"""
+import codecs
+import re
+import threading
+
+try:
+    from shlex import quote
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from pipes import quote
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('StderrDrain', 'LineDecoder', 'CHANNEL_BUFFER_SIZE', 'env_command_line', 'ready_chunks',
+           'channel_finished')
+
+#: the number of bytes to read from a channel at a time
+CHANNEL_BUFFER_SIZE = 32768
+
+
+def env_command_line(command_line, env=None):
+    """
+    :param command_line: the command line
+    :type command_line: str
+    :param env: the environment variables for the command to use
+    :type env: dict
+    :returns: the command line prefixed with the exports of the environment variables
+    :rtype: str
+    """
+    if not env:
+        return command_line
+    return ''.join(['export {key}={value}; '.format(key=key, value=quote(str(value)))
+                    for key, value in env.items()] + [command_line])
+
+
+def ready_chunks(channel, size=CHANNEL_BUFFER_SIZE):
+    """
+    Yield the (is_stderr, bytes) chunks that have arrived on the channel, stdout first, without waiting.
+
+    :param channel: the channel
+    :type channel: paramiko.Channel
+    :param size: the most bytes in a chunk
+    :type size: int
+    """
+    while True:
+        if channel.recv_ready():
+            yield False, channel.recv(size)
+        elif channel.recv_stderr_ready():
+            yield True, channel.recv_stderr(size)
+        else:
+            return
+
+
+def channel_finished(channel):
+    """
+    :param channel: the channel
+    :type channel: paramiko.Channel
+    :returns: True once the command has exited or the channel is closed.  Output that arrived with the exit
+        status may still be ready.
+    :rtype: bool
+    """
+    return channel.exit_status_ready() or channel.closed
+
+
+#: a line ending, a lone '\r' (a progress line) only when more output follows it
+_LINE_END = re.compile(r'(\r\n|\n|\r(?=[^\n]))')
+
+
+class LineDecoder(object):
+    """
+    Incrementally decode utf-8 chunks into complete lines, a multi-byte character or a line may span chunks.
+
+    :param encoding: the encoding of the chunks
+    :type encoding: str
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._partial = ''
+
+    def decode(self, chunk):
+        """
+        :param chunk: the next chunk
+        :type chunk: bytes
+        :returns: the lines completed by the chunk, each with it's line ending
+        :rtype: list[str]
+        """
+        # not str.splitlines, which also splits on form feeds, '\x1c'-'\x1e', '\x85' and '\u2028'.  A trailing '\r'
+        # may be the first half of a '\r\n' split across chunks, so it stays in the partial line.
+        parts = _LINE_END.split(self._partial + self._decoder.decode(chunk))
+        self._partial = parts.pop()
+        return [parts[index] + parts[index + 1] for index in range(0, len(parts), 2)]
+
+    def finish(self):
+        """
+        :returns: the rest of the output, the last line if it has no line ending
+        :rtype: list[str]
+        """
+        self._partial += self._decoder.decode(b'', True)
+        lines = [self._partial] if self._partial else []
+        self._partial = ''
+        return lines
+
+
+class StderrDrain(object):
+    """
+    Read a channel's stderr on a background thread until the channel's stderr is closed.
+
+    :param channel: the channel, the command has been started
+    :type channel: paramiko.Channel
+    :param limit: the bytes of the end of stderr kept
+    :type limit: int
+    :param callback: called with each chunk of stderr as it is read
+    :type callback: callable
+    """
+
+    def __init__(self, channel, limit=65536, callback=None):
+        self.channel = channel
+        self.limit = limit
+        self.callback = callback
+        self.truncated = False
+        """:type truncated: bool"""
+        self._data = b''
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='StderrDrain')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for chunk in iter(lambda: self.channel.recv_stderr(32768), b''):
+                if self.callback is not None:
+                    # noinspection PyBroadException
+                    try:
+                        self.callback(chunk)
+                    except Exception:
+                        pass
+                with self._lock:
+                    self._data += chunk
+                    if len(self._data) > self.limit:
+                        self._data = self._data[-self.limit:]
+                        self.truncated = True
+        except (EOFError, IOError):
+            pass
+
+    def join(self, timeout=None):
+        """
+        Wait for stderr to be closed.
+
+        :param timeout: the most seconds to wait, None waits until it is closed
+        :type timeout: float
+        """
+        self._thread.join(timeout)
+
+    def data(self):
+        """
+        :returns: the end of stderr read so far, up to *limit* bytes
+        :rtype: bytes
+        """
+        with self._lock:
+            return self._data
+
+    def text(self):
+        """
+        :returns: the end of stderr read so far decoded as utf-8
+        :rtype: str
+        """
+        return self.data().decode('utf-8', 'replace').strip()
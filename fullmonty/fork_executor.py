@@ -0,0 +1,228 @@
+# coding=utf-8
+
+"""
+Run python callables in isolated worker processes.
+
+Running python code with *LocalShell.run(['python', '-c', ...])* isolates flaky or leaky code but pays for a full
+interpreter start up on each call.  ForkExecutor instead keeps a forkserver process with the *preload* modules
+already imported and forks a worker from it for each task.  The callable and its arguments are pickled to the worker,
+anything the worker prints to stdout is streamed back while it runs, and the return value is pickled back when done.
+
+Usage
+-----
+
+.. code-block:: python
+
+    with ForkExecutor(preload=['json']) as executor:
+        result = executor.run(my_module.my_function, args=(1, 2), timeout=10, memory_limit=512 * 1024 * 1024)
+        print(result.value)
+        print(result.output)
+
+The callable must be picklable, i.e. a module level function.  Where the *forkserver* start method is not
+available the workers are forked directly from the current process.
+"""
+import multiprocessing
+import sys
+import traceback
+from collections import namedtuple
+from time import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('ForkExecutor', 'ForkResult', 'ForkExecutorError', 'ForkExecutorTimeout')
+
+#: the value returned by the callable and everything it wrote to stdout
+ForkResult = namedtuple('ForkResult', ['value', 'output'])
+
+
+class ForkExecutorError(Exception):
+    """
+    The worker raised an exception or died.  *remote_traceback* is the formatted traceback from the worker if any.
+    """
+    def __init__(self, message, remote_traceback=None):
+        super(ForkExecutorError, self).__init__(message)
+        self.remote_traceback = remote_traceback
+
+
+class ForkExecutorTimeout(ForkExecutorError):
+    """The worker did not finish within the timeout and was killed."""
+    pass
+
+
+class _PipeWriter(object):
+    """stdout replacement in the worker that sends each complete line to the parent"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buf = []
+
+    def write(self, text):
+        """
+        buffer text, sending complete lines
+
+        :param text: the text written to stdout
+        :type text: str
+        """
+        self.buf.append(text)
+        if '\n' in text:
+            self.flush()
+
+    def flush(self):
+        """send any buffered text"""
+        if self.buf:
+            self.conn.send(('output', ''.join(self.buf)))
+            self.buf = []
+
+
+def _worker(conn, func, args, kwargs, memory_limit):
+    """
+    The worker process entry point.  Messages sent to the parent are tuples whose first item is one of
+    'output', 'result', or 'error'.
+    """
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    writer = _PipeWriter(conn)
+    sys.stdout = writer
+    try:
+        try:
+            value = func(*args, **kwargs)
+            writer.flush()
+            conn.send(('result', value))
+        except BaseException as ex:
+            writer.flush()
+            conn.send(('error', '{name}: {ex}'.format(name=type(ex).__name__, ex=str(ex)), traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class ForkExecutor(object):
+    """
+    Runs picklable callables in worker processes forked from a pre-imported forkserver.
+
+    The __enter__() and __exit__() methods provide support for the **with** syntax, the forkserver is stopped on
+    exit.
+
+    :param preload: module names the forkserver imports once so that workers do not have to.
+    :type preload: list[str]
+    :param start_method: the multiprocessing start method, defaults to 'forkserver' when available else 'fork'
+    :type start_method: str
+    :param verbose: if verbose, then echo the worker's output to the out_stream.
+    :type verbose: bool
+    """
+
+    def __init__(self, preload=None, start_method=None, verbose=False):
+        self.preload = list(preload or [])
+        self.verbose = verbose
+        get_context = getattr(multiprocessing, 'get_context', None)
+        if get_context is None:
+            # python2 only supports forking from the current process
+            self.start_method = 'fork'
+            self._context = multiprocessing
+        else:
+            if start_method is None:
+                start_method = 'fork'
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    start_method = 'forkserver'
+            self.start_method = start_method
+            self._context = get_context(start_method)
+        self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def start(self):
+        """
+        Start the forkserver with the preload modules imported.  Called automatically on the first run.
+        """
+        if not self._started:
+            if self.start_method == 'forkserver':
+                from multiprocessing import forkserver
+                if self.preload:
+                    self._context.set_forkserver_preload(self.preload)
+                forkserver.ensure_running()
+            self._started = True
+
+    def close(self):
+        """
+        Stop the forkserver this executor started.  A later run starts it again.  The forkserver is shared by the
+        process, so this also stops it for any other forkserver users.
+        """
+        if self._started:
+            if self.start_method == 'forkserver':
+                from multiprocessing import forkserver
+                # ForkServer has no public stop, _stop is what the standard library's own tests use
+                stop = getattr(getattr(forkserver, '_forkserver', None), '_stop', None)
+                if stop is not None:
+                    stop()
+            self._started = False
+
+    def run(self, func, args=None, kwargs=None, out_stream=sys.stdout, verbose=False, timeout=0, memory_limit=None):
+        """
+        Run the callable in a worker process and wait for it to finish.
+
+        :param func: module level callable to run
+        :type func: callable
+        :param args: positional arguments for the callable
+        :type args: tuple
+        :param kwargs: keyword arguments for the callable
+        :type kwargs: dict
+        :param out_stream: the stream the worker's output is echoed to
+        :type out_stream: file
+        :param verbose: if verbose, then echo the worker's output to the out_stream as it arrives.
+        :type verbose: bool
+        :param timeout: the maximum time in seconds to give the worker, 0 means no limit
+        :type timeout: float
+        :param memory_limit: the maximum address space in bytes of the worker, None means no limit
+        :type memory_limit: int
+        :returns: the callable's return value and its output
+        :rtype: ForkResult
+        :raises ForkExecutorTimeout: if the timeout expires
+        :raises ForkExecutorError: if the callable raises an exception or the worker dies
+        """
+        self.start()
+        parent_conn, child_conn = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_worker,
+                                        args=(child_conn, func, tuple(args or ()), dict(kwargs or {}), memory_limit))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+
+        deadline = time() + timeout if timeout else None
+        output = []
+        try:
+            while True:
+                wait = None
+                if deadline is not None:
+                    wait = deadline - time()
+                    if wait <= 0:
+                        raise ForkExecutorTimeout("worker timed out after {timeout} seconds".format(timeout=timeout))
+                if not parent_conn.poll(wait):
+                    continue
+                try:
+                    message = parent_conn.recv()
+                except EOFError:
+                    process.join()
+                    raise ForkExecutorError("worker exited with code {code}".format(code=process.exitcode))
+                if message[0] == 'output':
+                    if self.verbose or verbose:
+                        out_stream.write(message[1])
+                        out_stream.flush()
+                    output.append(message[1])
+                elif message[0] == 'result':
+                    return ForkResult(message[1], ''.join(output))
+                else:
+                    raise ForkExecutorError(message[1], remote_traceback=message[2])
+        finally:
+            parent_conn.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -0,0 +1,311 @@
+# coding=utf-8
+
+"""
+The *fullmonty* console script, a parallel command runner in the style of GNU parallel.
+
+Usage::
+
+    ➤ cat commands.txt | fullmonty -j 4 --joblog jobs.log
+    ➤ find . -name '*.log' | fullmonty -j 8 gzip {}
+    ➤ fullmonty -j 2 echo ::: a b c
+    ➤ fullmonty -j 8 --joblog jobs.log --resume -a files.txt md5sum
+
+Each input line is a job.  When no command is given, the line is the command to run.  Otherwise the line is an
+argument that replaces each "{}" in the command, or is appended to the command when it has no "{}".  The inputs
+are the arguments after ":::", else the lines of the --arg-file files, else the lines of stdin.  Each job is ran
+with "/bin/sh -c" by a LocalShell.
+
+Output is grouped by default, i.e. a job's output is written when the job completes.  --line-buffer interleaves
+complete lines from the running jobs as they are produced and --ungroup writes output as soon as it is read.
+
+The joblog is a tab separated file with a header line then one line per completed job:
+Seq, Starttime, JobRuntime, Exitval, Command.  --resume skips the jobs already in the joblog, --resume-failed
+only skips the jobs that succeeded.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+from collections import namedtuple
+from time import time
+
+try:
+    # noinspection PyCompatibility
+    from queue import Queue, Empty
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from Queue import Queue, Empty
+
+try:
+    from shlex import quote
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from pipes import quote
+
+from .application_settings import ApplicationSettings
+from .local_shell import LocalShell
+from .simple_logger import error
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('main', 'Job', 'ParallelRunner', 'build_jobs', 'read_joblog')
+
+#: the argument separator for giving the inputs on the command line
+ARGS_SEPARATOR = ':::'
+
+#: the replacement string for the input in the command
+REPLACEMENT = '{}'
+
+JOBLOG_HEADER = 'Seq\tStarttime\tJobRuntime\tExitval\tCommand\n'
+
+#: a job's sequence number (1 based order in the inputs) and command line
+Job = namedtuple('Job', ['seq', 'command'])
+
+
+def build_jobs(command_args, inputs):
+    """
+    Build the jobs from the command and the inputs.
+
+    :param command_args: the command and it's arguments, may be empty
+    :type command_args: list[str]
+    :param inputs: the input lines
+    :type inputs: list[str]
+    :returns: the jobs
+    :rtype: list[Job]
+    """
+    command = ' '.join(command_args)
+    jobs = []
+    for index, line in enumerate(inputs):
+        if not command:
+            job_command = line
+        elif REPLACEMENT in command:
+            job_command = command.replace(REPLACEMENT, quote(line))
+        else:
+            job_command = '{command} {arg}'.format(command=command, arg=quote(line))
+        jobs.append(Job(index + 1, job_command))
+    return jobs
+
+
+def read_joblog(filename):
+    """
+    Read the exit values of the completed jobs from a joblog.
+
+    :param filename: the joblog file
+    :type filename: str
+    :returns: exit value by job sequence number
+    :rtype: dict[int, int]
+    """
+    completed = {}
+    if os.path.isfile(filename):
+        with open(filename) as joblog:
+            for line in joblog:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) >= 4 and fields[0].isdigit():
+                    completed[int(fields[0])] = int(fields[3])
+    return completed
+
+
+class ParallelRunner(object):
+    """
+    Run jobs concurrently, each with a LocalShell.
+
+    :param jobs: the number of jobs to run at the same time
+    :type jobs: int
+    :param output_mode: 'group', 'line-buffer', or 'ungroup'
+    :type output_mode: str
+    :param joblog: file name of the joblog or None
+    :type joblog: str
+    :param resume: asserted to append to an existing joblog instead of overwriting it
+    :type resume: bool
+    :param out_stream: the stream the job output is written to
+    :type out_stream: file
+    """
+
+    def __init__(self, jobs=1, output_mode='group', joblog=None, resume=False, out_stream=sys.stdout):
+        self.jobs = max(1, jobs)
+        self.output_mode = output_mode
+        self.joblog = joblog
+        self.resume = resume
+        self.out_stream = out_stream
+        self._output_lock = threading.Lock()
+        self._joblog_lock = threading.Lock()
+        self._joblog_stream = None
+
+    def run(self, jobs):
+        """
+        Run the jobs and wait for them to complete.
+
+        :param jobs: the jobs to run
+        :type jobs: list[Job]
+        :returns: exit value by job sequence number
+        :rtype: dict[int, int]
+        """
+        queue = Queue()
+        for job in jobs:
+            queue.put(job)
+        results = {}
+
+        if self.joblog:
+            append = self.resume and os.path.isfile(self.joblog)
+            self._joblog_stream = open(self.joblog, 'a' if append else 'w')
+            if not append:
+                self._joblog_stream.write(JOBLOG_HEADER)
+                self._joblog_stream.flush()
+
+        # noinspection PyDocstring
+        def worker():
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except Empty:
+                    return
+                results[job.seq] = self._run_job(job)
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.jobs, len(jobs)))]
+        try:
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+        finally:
+            if self._joblog_stream is not None:
+                self._joblog_stream.close()
+                self._joblog_stream = None
+        return results
+
+    def _run_job(self, job):
+        """
+        Run the job, writing it's output and joblog entry.
+
+        :param job: the job to run
+        :type job: Job
+        :returns: the job's exit value
+        :rtype: int
+        """
+        shell = LocalShell()
+        start_time = time()
+        output = []
+        partial = ''
+        for chunk in shell.run_process(['/bin/sh', '-c', job.command], verbose=False, use_signals=False):
+            if self.output_mode == 'ungroup':
+                self._write(chunk)
+            elif self.output_mode == 'line-buffer':
+                partial += chunk
+                if '\n' in partial:
+                    lines, partial = partial.rsplit('\n', 1)
+                    self._write(lines + '\n')
+            else:
+                output.append(chunk)
+        output.append(partial)
+        self._write(''.join(output))
+        exit_value = shell.exit_status
+        if exit_value is None:
+            exit_value = -1
+
+        if self._joblog_stream is not None:
+            with self._joblog_lock:
+                self._joblog_stream.write('{seq}\t{start:.3f}\t{runtime:.3f}\t{exit}\t{command}\n'.format(
+                    seq=job.seq, start=start_time, runtime=time() - start_time, exit=exit_value,
+                    command=job.command.replace('\n', ' ')))
+                self._joblog_stream.flush()
+        return exit_value
+
+    def _write(self, text):
+        if text:
+            with self._output_lock:
+                self.out_stream.write(text)
+                self.out_stream.flush()
+
+
+class ParallelSettings(ApplicationSettings):
+    """The command line settings for the fullmonty console script"""
+
+    HELP = {
+        'fullmonty': 'Run commands in parallel.\n\n'
+                     'Each input line is either a command or an argument for the given command.',
+        'jobs': 'The number of jobs to run at the same time.  (default: %(default)s)',
+        'arg_files': 'Read the input lines from the file instead of stdin.  May be given more than once.',
+        'line_buffer': "Interleave complete lines of the running jobs' output.",
+        'ungroup': "Write the running jobs' output as soon as it is read.",
+        'joblog': 'Log the sequence number, start time, run time, exit value, and command of each job to the file.',
+        'resume': 'Skip the jobs already in the joblog.',
+        'resume_failed': 'Skip the jobs that succeeded in the joblog.',
+        'command': 'The command to run for each input line, "{}" is replaced by the input.  '
+                   'Inputs may be given after ":::".',
+    }
+
+    def __init__(self):
+        super(ParallelSettings, self).__init__('fullmonty', 'fullmonty', ['fullmonty'], self.HELP)
+
+    def _cli_options(self, parser, defaults):
+        super(ParallelSettings, self)._cli_options(parser, defaults)
+        parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                            help=self._help['jobs'])
+        parser.add_argument('-a', '--arg-file', dest='arg_files', metavar='FILE', action='append', default=[],
+                            help=self._help['arg_files'])
+        parser.add_argument('--line-buffer', dest='line_buffer', action='store_true',
+                            help=self._help['line_buffer'])
+        parser.add_argument('-u', '--ungroup', dest='ungroup', action='store_true', help=self._help['ungroup'])
+        parser.add_argument('--joblog', metavar='FILE', help=self._help['joblog'])
+        parser.add_argument('--resume', action='store_true', help=self._help['resume'])
+        parser.add_argument('--resume-failed', dest='resume_failed', action='store_true',
+                            help=self._help['resume_failed'])
+        parser.add_argument('command', nargs=argparse.REMAINDER, help=self._help['command'])
+
+    def _cli_validate(self, settings, remaining_argv):
+        if (settings.resume or settings.resume_failed) and not settings.joblog:
+            return '--resume and --resume-failed require --joblog'
+        return None
+
+
+def _read_inputs(settings):
+    """
+    :returns: the command and the input lines
+    :rtype: tuple(list[str], list[str])
+    """
+    command = list(settings.command)
+    if ARGS_SEPARATOR in command:
+        index = command.index(ARGS_SEPARATOR)
+        return command[:index], command[index + 1:]
+    if settings.arg_files:
+        lines = []
+        for arg_file in settings.arg_files:
+            with open(arg_file) as in_file:
+                lines.extend(in_file.read().splitlines())
+    else:
+        lines = sys.stdin.read().splitlines()
+    return command, [line for line in lines if line.strip()]
+
+
+def main():
+    """
+    The fullmonty console script entry point.
+
+    :returns: 0 if all of the jobs succeeded, else 1
+    :rtype: int
+    """
+    with ParallelSettings() as settings:
+        command, inputs = _read_inputs(settings)
+        jobs = build_jobs(command, inputs)
+
+        if settings.resume or settings.resume_failed:
+            completed = read_joblog(settings.joblog)
+            jobs = [job for job in jobs
+                    if job.seq not in completed or (settings.resume_failed and completed[job.seq] != 0)]
+
+        output_mode = 'group'
+        if settings.line_buffer:
+            output_mode = 'line-buffer'
+        if settings.ungroup:
+            output_mode = 'ungroup'
+
+        runner = ParallelRunner(jobs=settings.jobs, output_mode=output_mode, joblog=settings.joblog,
+                                resume=settings.resume or settings.resume_failed)
+        try:
+            results = runner.run(jobs)
+        except KeyboardInterrupt:
+            error('interrupted')
+            return 1
+        return 0 if all(exit_value == 0 for exit_value in results.values()) else 1
@@ -0,0 +1,221 @@
+# coding=utf-8
+
+"""
+Cached facts about remote hosts.
+
+The environment, OS, CPU count, memory and disk usage of a host are gathered with one batched remote command then
+cached per host for *ttl* seconds, so host introspection does not cost a round trip each time.  The cache can be
+invalidated explicitly and optionally persisted to a JSON file so the facts survive across sessions.
+
+Usage
+-----
+
+.. code-block:: python
+
+    cache = HostFactsCache(ttl=3600, path='~/.remote_shell_facts')
+    with RemoteShell(host, facts_cache=cache) as remote:
+        facts = remote.facts()
+        print(facts.cpu_count, facts.os['ID'], facts.memory['MemTotal'])
+        remote.facts(refresh=True)
+
+"""
+import json
+import os
+import re
+import threading
+from time import time
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('HostFacts', 'HostFactsCache', 'FACTS_COMMAND')
+
+SECTION_MARKER = '--fullmonty-facts-'
+
+#: the sections gathered and the shell commands that gather them
+FACTS_SECTIONS = [
+    ('env', 'env'),
+    ('uname', 'uname -a'),
+    ('os', 'cat /etc/os-release 2>/dev/null'),
+    ('nproc', 'nproc 2>/dev/null || getconf _NPROCESSORS_ONLN'),
+    ('meminfo', 'cat /proc/meminfo 2>/dev/null'),
+    ('df', 'df -Pk 2>/dev/null'),
+    ('loadavg', 'cat /proc/loadavg 2>/dev/null || uptime'),
+]
+
+#: the one remote command that gathers all of the facts
+FACTS_COMMAND = '; '.join("echo '{marker}{name}'; {command}".format(marker=SECTION_MARKER, name=name, command=command)
+                          for name, command in FACTS_SECTIONS)
+
+
+class HostFacts(object):
+    """
+    Facts about a host.
+
+    * env - the environment variables
+    * uname - the *uname -a* output
+    * os - the /etc/os-release values (ID, VERSION_ID, PRETTY_NAME,...)
+    * cpu_count - the number of online processors
+    * memory - the /proc/meminfo values in bytes (MemTotal, MemAvailable,...)
+    * disk - mount point => {'size': bytes, 'used': bytes, 'available': bytes}
+    * load_average - the 1, 5 and 15 minute load averages when gathered
+    * gathered_at - when the facts were gathered (seconds since the epoch)
+    """
+
+    def __init__(self, env=None, uname='', os_release=None, cpu_count=None, memory=None, disk=None,
+                 load_average=None, gathered_at=None):
+        self.env = env or {}
+        """:type env: dict[str, str]"""
+        self.uname = uname
+        """:type uname: str"""
+        self.os = os_release or {}
+        """:type os: dict[str, str]"""
+        self.cpu_count = cpu_count
+        """:type cpu_count: int"""
+        self.memory = memory or {}
+        """:type memory: dict[str, int]"""
+        self.disk = disk or {}
+        """:type disk: dict[str, dict[str, int]]"""
+        self.load_average = tuple(load_average) if load_average else None
+        """:type load_average: tuple(float, float, float)"""
+        self.gathered_at = time() if gathered_at is None else gathered_at
+        """:type gathered_at: float"""
+
+    @classmethod
+    def parse(cls, output):
+        """
+        Parse the output of FACTS_COMMAND.
+
+        :param output: the output of FACTS_COMMAND
+        :type output: str
+        :rtype: HostFacts
+        """
+        sections = {}
+        name = None
+        for line in output.splitlines():
+            if line.startswith(SECTION_MARKER):
+                name = line[len(SECTION_MARKER):].strip()
+                sections[name] = []
+            elif name is not None:
+                sections[name].append(line)
+
+        env = {}
+        for line in sections.get('env', []):
+            match = re.match(r'([^=]+)=(.*)', line)
+            if match:
+                env[match.group(1).strip()] = match.group(2).strip()
+
+        os_release = {}
+        for line in sections.get('os', []):
+            match = re.match(r'(\w+)=(.*)', line)
+            if match:
+                os_release[match.group(1)] = match.group(2).strip().strip('"\'')
+
+        cpu_count = None
+        for line in sections.get('nproc', []):
+            if line.strip().isdigit():
+                cpu_count = int(line.strip())
+
+        memory = {}
+        for line in sections.get('meminfo', []):
+            match = re.match(r'(\S+):\s+(\d+)(\s+kB)?', line)
+            if match:
+                memory[match.group(1)] = int(match.group(2)) * (1024 if match.group(3) else 1)
+
+        disk = {}
+        for line in sections.get('df', [])[1:]:
+            fields = line.split()
+            if len(fields) >= 6 and fields[1].isdigit():
+                disk[' '.join(fields[5:])] = {'size': int(fields[1]) * 1024,
+                                              'used': int(fields[2]) * 1024,
+                                              'available': int(fields[3]) * 1024}
+
+        load_average = None
+        for line in sections.get('loadavg', []):
+            # /proc/loadavg starts with them, uptime ends with them
+            match = re.search(r'(\d+[.,]\d+),?\s+(\d+[.,]\d+),?\s+(\d+[.,]\d+)', line)
+            if match:
+                load_average = tuple(float(value.replace(',', '.')) for value in match.groups())
+
+        return cls(env=env, uname='\n'.join(sections.get('uname', [])).strip(), os_release=os_release,
+                   cpu_count=cpu_count, memory=memory, disk=disk, load_average=load_average)
+
+    def to_dict(self):
+        """:returns: the facts as a JSON serializable dictionary"""
+        return {'env': self.env, 'uname': self.uname, 'os': self.os, 'cpu_count': self.cpu_count,
+                'memory': self.memory, 'disk': self.disk, 'load_average': self.load_average,
+                'gathered_at': self.gathered_at}
+
+    @classmethod
+    def from_dict(cls, value):
+        """
+        :param value: a dictionary created by to_dict()
+        :type value: dict
+        :rtype: HostFacts
+        """
+        return cls(env=value.get('env'), uname=value.get('uname', ''), os_release=value.get('os'),
+                   cpu_count=value.get('cpu_count'), memory=value.get('memory'), disk=value.get('disk'),
+                   load_average=value.get('load_average'), gathered_at=value.get('gathered_at', 0))
+
+
+class HostFactsCache(object):
+    """
+    Thread safe cache of HostFacts by host key.
+
+    :param ttl: seconds the facts are valid for, 0 means forever
+    :type ttl: float
+    :param path: JSON file to persist the facts to or None to only cache in memory
+    :type path: str
+    """
+
+    def __init__(self, ttl=300, path=None):
+        self.ttl = ttl
+        self.path = os.path.expanduser(path) if path else None
+        self._facts = {}
+        self._lock = threading.Lock()
+        if self.path and os.path.isfile(self.path):
+            # noinspection PyBroadException
+            try:
+                with open(self.path) as in_file:
+                    self._facts = dict((key, HostFacts.from_dict(value))
+                                       for key, value in json.load(in_file).items())
+            except Exception:
+                self._facts = {}
+
+    def get(self, key, gather):
+        """
+        Get the fresh facts for the host, gathering them if not cached or expired.
+
+        :param key: the host key, usually "user@host:port"
+        :type key: str
+        :param gather: called to gather the facts, returns HostFacts
+        :type gather: callable
+        :rtype: HostFacts
+        """
+        with self._lock:
+            facts = self._facts.get(key)
+        if facts is not None and (not self.ttl or time() - facts.gathered_at < self.ttl):
+            return facts
+        facts = gather()
+        with self._lock:
+            self._facts[key] = facts
+            self._save()
+        return facts
+
+    def invalidate(self, key=None):
+        """
+        Forget the facts for the host or for all hosts.
+
+        :param key: the host key or None for all hosts
+        :type key: str
+        """
+        with self._lock:
+            if key is None:
+                self._facts = {}
+            else:
+                self._facts.pop(key, None)
+            self._save()
+
+    def _save(self):
+        if self.path:
+            # the environment may hold secrets so only the user may read the file
+            with os.fdopen(os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as out_file:
+                json.dump(dict((key, facts.to_dict()) for key, facts in self._facts.items()), out_file)
@@ -0,0 +1,241 @@
+# coding=utf-8
+
+"""
+Distribute a queue of commands over a pool of remote hosts.
+
+Each host has a number of slots, the commands it may run at the same time, defaulting to it's CPU count from the
+remote facts.  A command is dispatched to the least loaded host with a free slot, the load being the host's
+commands in flight plus it's load average when the pool was connected, per slot.  When a host dies (it's
+connection fails) it is dropped from the pool and it's commands are retried on the other hosts.  A command that
+exits with a non-zero status is not retried, nor is a command killed by a signal, which has the exit status -1
+when the ssh server reports the signal instead of an exit status.
+
+Usage
+-----
+
+.. code-block:: python
+
+    with HostScheduler(['build1', 'build2', 'build3'], user='ci', max_retries=2) as scheduler:
+        results = scheduler.run(['make -C /src/{0}'.format(name) for name in modules])
+        scheduler.report()
+
+"""
+import sys
+import threading
+from collections import deque, namedtuple
+from time import time
+
+from fullmonty.remote_shell import RemoteShell
+from fullmonty.remote_shell_group import parse_host
+from fullmonty.thread_map import thread_map
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('HostScheduler', 'HostStats', 'JobResult')
+
+#: the result of a command, host is the host it last ran on, error is the last host failure if it never completed
+JobResult = namedtuple('JobResult', ['command', 'host', 'stdout', 'stderr', 'exit_status', 'attempts', 'error',
+                                     'runtime'])
+
+
+class HostStats(object):
+    """
+    The load and throughput of a host in the pool.
+    """
+
+    def __init__(self, host, slots, base_load=0.0):
+        self.host = host
+        """:type host: str"""
+        self.slots = slots
+        """:type slots: int"""
+        self.base_load = base_load
+        """:type base_load: float"""
+        self.in_flight = 0
+        """:type in_flight: int"""
+        self.completed = 0
+        """:type completed: int"""
+        self.failed = 0
+        """:type failed: int"""
+        self.busy_time = 0.0
+        """:type busy_time: float"""
+        self.alive = True
+        """:type alive: bool"""
+        self.start_time = time()
+        """:type start_time: float"""
+
+    @property
+    def load(self):
+        """the commands in flight plus the external load per slot"""
+        return (self.in_flight + self.base_load) / self.slots
+
+    @property
+    def throughput(self):
+        """commands completed per second since the host joined the pool"""
+        elapsed = time() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self.completed / elapsed
+
+
+class HostScheduler(object):
+    """
+    A pool of RemoteShells that commands are dispatched to.  The hosts are connected in parallel when the
+    scheduler is created; the hosts that fail to connect are in *failures*.
+
+    :param hosts: the host specifications, "host", "host:port", "user@host" or "user@host:port"
+    :type hosts: list[str]
+    :param slots: the commands each host may run at the same time, either one number for all hosts or a
+        dictionary by host.  A host without slots uses it's CPU count.
+    :type slots: int or dict[str, int]
+    :param max_retries: the number of times a command is retried on another host when it's host dies
+    :type max_retries: int
+    :param use_load_average: asserted to count each host's load average in it's load, the facts are then
+        gathered afresh instead of from the facts cache
+    :type use_load_average: bool
+    :param timeout: the seconds a command may run, None waits forever.  On timeout the exit status is -1.
+    :type timeout: float
+    :param kwargs: the other RemoteShell arguments (user, password, port, connect_timeout,...)
+    """
+
+    def __init__(self, hosts, slots=None, max_retries=2, use_load_average=True, timeout=None, **kwargs):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        kwargs.setdefault('connect_timeout', 10)
+        kwargs['lazy'] = True
+        kwargs['use_channels'] = True
+        self.shells = {}
+        """:type shells: dict[str, RemoteShell]"""
+        for spec in hosts:
+            user, host, port = parse_host(spec)
+            shell_kwargs = dict(kwargs)
+            if user is not None:
+                shell_kwargs['user'] = user
+            if port is not None:
+                shell_kwargs['port'] = port
+            self.shells[spec] = RemoteShell(host, **shell_kwargs)
+
+        self.stats = {}
+        """:type stats: dict[str, HostStats]"""
+        self.failures = {}
+        """:type failures: dict[str, Exception]"""
+        hosts = list(self.shells.keys())
+        # the cached facts may be minutes old, too old for the load average
+        all_facts = thread_map(lambda name: self.shells[name].facts(refresh=use_load_average), hosts,
+                               max_workers=len(hosts) or 1, return_exceptions=True)
+        for host, facts in zip(hosts, all_facts):
+            if isinstance(facts, Exception):
+                self.failures[host] = facts
+                self.shells.pop(host).logout()
+                continue
+            host_slots = slots.get(host) if isinstance(slots, dict) else slots
+            base_load = facts.load_average[0] if use_load_average and facts.load_average else 0.0
+            self.stats[host] = HostStats(host, max(1, host_slots or facts.cpu_count or 1), base_load)
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        """Log out of all of the hosts."""
+        for shell in self.shells.values():
+            # noinspection PyBroadException
+            try:
+                shell.logout()
+            except Exception:
+                pass
+
+    def _least_loaded(self):
+        """:returns: the stats of the least loaded live host with a free slot or None"""
+        free = [stats for stats in self.stats.values() if stats.alive and stats.in_flight < stats.slots]
+        if not free:
+            return None
+        return min(free, key=lambda stats: (stats.load, stats.in_flight))
+
+    def run(self, commands):
+        """
+        Run the commands on the hosts and wait for all of them to complete.
+
+        :param commands: the commands, each a list of command arguments or a str command line
+        :type commands: list
+        :returns: the result of each command in the same order as the commands
+        :rtype: list[JobResult]
+        """
+        pending = deque((index, command, 0, None) for index, command in enumerate(commands))
+        results = [None] * len(pending)
+        threads = []
+        with self._condition:
+            while pending or any(stats.in_flight for stats in self.stats.values()):
+                if pending and not any(stats.alive for stats in self.stats.values()):
+                    # no hosts are left to run the commands on
+                    for index, command, attempts, error in pending:
+                        if error is None:
+                            error = IOError("no live hosts left to run the command on")
+                        results[index] = JobResult(command, None, '', '', None, attempts, error, 0.0)
+                    pending.clear()
+                    continue
+                stats = self._least_loaded() if pending else None
+                if stats is None:
+                    self._condition.wait()
+                    continue
+                index, command, attempts, error = pending.popleft()
+                stats.in_flight += 1
+                thread = threading.Thread(target=self._execute,
+                                          args=(stats, index, command, attempts + 1, pending, results))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _execute(self, stats, index, command, attempts, pending, results):
+        """run the command on the host then record it's result or requeue it if the host died"""
+        start = time()
+        shell = self.shells[stats.host]
+        try:
+            result = shell.exec_command(command, timeout=self.timeout)
+            if result.exit_status == -1:
+                # the channel closed without an exit status, because the command was killed by a signal, timed
+                # out, or the connection was lost.  The server closes it's channels before dropping the
+                # connection, so the connection is probed instead of checked.
+                shell.transport().open_session(timeout=shell.probe_timeout).close()
+        except Exception as ex:
+            with self._condition:
+                stats.in_flight -= 1
+                stats.failed += 1
+                stats.alive = False
+                if attempts <= self.max_retries:
+                    pending.appendleft((index, command, attempts, ex))
+                else:
+                    results[index] = JobResult(command, stats.host, '', '', None, attempts, ex, time() - start)
+                self._condition.notify_all()
+            return
+        runtime = time() - start
+        with self._condition:
+            stats.in_flight -= 1
+            stats.completed += 1
+            stats.busy_time += runtime
+            results[index] = JobResult(command, stats.host, result.stdout, result.stderr, result.exit_status,
+                                       attempts, None, runtime)
+            self._condition.notify_all()
+
+    def report(self, out_stream=sys.stdout):
+        """
+        Write the per host throughput.
+
+        :param out_stream: the output stream
+        :type out_stream: file
+        """
+        out_stream.write("{host:<30} {slots:>5} {completed:>9} {failed:>6} {busy:>9} {rate:>10}\n".format(
+            host='host', slots='slots', completed='completed', failed='failed', busy='busy (s)', rate='jobs/s'))
+        for host in sorted(self.stats):
+            stats = self.stats[host]
+            out_stream.write("{host:<30} {slots:>5} {completed:>9} {failed:>6} {busy:>9.1f} {rate:>10.2f}{dead}\n"
+                             .format(host=host, slots=stats.slots, completed=stats.completed, failed=stats.failed,
+                                     busy=stats.busy_time, rate=stats.throughput,
+                                     dead='' if stats.alive else '  (dead)'))
+        for host in sorted(self.failures):
+            out_stream.write("{host:<30} failed to connect: {error}\n".format(host=host, error=self.failures[host]))
@@ -15,8 +15,10 @@ command given to the methods.  Postfix is a string appended to the command.  For
 would execute: "MY_ENV=$HOME/my_stuff my_executable my_arg"
 
 """
+import codecs
 import signal
 import os
+import select
 import fcntl
 import sys
 import pexpect
@@ -73,6 +75,8 @@ class LocalShell(AShell):
         self.logfile = logfile
         self.prefix = prefix
         self.postfix = postfix
+        self.exit_status = None
+        """:type exit_status: int"""
 
     # noinspection PyMethodMayBeStatic
     def env(self):
@@ -237,7 +241,8 @@ class LocalShell(AShell):
                     timeout=0, timeout_interval=1, raise_on_interrupt=False,
                     use_signals=True):
         """
-        Run the process yield for each output line from the process.
+        Run the process yield for each output line from the process.  When the process completes, it's return code
+        is saved in *exit_status*.
 
         :param out_stream:
         :param cmd_args: command line components
@@ -276,11 +281,13 @@ class LocalShell(AShell):
             process = subprocess.Popen(cmd_args,
                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
                                        env=sub_env, preexec_fn=preexec_function)
+            # a read may end in the middle of a multibyte character
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
             while process.poll() is None:  # returns None while subprocess is running
                 if interrupt_handler is not None and interrupt_handler.interrupted:
                     process.kill()
                 while True:
-                    line = self._non_block_read(process.stdout)
+                    line = self._non_block_read(process.stdout, decoder)
                     if not line:
                         break
                     yield line
@@ -290,10 +297,14 @@ class LocalShell(AShell):
                         timeout_seconds -= timeout_interval
                     else:
                         process.kill()
+                else:
+                    # wait for more output instead of spinning
+                    select.select([process.stdout], [], [], timeout_interval)
 
-            line = self._non_block_read(process.stdout)
+            line = self._non_block_read(process.stdout, decoder) + decoder.decode(b'', True)
             if line:
                 yield line
+            self.exit_status = process.returncode
             if interrupt_handler is not None and interrupt_handler.interrupted and raise_on_interrupt:
                 raise KeyboardInterrupt()
 
@@ -302,19 +313,30 @@ class LocalShell(AShell):
                 interrupt_handler.release()
 
     # noinspection PyMethodMayBeStatic
-    def _non_block_read(self, output):
+    def _non_block_read(self, output, decoder=None):
         fd = output.fileno()
         fl = fcntl.fcntl(fd, fcntl.F_GETFL)
         fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
         # noinspection PyBroadException
         try:
-            return output.read().decode()
+            data = output.read()
+            if not data:
+                return ''
+            if decoder is not None:
+                return decoder.decode(data)
+            return data.decode()
         except:
             return ''
 
     def _system(self, command_line):
         return os.popen(command_line).read()
 
+    def _pipe(self, command_line, input_text):
+        process = subprocess.Popen(command_line, shell=True,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate(input_text.encode('utf-8'))[0]
+        return output.decode('utf-8', 'replace')
+
 
 run = LocalShell().run
 system = LocalShell().system
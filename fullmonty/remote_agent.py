@@ -0,0 +1,310 @@
+# coding=utf-8
+
+"""
+A persistent Python agent on the remote host.
+
+The agent is a small Python stub that is sent to the remote interpreter over an exec channel and then serves
+requests on the channel until it is closed.  A remote stat, hash, listdir, read or function call then costs one
+round trip instead of starting an interpreter and scraping it's output.
+
+The requests and replies are JSON messages, each framed by it's length as a 4 byte big-endian integer.  File
+contents are base64 encoded.  Anything printed by a called function goes to the agent's stderr instead of the
+replies.  The stderr is read on a background thread as it arrives, only the last 64KB is kept for the error raised
+when the agent exits, so a chatty function neither stalls the channel nor fills the memory.
+
+The remote host needs python (2.6+ or 3) on the PATH.
+
+Usage
+-----
+
+.. code-block:: python
+
+    with RemoteAgent(remote.transport()) as agent:
+        for name, stat in agent.listdir_stat('/etc'):
+            print(name, stat.st_size, agent.hash(posixpath.join('/etc', name)))
+        print(agent.call('platform.python_version'))
+
+"""
+import base64
+import json
+import struct
+import threading
+from collections import namedtuple
+
+from fullmonty.channel_io import StderrDrain
+
+try:
+    from shlex import quote
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from pipes import quote
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('RemoteAgent', 'RemoteAgentError', 'RemoteStat', 'AGENT_SOURCE')
+
+#: the remote file status, the fields are the first ten fields of os.stat_result
+RemoteStat = namedtuple('RemoteStat', ['st_mode', 'st_ino', 'st_dev', 'st_nlink', 'st_uid', 'st_gid', 'st_size',
+                                       'st_atime', 'st_mtime', 'st_ctime'])
+
+#: the agent ran on the remote host
+AGENT_SOURCE = r'''
+import base64
+import hashlib
+import json
+import os
+import struct
+import sys
+
+requests = getattr(sys.stdin, 'buffer', sys.stdin)
+replies = getattr(sys.stdout, 'buffer', sys.stdout)
+sys.stdout = sys.stderr
+
+
+def read_exact(count):
+    data = b''
+    while len(data) < count:
+        chunk = requests.read(count - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def stat_list(value):
+    return [value.st_mode, value.st_ino, value.st_dev, value.st_nlink, value.st_uid, value.st_gid, value.st_size,
+            value.st_atime, value.st_mtime, value.st_ctime]
+
+
+def op_stat(path):
+    return stat_list(os.stat(path))
+
+
+def op_lstat(path):
+    return stat_list(os.lstat(path))
+
+
+def op_listdir(path):
+    return sorted(os.listdir(path))
+
+
+def op_listdir_stat(path):
+    return [[name, stat_list(os.lstat(os.path.join(path, name)))] for name in sorted(os.listdir(path))]
+
+
+def op_hash(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as in_file:
+        for block in iter(lambda: in_file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def op_read(path, offset, size):
+    with open(path, 'rb') as in_file:
+        in_file.seek(offset)
+        return base64.b64encode(in_file.read(size)).decode('ascii')
+
+
+def op_call(name, args, kwargs):
+    module_name, function_name = name.rsplit('.', 1)
+    module = __import__(module_name, fromlist=[function_name])
+    return getattr(module, function_name)(*args, **kwargs)
+
+
+OPS = {'stat': op_stat, 'lstat': op_lstat, 'listdir': op_listdir, 'listdir_stat': op_listdir_stat,
+       'hash': op_hash, 'read': op_read, 'call': op_call}
+
+while True:
+    header = read_exact(4)
+    if header is None:
+        break
+    request = json.loads(read_exact(struct.unpack('>I', header)[0]).decode('utf-8'))
+    try:
+        reply = json.dumps({'result': OPS[request['op']](*request['args'])})
+    except Exception as ex:
+        reply = json.dumps({'error': type(ex).__name__, 'message': str(ex), 'errno': getattr(ex, 'errno', None),
+                            'strerror': getattr(ex, 'strerror', None), 'filename': getattr(ex, 'filename', None)})
+    reply = reply.encode('utf-8')
+    replies.write(struct.pack('>I', len(reply)) + reply)
+    replies.flush()
+'''
+
+#: reads the agent's source from stdin then runs it
+BOOTSTRAP = "import sys; exec(getattr(sys.stdin, 'buffer', sys.stdin).read({size}))"
+
+
+class RemoteAgentError(Exception):
+    """
+    An error raised by the agent, or the agent exiting.
+
+    :param message: the error message
+    :type message: str
+    :param remote_type: the name of the remote exception's type
+    :type remote_type: str
+    """
+
+    def __init__(self, message, remote_type=None):
+        super(RemoteAgentError, self).__init__(message)
+        self.remote_type = remote_type
+
+
+class RemoteAgent(object):
+    """
+    A Python agent ran on an exec channel of the transport.  The agent is started on first use.
+
+    Requests are serialized, so an agent may be shared by threads but serves one request at a time.  Remote
+    OSErrors are raised locally as OSErrors with the same errno, other remote exceptions as RemoteAgentError.
+
+    :param transport: an authenticated transport
+    :type transport: paramiko.Transport
+    :param python: the remote python interpreter, defaults to python3 falling back to python
+    :type python: str
+    """
+
+    def __init__(self, transport, python=None):
+        self.transport = transport
+        self.python = python
+        self._channel = None
+        self._replies = None
+        self._stderr = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    @property
+    def running(self):
+        """True if the agent has been started and has not exited"""
+        return self._channel is not None and not self._channel.closed and not self._channel.exit_status_ready()
+
+    def start(self):
+        """Start the agent if it is not running."""
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self.running:
+            return
+        self._close()
+        python = quote(self.python) if self.python else '"$(command -v python3 || command -v python)"'
+        source = AGENT_SOURCE.encode('utf-8')
+        channel = self.transport.open_session()
+        channel.exec_command('{python} -c {bootstrap}'.format(python=python,
+                                                             bootstrap=quote(BOOTSTRAP.format(size=len(source)))))
+        # stdout and stderr share the channel's window, unread stderr would stop the replies
+        self._stderr = StderrDrain(channel)
+        channel.sendall(source)
+        self._channel = channel
+        self._replies = channel.makefile('rb')
+
+    def close(self):
+        """Stop the agent."""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._channel is not None:
+            # the agent exits at the end of it's requests
+            try:
+                self._channel.shutdown_write()
+            except (EOFError, IOError):
+                pass
+            self._channel.close()
+            self._channel = None
+            self._replies = None
+            self._stderr = None
+
+    def _request(self, op, *args):
+        request = json.dumps({'op': op, 'args': args}).encode('utf-8')
+        with self._lock:
+            self._start()
+            self._channel.sendall(struct.pack('>I', len(request)) + request)
+            header = self._replies.read(4)
+            reply = self._replies.read(struct.unpack('>I', header)[0]) if len(header) == 4 else b''
+            if not reply:
+                stderr = self._stderr
+                stderr.join(1)
+                self._close()
+                raise RemoteAgentError("the agent exited: {stderr}".format(stderr=stderr.text()))
+        reply = json.loads(reply.decode('utf-8'))
+        if 'error' in reply:
+            if reply['errno'] is not None and reply['strerror'] is not None:
+                if reply['filename'] is not None:
+                    raise OSError(reply['errno'], reply['strerror'], reply['filename'])
+                raise OSError(reply['errno'], reply['strerror'])
+            raise RemoteAgentError("{error}: {message}".format(error=reply['error'], message=reply['message']),
+                                   remote_type=reply['error'])
+        return reply['result']
+
+    def call(self, name, *args, **kwargs):
+        """
+        Call a function on the remote host.  The arguments and the result must be JSON serializable.
+
+        :param name: the dotted name of the function in it's module, for example 'os.path.getsize'
+        :type name: str
+        :returns: the result of the function
+        """
+        return self._request('call', name, args, kwargs)
+
+    def stat(self, path):
+        """
+        :param path: the remote path
+        :type path: str
+        :rtype: RemoteStat
+        """
+        return RemoteStat(*self._request('stat', path))
+
+    def lstat(self, path):
+        """
+        :param path: the remote path, symbolic links are not followed
+        :type path: str
+        :rtype: RemoteStat
+        """
+        return RemoteStat(*self._request('lstat', path))
+
+    def listdir(self, path):
+        """
+        :param path: the remote directory
+        :type path: str
+        :returns: the sorted names in the directory
+        :rtype: list[str]
+        """
+        return self._request('listdir', path)
+
+    def listdir_stat(self, path):
+        """
+        :param path: the remote directory
+        :type path: str
+        :returns: the sorted names in the directory and their lstat
+        :rtype: list[tuple(str, RemoteStat)]
+        """
+        return [(name, RemoteStat(*value)) for name, value in self._request('listdir_stat', path)]
+
+    def hash(self, path, algorithm='md5'):
+        """
+        :param path: the remote file
+        :type path: str
+        :param algorithm: a hashlib algorithm
+        :type algorithm: str
+        :returns: the hex digest of the file's contents
+        :rtype: str
+        """
+        return self._request('hash', path, algorithm)
+
+    def read(self, path, offset=0, size=-1):
+        """
+        :param path: the remote file
+        :type path: str
+        :param offset: the byte offset to read from
+        :type offset: int
+        :param size: the number of bytes to read, -1 reads to the end of the file
+        :type size: int
+        :returns: the bytes read
+        :rtype: bytes
+        """
+        return base64.b64decode(self._request('read', path, offset, size))
@@ -0,0 +1,146 @@
+# coding=utf-8
+
+"""
+Streaming reads of remote files over SFTP with a bounded read-ahead window.
+
+paramiko's *prefetch* requests the whole file at once and holds whatever has arrived until it is read, so a slow
+reader of a multi-GB file ends up with the file in memory.  RemoteFile keeps at most *window* bytes requested ahead
+of the read position, topping the window up as it is consumed, so the reads are pipelined but the memory used is
+constant.
+
+Usage
+-----
+
+.. code-block:: python
+
+    with RemoteFile(remote.sftp().open('/var/log/syslog', 'rb')) as raw:
+        for line in io.BufferedReader(raw):
+            ...
+
+"""
+import io
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('RemoteFile', 'BLOCK_SIZE', 'WINDOW_SIZE')
+
+#: the number of bytes requested at a time, the largest SFTP read most servers allow
+BLOCK_SIZE = 32768
+
+#: the default number of bytes to request ahead of the read position
+WINDOW_SIZE = 1024 * 1024
+
+
+class RemoteFile(io.RawIOBase):
+    """
+    Read only, seekable raw stream over an open paramiko SFTPFile.
+
+    The size of the file is taken when opened.  Call *refresh* to pick up data appended since.
+
+    :param sftp_file: the remote file opened for reading
+    :type sftp_file: paramiko.SFTPFile
+    :param window: the number of bytes to request ahead of the read position
+    :type window: int
+    :param offset: the position to start reading from
+    :type offset: int
+    """
+
+    def __init__(self, sftp_file, window=WINDOW_SIZE, offset=0):
+        super(RemoteFile, self).__init__()
+        self._file = sftp_file
+        self.window = max(window, BLOCK_SIZE)
+        self.size = sftp_file.stat().st_size
+        self._position = offset
+        self._requested = offset
+        self._block = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset != self._position:
+            self._position = max(0, offset)
+            # the data requested ahead of the old position is read synchronously if at all
+            self._requested = self._position
+            self._block = b''
+        return self._position
+
+    def refresh(self):
+        """
+        Update the size of the file from the server.
+
+        :returns: the size of the file
+        :rtype: int
+        """
+        self.size = self._file.stat().st_size
+        return self.size
+
+    def tail_offset(self, lines):
+        """
+        Find the start of the last lines of the file by reading blocks backwards from the end.
+
+        :param lines: the number of lines
+        :type lines: int
+        :returns: the offset of the first of the last lines, 0 if the file has fewer lines
+        :rtype: int
+        """
+        if lines <= 0:
+            return self.size
+        newlines = 0
+        position = self.size
+        while position > 0:
+            start = max(0, position - BLOCK_SIZE)
+            self._file.seek(start)
+            data = self._file.read(position - start)
+            index = len(data)
+            while True:
+                index = data.rfind(b'\n', 0, index)
+                if index < 0:
+                    break
+                # the newline ending the file does not start a line
+                if start + index != self.size - 1:
+                    newlines += 1
+                    if newlines == lines:
+                        return start + index + 1
+            position = start
+        return 0
+
+    def readinto(self, buffer):
+        if not self._block:
+            if self._position >= self.size:
+                return 0
+            self._read_ahead()
+            # the whole block is read so the SFTPFile's own buffer stays empty across seeks
+            self._file.seek(self._position)
+            self._block = self._file.read(min(BLOCK_SIZE, self.size - self._position))
+            if not self._block:
+                return 0
+        count = min(len(buffer), len(self._block))
+        buffer[:count] = self._block[:count]
+        self._block = self._block[count:]
+        self._position += count
+        return count
+
+    def _read_ahead(self):
+        """Request the blocks up to a window ahead of the position when half of the window has been read."""
+        self._requested = max(self._requested, self._position)
+        end = min(self.size, self._position + self.window)
+        if end > self._requested and end - self._requested >= min(self.window // 2, self.size - self._requested):
+            # prefetch requests from the file's position up to file_size
+            self._file.seek(self._requested)
+            self._file.prefetch(end)
+            self._requested = end
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super(RemoteFile, self).close()
@@ -3,6 +3,12 @@
 """
 Remote shell with a context over ssh with support for pexpect.
 
+Long-lived sessions are kept up with SSH keepalives.  Before a command is dispatched on a session that has been
+idle for *probe_interval* seconds, the session is probed with a short timeout.  A dead session is logged in again
+with the cached credentials, retrying with exponential backoff, so a socket silently dropped by a NAT or firewall
+costs a reconnect instead of the full command timeout.  *reconnect_count* and *reconnect_attempts* count the
+reconnects.
+
 Usage
 -----
 
@@ -14,20 +20,41 @@ Usage
         remote.get(remote_file)
 
 """
+import io
 import json
 import os
+import posixpath
+import select
+import socket
 import stat
 import sys
 import re
-from time import sleep
+import threading
+import uuid
+from collections import namedtuple
+from time import sleep, time
 from getpass import getpass, getuser
 
 import pexpect
-import paramiko
-from paramiko import SSHClient
+from paramiko import SFTPClient, SSHException
 
+from fullmonty.host_facts import FACTS_COMMAND, HostFacts, HostFactsCache
+from fullmonty.channel_io import LineDecoder, channel_finished, env_command_line, ready_chunks
+from fullmonty.md5 import md5sum
+from fullmonty.remote_agent import RemoteAgent
+from fullmonty.remote_file import BLOCK_SIZE, WINDOW_SIZE, RemoteFile
 from fullmonty.touch import touch
-from fullmonty.simple_logger import debug
+from fullmonty.sftp_transfer import SFTPTransfer
+from fullmonty.simple_logger import debug, warning
+from fullmonty.tar_transfer import TarTransfer
+from fullmonty.thread_map import thread_map
+from fullmonty.transport_pool import TransportPool
+
+try:
+    from shlex import quote
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from pipes import quote
 
 try:
     from pexpect.pxssh import pxssh
@@ -39,7 +66,6 @@ except ImportError:
         import pxssh
 
 # from pexpect.pxssh import ExceptionPxssh
-from scp import SCPClient
 
 try:
     # noinspection PyUnresolvedReferences
@@ -51,7 +77,44 @@ except ImportError:
 from .ashell import AShell, CR, MOVEMENT
 
 __docformat__ = 'restructuredtext en'
-__all__ = ('RemoteShell',)
+__all__ = ('RemoteShell', 'ExecResult', 'SyncPlan', 'PasswordRequired', 'default_pattern_responses')
+
+#: the decoded output and the exit status of a command ran on an exec channel
+ExecResult = namedtuple('ExecResult', ['stdout', 'stderr', 'exit_status'])
+
+#: the prefix of the sentinel echoed to synchronize with the pxssh prompt
+SYNC_MARKER = '__fullmonty_sync__'
+
+#: the host facts cache shared by RemoteShells that are not given one
+DEFAULT_FACTS_CACHE = HostFactsCache()
+
+#: the changes planned by a sync: the (local path, remote path) uploads, the remote file deletes, the bytes to
+#: upload, the (local path, remote path) of the files whose mode or modification time is updated and the remote
+#: directory deletes
+SyncPlan = namedtuple('SyncPlan', ['uploads', 'deletes', 'bytes', 'updates', 'rmdirs'])
+
+
+def default_pattern_responses(user, password):
+    """
+    The responses to the prompts accepted by *accept_defaults*: the user's sudo password, and the default of
+    prompts like "Continue? [Y]" by pressing enter.
+
+    :param user: the remote user
+    :type user: str
+    :param password: the remote user's password
+    :type password: str
+    :returns: the response by regular expression pattern
+    :rtype: OrderedDict
+    """
+    responses = OrderedDict()
+    responses['password for {user}: '.format(user=user)] = "{password}\r".format(password=password)
+    # accept default prompts, don't match "[sudo] "
+    responses[r'\[\S+\](?<!\[sudo\])(?!\S)'] = CR
+    return responses
+
+
+class PasswordRequired(IOError):
+    """Raised when logging in needs a password and prompting for it is not allowed."""
 
 
 class RemoteShell(AShell):
@@ -68,11 +131,34 @@ class RemoteShell(AShell):
     :type logfile:
     :param verbose:
     :type verbose:
+    :param keepalive: seconds between keepalive packets on the pooled paramiko transports
+    :type keepalive: int
+    :param use_channels: run commands on paramiko exec channels instead of the pxssh prompt
+    :type use_channels: bool
+    :param facts_cache: the cache for the remote host's facts, defaults to a cache shared by all RemoteShells
+    :type facts_cache: HostFactsCache
+    :param probe_interval: seconds a session may be idle before it is probed for liveness before use
+    :type probe_interval: float
+    :param probe_timeout: seconds to wait for a liveness probe or for a new channel before reconnecting
+    :type probe_timeout: float
+    :param reconnect_retries: the number of times to retry a failed reconnect
+    :type reconnect_retries: int
+    :param reconnect_delay: seconds to wait before the first retry, doubled on each retry
+    :type reconnect_delay: float
+    :param max_reconnect_delay: the maximum seconds to wait between retries
+    :type max_reconnect_delay: float
+    :param transfer_scheduler: a scheduler shared with other shells that queues and throttles the files of put, get
+        and sync, the host's cap in it is by host name
+    :type transfer_scheduler: fullmonty.transfer_scheduler.TransferScheduler
     """
 
-    def __init__(self, host, user=None, password=None, logfile=None, verbose=False, password_callback=None):
+    def __init__(self, host, user=None, password=None, logfile=None, verbose=False, password_callback=None,
+                 keepalive=30, use_channels=False, facts_cache=None, lazy=False, port=22, connect_timeout=None,
+                 probe_interval=60, probe_timeout=10, reconnect_retries=5, reconnect_delay=1, max_reconnect_delay=30,
+                 transfer_scheduler=None):
         super(RemoteShell, self).__init__(is_remote=True, verbose=verbose)
         self.creds_file = os.path.expanduser('~/.remote_shell_rc')
+        self._creds = None
         if host is None or not host:
             raise AttributeError("You must provide a non-empty string for 'host'")
         if user is None:
@@ -84,27 +170,399 @@ class RemoteShell(AShell):
         self.user = user
         self.password = password
         self.address = host
-        self.port = 22
-        # noinspection PyBroadException
-        try:
-            # noinspection PyCallingNonCallable
-            self.ssh = pxssh(timeout=1200)
-            self.ssh.login(host, user)
-        except:
-            if not password:
-                password = getpass('password for {user}@{host}: '.format(user=user, host=host))
-                if password_callback is not None and callable(password_callback):
-                    password_callback(password)
-            # noinspection PyCallingNonCallable
-            self.ssh = pxssh(timeout=1200)
-            self.ssh.login(host, user, password)
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.password_callback = password_callback
+        self.prompt_password = True
+        """:type prompt_password: bool"""
+        self.connect_blocked = None
+        """:type connect_blocked: str, when set the shell refuses to connect, raising IOError with this message"""
+        self._ssh = None
+        self._connect_lock = threading.Lock()
+        self._reconnect_lock = threading.RLock()
+        self.keepalive = keepalive
+        self.transport_pool = TransportPool(keepalive=keepalive, connect_timeout=connect_timeout)
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.reconnect_retries = reconnect_retries
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.transfer_scheduler = transfer_scheduler
+        self.reconnect_count = 0
+        """:type reconnect_count: int"""
+        self.reconnect_attempts = 0
+        """:type reconnect_attempts: int"""
+        self._last_activity = 0
+        self._transport = None
+        self._sftp_client = None
+        self._agent = None
+        self.exit_status = None
+        """:type exit_status: int"""
+        self.use_channels = use_channels
+        self.facts_cache = facts_cache if facts_cache is not None else DEFAULT_FACTS_CACHE
         self.accept_defaults = False
         self.logfile = logfile
         self.prefix = None
         self.postfix = None
+        if not lazy:
+            self.connect()
+
+    @property
+    def ssh(self):
+        """
+        The pxssh session, logged in on first use.
+
+        :rtype: pxssh
+        """
+        if self._ssh is None:
+            self._login()
+        return self._ssh
+
+    @ssh.setter
+    def ssh(self, value):
+        self._ssh = value
+
+    @property
+    def connected(self):
+        """True if the pxssh session or the pooled transport has been established"""
+        return self._ssh is not None or bool(self.transport_pool.active())
+
+    def connect(self):
+        """
+        Establish the session now instead of on first use.  When using channels, the pooled transport is
+        connected, otherwise the pxssh session is logged in.
+        """
+        if self.use_channels:
+            self.transport()
+        elif self._ssh is None:
+            self._login()
+
+    def _login(self):
+        """log in the pxssh session, trying keys first then the password"""
+        with self._connect_lock:
+            if self._ssh is not None:
+                return
+            self._check_blocked()
+            login_kwargs = {'port': self.port}
+            if self.connect_timeout is not None:
+                login_kwargs['login_timeout'] = self.connect_timeout
+            options = {}
+            if self.keepalive:
+                # ssh exits instead of hanging when the server stops answering keepalives
+                options = {'ServerAliveInterval': str(self.keepalive), 'ServerAliveCountMax': '3'}
+            # noinspection PyBroadException
+            try:
+                # noinspection PyCallingNonCallable
+                ssh = pxssh(timeout=1200, options=options)
+                ssh.login(self.address, self.user, **login_kwargs)
+            except:
+                if not self.password:
+                    if not self.prompt_password:
+                        raise PasswordRequired("{user}@{host} needs a password".format(user=self.user,
+                                                                                       host=self.address))
+                    self.password = getpass('password for {user}@{host}: '.format(user=self.user, host=self.address))
+                    if self.password_callback is not None and callable(self.password_callback):
+                        self.password_callback(self.password)
+                # noinspection PyCallingNonCallable
+                ssh = pxssh(timeout=1200, options=options)
+                ssh.login(self.address, self.user, self.password, **login_kwargs)
+            self._ssh = ssh
+            self._last_activity = time()
+
+    def _check_blocked(self):
+        """:raises: IOError if connecting has been blocked, see *connect_blocked*"""
+        if self.connect_blocked is not None:
+            raise IOError(self.connect_blocked)
+
+    def is_alive(self):
+        """
+        Probe the established sessions.  The pxssh session must answer a prompt and the transport must open a
+        channel within *probe_timeout* seconds.
+
+        :returns: True if the established sessions are alive
+        :rtype: bool
+        """
+        if self._ssh is not None:
+            # noinspection PyBroadException
+            try:
+                if not self._ssh.isalive():
+                    return False
+                self._ssh.sendline()
+                if not self._ssh.prompt(timeout=self.probe_timeout):
+                    return False
+            except Exception:
+                return False
+        if self.transport_pool.active():
+            # noinspection PyBroadException
+            try:
+                self.transport_pool.get(self.address, self.port, self.user, self.password) \
+                    .open_session(timeout=self.probe_timeout).close()
+            except Exception:
+                return False
+        self._last_activity = time()
+        return True
+
+    def _ensure_alive(self):
+        """Reconnect before dispatching a command if the session has been idle too long and fails a probe."""
+        if self.connected and time() - self._last_activity >= self.probe_interval:
+            with self._reconnect_lock:
+                # another thread may have probed or reconnected while this one waited for the lock
+                if time() - self._last_activity >= self.probe_interval and not self.is_alive():
+                    debug("{key} failed the liveness probe, reconnecting".format(key=self._facts_key()))
+                    self.reconnect()
+
+    def _reconnect_unless_alive(self):
+        """Reconnect after a failure unless another thread has already reconnected."""
+        with self._reconnect_lock:
+            if not self.is_alive():
+                self.reconnect()
+
+    def reconnect(self):
+        """
+        Drop the sessions and log in again with the cached credentials, retrying with exponential backoff.
+        Only one thread reconnects at a time.
+
+        :raises: the last connection error if all of the retries fail
+        """
+        self._check_blocked()
+        with self._reconnect_lock:
+            uses_pxssh = self._ssh is not None or not self.use_channels
+            self._disconnect()
+            delay = self.reconnect_delay
+            for retry in range(self.reconnect_retries + 1):
+                self.reconnect_attempts += 1
+                try:
+                    if uses_pxssh:
+                        self._login()
+                    if self.use_channels:
+                        self.transport()
+                    self.reconnect_count += 1
+                    self._last_activity = time()
+                    return
+                except Exception as ex:
+                    debug("reconnect to {key} failed: {ex}".format(key=self._facts_key(), ex=ex))
+                    self._disconnect()
+                    if retry == self.reconnect_retries:
+                        raise
+                sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _disconnect(self):
+        """Close the sessions without logging out of the (possibly dead) remote shell."""
+        if self._ssh is not None:
+            # noinspection PyBroadException
+            try:
+                self._ssh.close(force=True)
+            except Exception:
+                pass
+            self._ssh = None
+        if self._sftp_client is not None:
+            # noinspection PyBroadException
+            try:
+                self._sftp_client.close()
+            except Exception:
+                pass
+            self._sftp_client = None
+        if self._agent is not None:
+            self._agent.close()
+            self._agent = None
+        self._transport = None
+        self.transport_pool.close_all()
+
+    @classmethod
+    def connect_all(cls, hosts, max_workers=16, connect_timeout=10, **kwargs):
+        """
+        Create and connect RemoteShells to many hosts in parallel.  A host that fails to connect, or does not
+        connect within the timeout, is reported in the failures without holding up the other hosts.
+
+        The credentials are looked up, prompting for any missing passwords one host at a time, before connecting
+        in parallel.  The hosts that turn out to need a password while connecting, because key authentication
+        failed and they have none, are prompted for afterwards, again one host at a time on the calling thread.
+
+        Usage::
+
+            shells, failures = RemoteShell.connect_all(['web1', 'web2', 'db1'], user='deploy')
+            for host, ex in failures.items():
+                error("{host}: {ex}".format(host=host, ex=ex))
+
+        :param hosts: the host names
+        :type hosts: list[str]
+        :param max_workers: the maximum number of connections to establish at the same time
+        :type max_workers: int
+        :param connect_timeout: seconds to give each host to connect
+        :type connect_timeout: float
+        :param kwargs: the other RemoteShell arguments (user, password, use_channels,...)
+        :returns: the connected shells by host and the exceptions by host of the hosts that failed
+        :rtype: tuple(dict[str, RemoteShell], dict[str, Exception])
+        """
+        kwargs['lazy'] = True
+        kwargs['connect_timeout'] = connect_timeout
+        shells = {}
+        failures = {}
+        for host in hosts:
+            try:
+                shells[host] = cls(host, **kwargs)
+            except Exception as ex:
+                failures[host] = ex
+
+        # noinspection PyDocstring
+        def connect(shell):
+            # the worker threads must not prompt on the shared tty
+            shell.prompt_password = False
+            try:
+                shell.connect()
+            finally:
+                shell.prompt_password = True
+            return shell
+
+        ordered = list(shells.values())
+        for shell, result in zip(ordered, thread_map(connect, ordered, max_workers=max_workers,
+                                                      return_exceptions=True)):
+            if isinstance(result, PasswordRequired):
+                try:
+                    shell.connect()
+                    continue
+                except Exception as ex:
+                    result = ex
+            if isinstance(result, Exception):
+                failures[shell.address] = result
+                del shells[shell.address]
+        return shells, failures
+
+    def transport(self):
+        """
+        The pooled paramiko transport to the remote host, connected on first use.
+
+        :rtype: paramiko.Transport
+        """
+        self._check_blocked()
+        transport = self.transport_pool.get(self.address, self.port, self.user, self.password)
+        if self._transport is not None and transport is not self._transport:
+            # the pool replaced a transport that went down
+            self.reconnect_count += 1
+        self._transport = transport
+        self._last_activity = time()
+        return transport
+
+    def sftp(self):
+        """
+        The sftp client on the pooled transport, opened on first use.
+
+        :rtype: paramiko.SFTPClient
+        """
+        transport = self.transport()
+        if self._sftp_client is None or self._sftp_client.get_channel().get_transport() is not transport:
+            self._sftp_client = SFTPClient.from_transport(transport)
+        return self._sftp_client
+
+    def agent(self, python=None):
+        """
+        The persistent Python agent on the remote host, started on the pooled transport on first use.  Remote
+        stat, hash, listdir, read and function calls on the agent cost a round trip instead of a process.
+
+        Usage::
+
+            agent = remote.agent()
+            if agent.stat(path).st_size != local_size:
+                ...
+            agent.call('shutil.rmtree', '/tmp/build')
+
+        :param python: the remote python interpreter, defaults to python3 falling back to python
+        :type python: str
+        :rtype: RemoteAgent
+        """
+        transport = self.transport()
+        if self._agent is None or self._agent.transport is not transport or \
+                (python is not None and self._agent.python != python):
+            if self._agent is not None:
+                self._agent.close()
+            self._agent = RemoteAgent(transport, python=python)
+        return self._agent
+
+    def open_remote(self, path, offset=0, window=WINDOW_SIZE):
+        """
+        Open the remote file for reading on the pooled sftp client.  The file is streamed with *window* bytes
+        requested ahead of the read position, so files of any size are read in constant memory.
+
+        Usage::
+
+            with remote.open_remote('/var/log/big.log') as log_file:
+                for line in log_file:
+                    ...
+
+        :param path: the remote file
+        :type path: str
+        :param offset: the byte offset to start reading from
+        :type offset: int
+        :param window: the number of bytes to read ahead
+        :type window: int
+        :returns: the buffered, binary, file-like object
+        :rtype: io.BufferedReader
+        """
+        return io.BufferedReader(RemoteFile(self.sftp().open(path, 'rb'), window=window, offset=offset),
+                                 BLOCK_SIZE)
+
+    def iter_lines(self, path, start_offset=0, encoding='utf-8'):
+        """
+        Yield the lines of the remote file, each with it's line ending.
+
+        :param path: the remote file
+        :type path: str
+        :param start_offset: the byte offset to start reading from
+        :type start_offset: int
+        :param encoding: the encoding of the file, undecodable bytes are replaced
+        :type encoding: str
+        """
+        with self.open_remote(path, offset=start_offset) as remote_file:
+            for line in remote_file:
+                yield line.decode(encoding, 'replace')
+
+    def tail(self, path, lines=10, follow=True, interval=1.0, encoding='utf-8'):
+        """
+        Yield the last lines of the remote file then, if following, the lines appended to it as they are written,
+        like *tail -f*.  A partial last line is held until it's line ending is written.  When the file shrinks below
+        the position read to, it was truncated and is followed from the start.
+
+        :param path: the remote file
+        :type path: str
+        :param lines: the number of existing lines to yield first
+        :type lines: int
+        :param follow: asserted to wait for more lines at the end of the file instead of stopping
+        :type follow: bool
+        :param interval: seconds between checks for more lines
+        :type interval: float
+        :param encoding: the encoding of the file, undecodable bytes are replaced
+        :type encoding: str
+        """
+        raw = RemoteFile(self.sftp().open(path, 'rb'))
+        with io.BufferedReader(raw, BLOCK_SIZE) as reader:
+            reader.seek(raw.tail_offset(lines))
+            partial = b''
+            while True:
+                line = reader.readline()
+                if line.endswith(b'\n'):
+                    yield (partial + line).decode(encoding, 'replace')
+                    partial = b''
+                elif line:
+                    partial += line
+                elif not follow:
+                    break
+                else:
+                    sleep(interval)
+                    position = reader.tell()
+                    if raw.refresh() < position:
+                        reader.seek(0)
+                        partial = b''
+            if partial:
+                yield partial.decode(encoding, 'replace')
 
     def env(self):
-        """returns the environment dictionary"""
+        """
+        The environment of the session, including any variables exported or sourced in it.
+
+        :returns: the environment dictionary, empty if the env command fails
+        :rtype: dict[str, str]
+        """
         environ = {}
         # noinspection PyBroadException
         try:
@@ -116,6 +574,38 @@ class RemoteShell(AShell):
             pass
         return environ
 
+    def cached_env(self, refresh=False):
+        """
+        The login environment from the cached facts, gathered over a non-interactive exec channel.  Variables set
+        in the session are not included and the values may be as old as the facts cache's ttl.
+
+        :param refresh: asserted to gather the facts even if they are cached
+        :type refresh: bool
+        :returns: the environment dictionary
+        :rtype: dict[str, str]
+        """
+        return dict(self.facts(refresh=refresh).env)
+
+    def facts(self, refresh=False):
+        """
+        The remote host's facts (env, OS, CPU count, memory, disk), gathered with one remote command and cached.
+
+        :param refresh: asserted to gather the facts even if they are cached
+        :type refresh: bool
+        :rtype: HostFacts
+        """
+        key = self._facts_key()
+        if refresh:
+            self.facts_cache.invalidate(key)
+        return self.facts_cache.get(key, lambda: HostFacts.parse(self._exec(FACTS_COMMAND).stdout))
+
+    def invalidate_facts(self):
+        """Forget the cached facts for the remote host."""
+        self.facts_cache.invalidate(self._facts_key())
+
+    def _facts_key(self):
+        return '{user}@{host}:{port}'.format(user=self.user, host=self.address, port=self.port)
+
     def _report(self, output, out_stream, verbose):
         def _out_string(value):
             if value:
@@ -126,6 +616,45 @@ class RemoteShell(AShell):
         _out_string(self.ssh.before)
         _out_string(self.ssh.after)
 
+    def _sync(self, timeout):
+        """
+        Synchronize with the remote shell by echoing a unique sentinel then waiting for it and the prompt that
+        follows it.  Any output pending from earlier commands is discarded.
+
+        :param timeout: seconds to wait for the sentinel and the prompt
+        :type timeout: float
+        :returns: True if synchronized, False on timeout
+        :rtype: bool
+        """
+        token = uuid.uuid4().hex
+        # the quotes keep the echo of the command line from matching the sentinel
+        self.ssh.sendline("echo {marker}''{token}".format(marker=SYNC_MARKER, token=token))
+        try:
+            self.ssh.expect_exact(SYNC_MARKER + token, timeout=timeout)
+        except pexpect.TIMEOUT:
+            warning("{key}: timed out synchronizing with the prompt".format(key=self._facts_key()))
+            return False
+        if not self.ssh.prompt(timeout=timeout):
+            warning("{key}: timed out waiting for the prompt".format(key=self._facts_key()))
+            return False
+        return True
+
+    def _synchronize(self, timeout):
+        """
+        Synchronize with the remote shell before sending a command.  A shell that fails to synchronize is
+        reconnected and tried once more, so the output of an earlier command is never read as the next one's.
+
+        :param timeout: seconds to wait for the sentinel and the prompt
+        :type timeout: float
+        :raises: IOError if the new session does not synchronize either
+        """
+        if self._sync(timeout):
+            return
+        debug("{key} is out of sync with the prompt, reconnecting".format(key=self._facts_key()))
+        self.reconnect()
+        if not self._sync(timeout):
+            raise IOError("{key}: could not synchronize with the remote shell".format(key=self._facts_key()))
+
     # noinspection PyUnusedLocal
     def run_pattern_response(self, cmd_args, out_stream=sys.stdout, verbose=True,
                              prefix=None, postfix=None,
@@ -146,11 +675,7 @@ class RemoteShell(AShell):
         pattern_response_dict = OrderedDict(pattern_response or {})
 
         if accept_defaults:
-            sudo_pattern = 'password for {user}: '.format(user=self.user)
-            sudo_response = "{password}\r".format(password=self.password)
-            pattern_response_dict[sudo_pattern] = sudo_response
-            # accept default prompts, don't match "[sudo] "
-            pattern_response_dict[r'\[\S+\](?<!\[sudo\])(?!\S)'] = CR
+            pattern_response_dict.update(default_pattern_responses(self.user, self.password))
 
         pattern_response_dict[MOVEMENT] = None
         pattern_response_dict[pexpect.TIMEOUT] = None
@@ -165,29 +690,29 @@ class RemoteShell(AShell):
 
         output = []
 
-        self.ssh.prompt(timeout=0.1)  # clear out any pending prompts
-        self._report(output, out_stream=out_stream, verbose=verbose)
+        self._ensure_alive()
+        self._synchronize(timeout)
         self.ssh.sendline(command_line)
+        timeout_index = patterns.index(pexpect.TIMEOUT)
+        prompt_index = patterns.index(self.ssh.PROMPT)
         while True:
             try:
-                index = self.ssh.expect(patterns)
-                if index == patterns.index(pexpect.TIMEOUT):
-                    print("ssh.expect TIMEOUT")
+                index = self.ssh.expect(patterns, timeout=timeout)
+                if index == timeout_index:
+                    warning("{key}: no output for {timeout} seconds from: {command}".format(
+                        key=self._facts_key(), timeout=timeout, command=command_line))
                 else:
                     self._report(output, out_stream=out_stream, verbose=verbose)
-                    if index == patterns.index(self.ssh.PROMPT):
+                    if index == prompt_index:
                         break
 
-                    key = patterns[index]
-                    response = pattern_response_dict[key]
+                    response = pattern_response_dict[patterns[index]]
                     if response:
-                        sleep(0.1)
                         self.ssh.sendline(response)
             except pexpect.EOF:
                 self._report(output, out_stream=out_stream, verbose=verbose)
                 break
-        self.ssh.prompt(timeout=0.1)
-        self._report(output, out_stream=out_stream, verbose=verbose)
+        self._last_activity = time()
         return ''.join(output).split("\n")
 
     # noinspection PyUnusedLocal,PyShadowingNames
@@ -238,74 +763,451 @@ class RemoteShell(AShell):
         args = self.expand_args(cmd_args, prefix=prefix, postfix=postfix)
         command_line = ' '.join(args)
         self.display("{line}\n".format(line=command_line), out_stream=out_stream, verbose=verbose)
-        self.ssh.prompt(timeout=.1)  # clear out any pending prompts
+        if self.use_channels:
+            result = self._exec(command_line, env=env, timeout=timeout, combine_stderr=True)
+            self.display(result.stdout, out_stream=out_stream, verbose=verbose)
+            return result.stdout
+        self._ensure_alive()
+        self._synchronize(timeout)
         self.ssh.sendline(command_line)
         self.ssh.prompt(timeout=timeout)
+        self._last_activity = time()
         buf = [self.ssh.before]
         if self.ssh.after:
             buf.append(str(self.ssh.after))
         return ''.join(buf)
 
-    def put(self, files, remote_path=None, out_stream=sys.stdout, verbose=False):
+    def exec_command(self, cmd_args, out_stream=sys.stdout, env=None, verbose=False,
+                     prefix=None, postfix=None, timeout=None):
         """
-        Copy a file from the local system to the remote system.
+        Run the command on it's own exec channel of the pooled transport.  Unlike *run*, the command does not go
+        through the pxssh prompt so it takes a single round trip and may run concurrently with other commands.
+
+        :param cmd_args: list of command arguments or str command line
+        :type cmd_args: list or str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param env: the environment variables for the command to use.
+        :type env: dict
+        :param verbose: if verbose, then echo the command and it's output to stdout.
+        :type verbose: bool
+        :param prefix: list of command arguments to prepend to the command line
+        :type prefix: list[str]
+        :param postfix: list of command arguments to append to the command line
+        :type postfix: list[str]
+        :param timeout: the maximum time in seconds to give the command, None waits forever.
+            On timeout the channel is closed and the exit status is -1.
+        :type timeout: float
+        :returns: the stdout, stderr and exit status of the command
+        :rtype: ExecResult
+        """
+        if isinstance(cmd_args, str):
+            cmd_args = [cmd_args]
+        command_line = ' '.join(self.expand_args(cmd_args, prefix=prefix, postfix=postfix))
+        self.display("{line}\n".format(line=command_line), out_stream=out_stream, verbose=verbose)
+        result = self._exec(command_line, env=env, timeout=timeout)
+        self.display(result.stdout + result.stderr, out_stream=out_stream, verbose=verbose)
+        return result
+
+    def exec_commands(self, commands, env=None, timeout=None, max_workers=10):
+        """
+        Run the commands concurrently, each on it's own exec channel multiplexed over the pooled transport.
+
+        :param commands: the list of commands, each a list of command arguments or str command line
+        :type commands: list
+        :param env: the environment variables for the commands to use.
+        :type env: dict
+        :param timeout: the maximum time in seconds to give each command, None waits forever.
+        :type timeout: float
+        :param max_workers: the maximum number of commands to run at the same time
+        :type max_workers: int
+        :returns: the results in the same order as the commands
+        :rtype: list[ExecResult]
+        """
+        self.transport()  # connect once before the workers share the transport
+        return thread_map(lambda command: self.exec_command(command, env=env, timeout=timeout),
+                          commands, max_workers=max_workers)
+
+    def _open_channel(self, command_line, env=None, combine_stderr=False):
+        """
+        Start the command line on a new exec channel of the pooled transport.
+
+        :rtype: paramiko.Channel
+        """
+        command_line = env_command_line(command_line, env)
+        transport = self.transport()
+        try:
+            channel = transport.open_session(timeout=self.probe_timeout)
+        except (SSHException, EOFError, socket.error) as ex:
+            # nothing has run yet so it is safe to retry on a new transport
+            debug("opening a channel to {key} failed ({ex}), reconnecting".format(key=self._facts_key(), ex=ex))
+            self._reconnect_unless_alive()
+            channel = self.transport().open_session(timeout=self.probe_timeout)
+        channel.set_combine_stderr(combine_stderr)
+        channel.exec_command(command_line)
+        return channel
 
-        :param files:
-        :param remote_path:
-        :param out_stream:
-        :param verbose:
-        :return: :rtype:
+    # noinspection PyMethodMayBeStatic
+    def _channel_chunks(self, channel, timeout=None, timeout_interval=None):
+        """
+        Yield (is_stderr, bytes) as the data arrives on the channel until the command exits or the timeout
+        expires.
+
+        :param timeout: seconds to wait for the command, None waits forever
+        :param timeout_interval: the maximum seconds to wait for data between checks, None waits for data
+        """
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            for chunk in ready_chunks(channel):
+                yield chunk
+            if channel_finished(channel):
+                break
+            wait = timeout_interval
+            if deadline is not None:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                wait = remaining if wait is None else min(wait, remaining)
+            select.select([channel], [], [], wait)
+        # drain whatever arrived with the exit status
+        for chunk in ready_chunks(channel):
+            yield chunk
+
+    def _exec(self, command_line, env=None, timeout=None, combine_stderr=False):
+        """
+        Run the command line on a new exec channel and wait for it to complete.
+
+        :returns: the stdout, stderr and exit status of the command
+        :rtype: ExecResult
+        """
+        channel = self._open_channel(command_line, env=env, combine_stderr=combine_stderr)
+        try:
+            stdout = []
+            stderr = []
+            for is_stderr, chunk in self._channel_chunks(channel, timeout):
+                (stderr if is_stderr else stdout).append(chunk)
+            exit_status = channel.recv_exit_status() if channel.exit_status_ready() else -1
+            return ExecResult(b''.join(stdout).decode('utf-8', 'replace'),
+                              b''.join(stderr).decode('utf-8', 'replace'),
+                              exit_status)
+        finally:
+            channel.close()
+
+    def run_generator(self, cmd_args, out_stream=sys.stdout, env=None, verbose=True,
+                      prefix=None, postfix=None, timeout=0, timeout_interval=1, debug=False):
+        """
+        Runs the command on an exec channel and yields each line of output (stdout and stderr combined) as it
+        arrives, writing the output to out_stream if verbose is True.  When the command completes, it's exit
+        status is saved in *exit_status*.
+
+        :param cmd_args: list of command arguments or str command line
+        :type cmd_args: list or str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param env: the environment variables for the command to use.
+        :type env: dict
+        :param verbose: if verbose, then echo the command and it's output to stdout.
+        :type verbose: bool
+        :param prefix: list of command arguments to prepend to the command line
+        :type prefix: list
+        :param postfix: list of command arguments to append to the command line
+        :type postfix: list
+        :param timeout: max time in seconds for command to run, 0 means no limit
+        :type timeout: int
+        :param timeout_interval: max time in seconds to wait for output between timeout checks
+        :type timeout_interval: int
+        :param debug: debug log messages
+        :type debug: bool
+        """
+        if isinstance(cmd_args, str):
+            cmd_args = [cmd_args]
+        self.display("run_generator(%s, %s)\n\n" % (cmd_args, env), out_stream=out_stream, verbose=debug)
+        command_line = ' '.join(self.expand_args(cmd_args, prefix=prefix, postfix=postfix))
+        self.display("{line}\n\n".format(line=command_line), out_stream=out_stream, verbose=verbose)
+
+        self.exit_status = None
+        channel = self._open_channel(command_line, env=env, combine_stderr=True)
+        try:
+            decoder = LineDecoder()
+            for is_stderr, chunk in self._channel_chunks(channel, timeout or None, timeout_interval):
+                for line in decoder.decode(chunk):
+                    self.display(line, out_stream=out_stream, verbose=verbose)
+                    yield line
+            for line in decoder.finish():
+                self.display(line, out_stream=out_stream, verbose=verbose)
+                yield line
+            if channel.exit_status_ready():
+                self.exit_status = channel.recv_exit_status()
+        finally:
+            channel.close()
+
+    def put(self, files, remote_path=None, out_stream=sys.stdout, verbose=False, channels=4, progress=None):
+        """
+        Copy files from the local system to the remote system.  The files are copied concurrently over several
+        sftp channels.
+
+        :param files: a local file, directory, or list of them
+        :type files: str or list[str]
+        :param remote_path: the remote destination, defaults to files
+        :type remote_path: str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param verbose: if verbose, then echo the command and the files copied
+        :type verbose: bool
+        :param channels: the number of files to copy at the same time
+        :type channels: int
+        :param progress: called with a TransferProgress as data is transferred
+        :type progress: callable
+        :return: the local files copied
+        :rtype: str
         """
         if remote_path is None:
             remote_path = files
-        self.display("scp '{src}' '{dest}'".format(src=files, dest=remote_path),
+        self.display("sftp put '{src}' '{dest}'\n".format(src=files, dest=remote_path),
                      out_stream=out_stream, verbose=verbose)
-        ssh = SSHClient()
-        ssh.load_system_host_keys()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(self.address, self.port, self.user, self.password)
-        scp = SCPClient(ssh.get_transport())
-        # scp = SCPClient(self.ssh.get_transport())
-        output = scp.put(files, remote_path, recursive=True) or ''
-        self.display("\n" + output, out_stream=out_stream, verbose=verbose)
+        transfer = SFTPTransfer(self.transport(), channels=channels, progress=progress,
+                                scheduler=self.transfer_scheduler, host=self.address)
+        output = repr(transfer.put(files, remote_path))
+        self.display(output + '\n', out_stream=out_stream, verbose=verbose)
         return output
 
-    def get(self, remote_path, local_path=None, out_stream=sys.stdout, verbose=False):
+    def get(self, remote_path, local_path=None, out_stream=sys.stdout, verbose=False, channels=4, progress=None):
         """
-        Copy a file from the remote system to the local system.
+        Copy files from the remote system to the local system.  The remote path is listed without going through
+        the pxssh prompt and the files are copied concurrently over several sftp channels.
 
-        :param remote_path:
-        :param local_path:
-        :param out_stream:
-        :param verbose:
-        :return: :rtype:
+        :param remote_path: a remote file, directory, or glob pattern
+        :type remote_path: str
+        :param local_path: the local destination, defaults to remote_path
+        :type local_path: str
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param verbose: if verbose, then echo the command and the files copied
+        :type verbose: bool
+        :param channels: the number of files to copy at the same time
+        :type channels: int
+        :param progress: called with a TransferProgress as data is transferred
+        :type progress: callable
+        :return: the remote files copied
+        :rtype: str
         """
         if local_path is None:
             local_path = remote_path
-        self.display("scp '{src}' '{dest}'\n".format(src=remote_path, dest=local_path),
+        self.display("sftp get '{src}' '{dest}'\n".format(src=remote_path, dest=local_path),
                      out_stream=out_stream, verbose=verbose)
+        transfer = SFTPTransfer(self.transport(), channels=channels, progress=progress,
+                                scheduler=self.transfer_scheduler, host=self.address)
+        output = repr(transfer.get(remote_path, local_path))
+        self.display(output + '\n', out_stream=out_stream, verbose=verbose)
+        return output
 
-        names = [name.strip() for name in self.run(['/bin/ls', '-1', '--color=never', remote_path]).split('\r\n')[1:] if
-                 name.strip() != '[PEXPECT]$']
-        self.display("names: {names}".format(names=repr(names)))
+    def put_tar(self, local_dir, remote_dir, compress=False, include=None, exclude=None,
+                out_stream=sys.stdout, verbose=False):
+        """
+        Copy the contents of a local directory into a remote directory as a tar stream over one exec channel.
+        Much faster than *put* for trees of many small files.
 
-        ssh = SSHClient()
-        ssh.load_system_host_keys()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(self.address, self.port, self.user, self.password)
-        # scp = SFTPClient.from_transport(ssh.get_transport())
-        # output = scp.get(remote_path, local_path, recursive=True)
+        :param local_dir: the local directory
+        :type local_dir: str
+        :param remote_dir: the remote directory, created if needed
+        :type remote_dir: str
+        :param compress: asserted to gzip the stream
+        :type compress: bool
+        :param include: fnmatch patterns of the files to copy, None copies all files
+        :type include: list[str]
+        :param exclude: fnmatch patterns of the files and directories not to copy
+        :type exclude: list[str]
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param verbose: if verbose, then echo the transfer
+        :type verbose: bool
+        :returns: the number of files copied
+        :rtype: int
+        """
+        self.display("tar put '{src}' '{dest}'\n".format(src=local_dir, dest=remote_dir),
+                     out_stream=out_stream, verbose=verbose)
+        return TarTransfer(self.transport(), compress=compress, include=include, exclude=exclude).put(local_dir,
+                                                                                                    remote_dir)
 
-        ftp = ssh.open_sftp()
-        for name in names:
-            self.display(name + '\n')
-            ftp.get(name, local_path)
+    def get_tar(self, remote_dir, local_dir, compress=False, include=None, exclude=None,
+                out_stream=sys.stdout, verbose=False):
+        """
+        Copy the contents of a remote directory into a local directory as a tar stream over one exec channel.
+        Much faster than *get* for trees of many small files.
 
-        output = repr(names)
-        self.display(output, out_stream=out_stream, verbose=verbose)
-        return output
+        :param remote_dir: the remote directory
+        :type remote_dir: str
+        :param local_dir: the local directory, created if needed
+        :type local_dir: str
+        :param compress: asserted to gzip the stream
+        :type compress: bool
+        :param include: fnmatch patterns of the files to copy, None copies all files
+        :type include: list[str]
+        :param exclude: fnmatch patterns of the files and directories not to copy
+        :type exclude: list[str]
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param verbose: if verbose, then echo the transfer
+        :type verbose: bool
+        :returns: the number of files copied
+        :rtype: int
+        """
+        self.display("tar get '{src}' '{dest}'\n".format(src=remote_dir, dest=local_dir),
+                     out_stream=out_stream, verbose=verbose)
+        return TarTransfer(self.transport(), compress=compress, include=include, exclude=exclude).get(remote_dir,
+                                                                                                    local_dir)
+
+    def sync(self, local_dir, remote_dir, delete=False, dry_run=False, out_stream=sys.stdout, verbose=False,
+             channels=4, progress=None):
+        """
+        Make the remote directory a copy of the local directory by only uploading the files that are new or whose
+        content changed.  Local files are hashed with md5sum, remote files with one batched md5sum command.
+        Uploaded files keep their local modes and modification times, and the remote files whose content matches
+        but whose mode or modification time (to the second) differs are updated in place.  The local directories
+        and any missing parents of the remote directory are created.
+
+        :param local_dir: the local directory
+        :type local_dir: str
+        :param remote_dir: the remote directory, created if it does not exist
+        :type remote_dir: str
+        :param delete: asserted to delete remote files and directories that are not in the local directory
+        :type delete: bool
+        :param dry_run: asserted to only plan the sync
+        :type dry_run: bool
+        :param out_stream: the output stream
+        :type out_stream: file
+        :param verbose: if verbose, then echo the planned changes
+        :type verbose: bool
+        :param channels: the number of files to upload at the same time
+        :type channels: int
+        :param progress: called with a TransferProgress as data is transferred
+        :type progress: callable
+        :returns: the planned, or when not a dry run, performed changes
+        :rtype: SyncPlan
+        """
+        local_dirs = set()
+        local_files = {}
+        for dir_path, dir_names, file_names in os.walk(local_dir):
+            relative_dir = os.path.relpath(dir_path, local_dir).replace(os.sep, '/')
+            if relative_dir != '.':
+                local_dirs.add(relative_dir)
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                relative = os.path.relpath(path, local_dir).replace(os.sep, '/')
+                digest, size = md5sum(path)
+                local_stat = os.stat(path)
+                local_files[relative] = (digest, size, stat.S_IMODE(local_stat.st_mode), int(local_stat.st_mtime))
+        remote_dirs, remote_hashes, remote_attrs = self._remote_md5sums(remote_dir)
+
+        uploads = []
+        updates = []
+        total = 0
+        for relative in sorted(local_files):
+            digest, size, mode, mtime = local_files[relative]
+            remote = posixpath.join(remote_dir, relative)
+            if remote_hashes.get(relative) != digest:
+                uploads.append((os.path.join(local_dir, *relative.split('/')), remote))
+                total += size
+            elif remote_attrs.get(relative) != (mode, mtime):
+                updates.append((os.path.join(local_dir, *relative.split('/')), remote))
+        deletes = []
+        rmdirs = []
+        if delete:
+            deletes = [posixpath.join(remote_dir, relative) for relative in sorted(remote_hashes)
+                       if relative not in local_files]
+            # the deepest directories first so each is empty when it is removed
+            rmdirs = [posixpath.join(remote_dir, relative)
+                      for relative in sorted((remote_dirs or set()) - local_dirs,
+                                             key=lambda name: (-name.count('/'), name))]
+        plan = SyncPlan(uploads, deletes, total, updates, rmdirs)
+
+        for local, remote in uploads:
+            self.display("upload {local} -> {remote}\n".format(local=local, remote=remote),
+                         out_stream=out_stream, verbose=verbose)
+        for local, remote in updates:
+            self.display("update {remote}\n".format(remote=remote), out_stream=out_stream, verbose=verbose)
+        for remote in deletes + rmdirs:
+            self.display("delete {remote}\n".format(remote=remote), out_stream=out_stream, verbose=verbose)
+        self.display("{count} files, {total} bytes to upload\n".format(count=len(uploads), total=total),
+                     out_stream=out_stream, verbose=verbose)
+        if dry_run:
+            return plan
+
+        sftp = self.sftp()
+        needed_dirs = set(local_dirs)
+        for local, remote in uploads:
+            relative = posixpath.relpath(posixpath.dirname(remote), remote_dir)
+            while relative not in ('', '.'):
+                needed_dirs.add(relative)
+                relative = posixpath.dirname(relative)
+        if remote_dirs is None:
+            self._makedirs(sftp, remote_dir)
+            remote_dirs = set()
+        for relative in sorted(needed_dirs - remote_dirs, key=lambda name: name.count('/')):
+            sftp.mkdir(posixpath.join(remote_dir, relative))
+        SFTPTransfer(self.transport(), channels=channels, progress=progress, preserve_times=True,
+                     scheduler=self.transfer_scheduler, host=self.address).put_files(uploads)
+        for local, remote in updates:
+            local_stat = os.stat(local)
+            sftp.chmod(remote, stat.S_IMODE(local_stat.st_mode))
+            sftp.utime(remote, (local_stat.st_atime, local_stat.st_mtime))
+        for remote in deletes:
+            sftp.remove(remote)
+        for remote in rmdirs:
+            sftp.rmdir(remote)
+        return plan
+
+    # noinspection PyMethodMayBeStatic
+    def _makedirs(self, sftp, remote_dir):
+        """create the remote directory and any missing parents"""
+        missing = []
+        while remote_dir not in ('', '/', '.'):
+            try:
+                sftp.stat(remote_dir)
+                break
+            except IOError:
+                missing.append(remote_dir)
+                remote_dir = posixpath.dirname(remote_dir)
+        for path in reversed(missing):
+            sftp.mkdir(path)
+
+    def _remote_md5sums(self, remote_dir):
+        """
+        List the remote directory's sub-directories and the md5 hash, mode and modification time of each file with
+        one command.
+
+        :param remote_dir: the remote directory
+        :type remote_dir: str
+        :returns: the relative sub-directory paths (None if remote_dir does not exist), the md5 hash by relative
+            file path and the (mode, modification time) by relative file path
+        :rtype: tuple(set[str], dict[str, str], dict[str, tuple(int, int)])
+        """
+        result = self._exec("cd {dir} && find . -type d && find . -type f -printf '%m %T@ ./%P\\n' && "
+                            "find . -type f -exec md5sum {{}} +".format(dir=quote(remote_dir)))
+        if result.exit_status != 0 and not result.stdout:
+            return None, {}, {}
+        directories = set()
+        hashes = {}
+        attrs = {}
+        for line in result.stdout.splitlines():
+            if line.startswith('./'):
+                directories.add(line[2:])
+                continue
+            match = re.match(r'([0-7]{1,4}) (\d+)(?:\.\d*)? \./(.*)$', line)
+            if match:
+                attrs[match.group(3)] = (int(match.group(1), 8), int(match.group(2)))
+                continue
+            match = re.match(r'(\\?)([0-9a-f]{32}) [ *]\./(.*)$', line)
+            if match:
+                name = match.group(3)
+                if match.group(1):
+                    # md5sum escapes file names containing a backslash or newline
+                    name = name.replace('\\n', '\n').replace('\\\\', '\\')
+                hashes[name] = match.group(2)
+        return directories, hashes, attrs
 
     def _system(self, command_line):
+        self._ensure_alive()
         self.ssh.sendline(command_line)
         self.ssh.prompt()
         buf = [self.ssh.before]
@@ -313,34 +1215,65 @@ class RemoteShell(AShell):
             buf.append(str(self.ssh.after))
         return ''.join(buf)
 
+    def _pipe(self, command_line, input_text):
+        channel = self._open_channel(command_line, combine_stderr=True)
+        try:
+            channel.sendall(input_text.encode('utf-8'))
+            channel.shutdown_write()
+            buf = []
+            for chunk in iter(lambda: channel.recv(32768), b''):
+                buf.append(chunk)
+            channel.recv_exit_status()
+            return b''.join(buf).decode('utf-8', 'replace')
+        finally:
+            channel.close()
+
     def logout(self):
         """
         Close the ssh session.
         """
-        if self.ssh:
-            self.ssh.logout()
-            self.ssh = None
+        if self._ssh:
+            self._ssh.logout()
+            self._ssh = None
+        if self._sftp_client is not None:
+            self._sftp_client.close()
+            self._sftp_client = None
+        if self._agent is not None:
+            self._agent.close()
+            self._agent = None
+        self._transport = None
+        self.transport_pool.close_all()
+
+    def _read_creds(self):
+        """
+        :returns: the credentials dictionary from the creds file, read once
+        :rtype: dict
+        """
+        if self._creds is None:
+            self._creds = {}
+            try:
+                # noinspection PyArgumentEqualDefault
+                with open(self.creds_file, 'r') as creds_file:
+                    self._creds = json.loads(creds_file.read())
+            except Exception as ex:
+                debug(str(ex))
+        return self._creds
 
     def getUserFromCredsFile(self, host):
-        # noinspection PyArgumentEqualDefault
-        with open(self.creds_file, 'r') as creds_file:
-            creds_dict = json.loads(creds_file.read())
-            if host in creds_dict:
-                if 'user' in creds_dict[host]:
-                    return creds_dict[host]['user']['name']
+        creds_dict = self._read_creds()
+        if host in creds_dict:
+            if 'user' in creds_dict[host]:
+                user = creds_dict[host]['user']
+                if isinstance(user, dict):
+                    return user.get('name')
+                return user
 
     def getPasswordFromCredsFile(self, host, user):
-        # noinspection PyArgumentEqualDefault
-        try:
-            # noinspection PyArgumentEqualDefault
-            with open(self.creds_file, 'r') as creds_file:
-                creds_dict = json.loads(creds_file.read())
-                if host in creds_dict:
-                    if 'user' in creds_dict[host]:
-                        if creds_dict[host]['user'] == user:
-                            return creds_dict[host]['password']
-        except Exception as ex:
-            debug(str(ex))
+        creds_dict = self._read_creds()
+        if host in creds_dict:
+            if 'user' in creds_dict[host]:
+                if creds_dict[host]['user'] == user:
+                    return creds_dict[host]['password']
         return None
 
     def getUser(self, host):
@@ -369,6 +1302,7 @@ class RemoteShell(AShell):
             creds_dict[host] = {}
         creds_dict[host]['user'] = user
         creds_dict[host]['password'] = password
+        self._creds = creds_dict
         mode = stat.S_IWUSR | stat.S_IRUSR
         # noinspection PyBroadException
         try:
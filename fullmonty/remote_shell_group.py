@@ -0,0 +1,298 @@
+# coding=utf-8
+
+"""
+Run commands and transfer files on many hosts at the same time.
+
+RemoteShellGroup fans each operation out to the hosts concurrently, up to *max_workers* hosts at a time, so the
+total time is about that of the slowest host instead of the sum of all of them.  Each host has it's own timeout.
+Command output is streamed as it arrives with each line tagged by it's host, and the results are collected per
+host.  Like dshbak/pssh, summarize() groups the hosts with identical output.
+
+A host may be given as "host", "host:port", "user@host" or "user@host:port".
+
+Usage
+-----
+
+.. code-block:: python
+
+    with RemoteShellGroup(['web1', 'web2', 'deploy@db1:2222'], max_workers=50, timeout=60) as group:
+        results = group.run('uptime')
+        group.print_summary(results)
+        group.put('dist/app.tar.gz', '/tmp/app.tar.gz')
+
+"""
+import os
+import sys
+import threading
+from collections import namedtuple
+
+from fullmonty.remote_shell import RemoteShell
+from fullmonty.thread_map import thread_map
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('RemoteShellGroup', 'HostResult', 'parse_host')
+
+#: the result of an operation on one host, error is the exception raised or None
+HostResult = namedtuple('HostResult', ['host', 'output', 'exit_status', 'error'])
+
+
+def parse_host(spec):
+    """
+    Split a host specification.
+
+    :param spec: "host", "host:port", "user@host" or "user@host:port"
+    :type spec: str
+    :returns: the user (None if not given), host and port (None if not given)
+    :rtype: tuple(str, str, int)
+    """
+    user = None
+    port = None
+    if '@' in spec:
+        user, spec = spec.rsplit('@', 1)
+    if spec.count(':') == 1:
+        spec, port = spec.split(':')
+        port = int(port)
+    return user, spec, port
+
+
+class RemoteShellGroup(object):
+    """
+    Concurrent operations on a group of hosts.  The RemoteShells use exec channels and connect on first use.
+
+    :param hosts: the host specifications
+    :type hosts: list[str]
+    :param max_workers: the maximum number of hosts operated on at the same time
+    :type max_workers: int
+    :param timeout: the default seconds each host is given to complete an operation, None waits forever
+    :type timeout: float
+    :param out_stream: the stream the host tagged output is written to
+    :type out_stream: file
+    :param kwargs: the other RemoteShell arguments (user, password, port, connect_timeout,...)
+    """
+
+    def __init__(self, hosts, max_workers=32, timeout=None, out_stream=sys.stdout, **kwargs):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.out_stream = out_stream
+        kwargs.setdefault('connect_timeout', 10)
+        kwargs['lazy'] = True
+        kwargs['use_channels'] = True
+        self.shells = {}
+        """:type shells: dict[str, RemoteShell]"""
+        for spec in hosts:
+            user, host, port = parse_host(spec)
+            shell_kwargs = dict(kwargs)
+            if user is not None:
+                shell_kwargs['user'] = user
+            if port is not None:
+                shell_kwargs['port'] = port
+            self.shells[spec] = RemoteShell(host, **shell_kwargs)
+        self.hosts = list(self.shells.keys())
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        """Log out of all of the hosts."""
+        for shell in self.shells.values():
+            # noinspection PyBroadException
+            try:
+                shell.logout()
+            except Exception:
+                pass
+
+    def _write(self, host, line, verbose):
+        if verbose:
+            with self._lock:
+                self.out_stream.write("{host}: {line}".format(host=host, line=line if line.endswith('\n')
+                                                              else line + '\n'))
+                self.out_stream.flush()
+
+    def _each(self, operation, timeout):
+        """
+        Call operation(host, shell) for each host concurrently.  A host that does not complete within the
+        timeout has it's connection closed, and is blocked from reconnecting until the operation returns, which
+        fails the operation.
+
+        :returns: the result of each host by host
+        :rtype: dict[str, HostResult]
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        # noinspection PyDocstring
+        def call(host):
+            shell = self.shells[host]
+            lock = threading.Lock()
+            state = {'done': False, 'expired': False}
+            message = "timed out after {timeout} seconds".format(timeout=timeout)
+
+            # noinspection PyDocstring
+            def expire():
+                with lock:
+                    if state['done']:
+                        return
+                    state['expired'] = True
+                    # the operation's lazy reconnects would otherwise carry on the work
+                    shell.connect_blocked = message
+                shell.logout()
+
+            timer = None
+            if timeout:
+                timer = threading.Timer(timeout, expire)
+                timer.daemon = True
+                timer.start()
+            try:
+                result = operation(host, shell)
+            except Exception as ex:
+                result = HostResult(host, None, None, ex)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                with lock:
+                    state['done'] = True
+                    shell.connect_blocked = None
+            if state['expired']:
+                result = result._replace(error=IOError(message))
+            return result
+
+        results = thread_map(call, self.hosts, max_workers=self.max_workers)
+        return dict(zip(self.hosts, results))
+
+    def run(self, cmd_args, env=None, timeout=None, verbose=True):
+        """
+        Run the command on each host, streaming it's output with each line tagged by the host.
+
+        :param cmd_args: list of command arguments or str command line
+        :type cmd_args: list or str
+        :param env: the environment variables for the command to use.
+        :type env: dict
+        :param timeout: seconds each host is given, defaults to the group's timeout.  The output of a host that
+            times out is kept and it's exit status is -1.
+        :type timeout: float
+        :param verbose: asserted to write the host tagged output to out_stream
+        :type verbose: bool
+        :returns: the output (stdout and stderr combined) and exit status of each host by host
+        :rtype: dict[str, HostResult]
+        """
+
+        # noinspection PyDocstring
+        def operation(host, shell):
+            lines = []
+            try:
+                for line in shell.run_generator(cmd_args, env=env, verbose=False):
+                    lines.append(line)
+                    self._write(host, line, verbose)
+            except Exception as ex:
+                return HostResult(host, ''.join(lines), -1, ex)
+            exit_status = -1 if shell.exit_status is None else shell.exit_status
+            return HostResult(host, ''.join(lines), exit_status, None)
+
+        return self._each(operation, timeout)
+
+    def put(self, files, remote_path=None, timeout=None, channels=4):
+        """
+        Copy local files to each host.
+
+        :param files: a local file, directory, or list of them
+        :type files: str or list[str]
+        :param remote_path: the remote destination, defaults to files
+        :type remote_path: str
+        :param timeout: seconds each host is given, defaults to the group's timeout
+        :type timeout: float
+        :param channels: the number of files to copy at the same time to each host
+        :type channels: int
+        :returns: the local files copied to each host by host
+        :rtype: dict[str, HostResult]
+        """
+        return self._each(lambda host, shell: HostResult(host, shell.put(files, remote_path, channels=channels),
+                                                         0, None), timeout)
+
+    def get(self, remote_path, local_dir, timeout=None, channels=4):
+        """
+        Copy remote files from each host into a directory per host, local_dir/host.
+
+        :param remote_path: a remote file, directory, or glob pattern
+        :type remote_path: str
+        :param local_dir: the local directory the host directories are created in
+        :type local_dir: str
+        :param timeout: seconds each host is given, defaults to the group's timeout
+        :type timeout: float
+        :param channels: the number of files to copy at the same time from each host
+        :type channels: int
+        :returns: the remote files copied from each host by host
+        :rtype: dict[str, HostResult]
+        """
+
+        # noinspection PyDocstring
+        def operation(host, shell):
+            host_dir = os.path.join(local_dir, host.replace(os.sep, '_'))
+            if not os.path.isdir(host_dir):
+                os.makedirs(host_dir)
+            return HostResult(host, shell.get(remote_path, host_dir, channels=channels), 0, None)
+
+        return self._each(operation, timeout)
+
+    def sync(self, local_dir, remote_dir, delete=False, dry_run=False, timeout=None, channels=4):
+        """
+        Make each host's remote directory match the local directory, see RemoteShell.sync.
+
+        :param local_dir: the local directory
+        :type local_dir: str
+        :param remote_dir: the remote directory
+        :type remote_dir: str
+        :param delete: asserted to delete remote files that are not in the local directory
+        :type delete: bool
+        :param dry_run: asserted to only plan the uploads and deletes
+        :type dry_run: bool
+        :param timeout: seconds each host is given, defaults to the group's timeout
+        :type timeout: float
+        :param channels: the number of files to upload at the same time to each host
+        :type channels: int
+        :returns: the SyncPlan of each host by host
+        :rtype: dict[str, HostResult]
+        """
+        return self._each(lambda host, shell: HostResult(host, shell.sync(local_dir, remote_dir, delete=delete,
+                                                                          dry_run=dry_run, channels=channels),
+                                                         0, None), timeout)
+
+    # noinspection PyMethodMayBeStatic
+    def summarize(self, results):
+        """
+        Group the hosts with identical results.
+
+        :param results: the results returned by an operation
+        :type results: dict[str, HostResult]
+        :returns: the hosts and their common result, the largest group first
+        :rtype: list[tuple(list[str], HostResult)]
+        """
+        groups = {}
+        for host in sorted(results):
+            result = results[host]
+            key = (repr(result.output), result.exit_status, None if result.error is None else str(result.error))
+            groups.setdefault(key, []).append(host)
+        return sorted([(hosts, results[hosts[0]]) for hosts in groups.values()], key=lambda group: -len(group[0]))
+
+    def print_summary(self, results, out_stream=None):
+        """
+        Write the identical results once under the list of their hosts, like dshbak -c.
+
+        :param results: the results returned by an operation
+        :type results: dict[str, HostResult]
+        :param out_stream: the output stream, defaults to the group's out_stream
+        :type out_stream: file
+        """
+        out_stream = out_stream or self.out_stream
+        for hosts, result in self.summarize(results):
+            out_stream.write("----------------\n{hosts}\n----------------\n".format(hosts=','.join(hosts)))
+            if result.error is not None:
+                out_stream.write("error: {error}\n".format(error=result.error))
+            if result.output:
+                output = result.output if isinstance(result.output, str) else repr(result.output)
+                out_stream.write(output if output.endswith('\n') else output + '\n')
+            if result.exit_status:
+                out_stream.write("exit status: {status}\n".format(status=result.exit_status))
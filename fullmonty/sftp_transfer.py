@@ -0,0 +1,307 @@
+# coding=utf-8
+
+"""
+Parallel, pipelined file transfers over SFTP.
+
+Remote paths are listed with *listdir_attr* so a directory or glob pattern costs one request per directory instead
+of one per file.  The files are then moved concurrently over several SFTP channels of the same transport.  Large
+downloads use read-ahead (prefetch) and uploads are pipelined so the transfer of a file is not a round trip per
+block.
+
+Usage
+-----
+
+.. code-block:: python
+
+    def report(progress):
+        print("{done}/{total} bytes {rate:.0f} B/s".format(done=progress.bytes_done, total=progress.bytes_total,
+                                                            rate=progress.throughput))
+
+    transfer = SFTPTransfer(remote.transport(), channels=8, progress=report)
+    transfer.get('/var/log/*.log', 'logs')
+    transfer.put('build', '/opt/app')
+
+"""
+import fnmatch
+import os
+import posixpath
+import stat
+import threading
+from time import time
+
+try:
+    # noinspection PyCompatibility
+    from queue import Queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from Queue import Queue
+
+from paramiko import SFTPClient
+
+from .thread_map import thread_map
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('SFTPTransfer', 'TransferProgress')
+
+#: the number of bytes read or written at a time
+BLOCK_SIZE = 32768
+
+#: files at least this size are read with prefetch
+PREFETCH_THRESHOLD = 1024 * 1024
+
+GLOB_CHARS = '*?['
+
+
+class TransferProgress(object):
+    """
+    Aggregate progress of a transfer, passed to the progress callback.
+    """
+
+    def __init__(self, files_total, bytes_total):
+        self.files_total = files_total
+        """:type files_total: int"""
+        self.bytes_total = bytes_total
+        """:type bytes_total: int"""
+        self.files_done = 0
+        """:type files_done: int"""
+        self.bytes_done = 0
+        """:type bytes_done: int"""
+        self.start_time = time()
+        """:type start_time: float"""
+
+    @property
+    def elapsed(self):
+        """seconds since the transfer started"""
+        return time() - self.start_time
+
+    @property
+    def throughput(self):
+        """bytes per second since the transfer started"""
+        elapsed = self.elapsed
+        if elapsed <= 0:
+            return 0.0
+        return self.bytes_done / elapsed
+
+
+class SFTPTransfer(object):
+    """
+    Transfer files over several SFTP channels of one transport.
+
+    :param transport: an authenticated transport
+    :type transport: paramiko.Transport
+    :param channels: the number of SFTP channels, i.e. the number of files transferred at the same time
+    :type channels: int
+    :param progress: called with a TransferProgress as data is transferred
+    :type progress: callable
+    :param preserve_times: asserted to set the access and modification times of uploaded files to the local ones
+    :type preserve_times: bool
+    :param scheduler: a scheduler shared with other transfers that queues the files smallest first and caps the
+        bandwidth used
+    :type scheduler: fullmonty.transfer_scheduler.TransferScheduler
+    :param host: the name of the remote host the scheduler's per host cap and throughput are kept by
+    :type host: str
+    """
+
+    def __init__(self, transport, channels=4, progress=None, preserve_times=False, scheduler=None, host=None):
+        self.transport = transport
+        self.channels = max(1, channels)
+        self.progress = progress
+        self.preserve_times = preserve_times
+        self.scheduler = scheduler
+        self.host = host
+        self._lock = threading.Lock()
+
+    def list_remote(self, remote_path, sftp=None):
+        """
+        Find the remote files for the remote path.  The path may be a file, a directory (walked recursively), or
+        a glob pattern in the last path component.
+
+        :param remote_path: the remote path
+        :type remote_path: str
+        :param sftp: the sftp client to use, a new one is opened if None
+        :type sftp: paramiko.SFTPClient
+        :returns: the remote root directory and the (path, size) of each file under it
+        :rtype: tuple(str, list[tuple(str, int)])
+        """
+        sftp = sftp or SFTPClient.from_transport(self.transport)
+        dir_name, base_name = posixpath.split(remote_path)
+        if any(char in base_name for char in GLOB_CHARS):
+            files = []
+            for attr in sftp.listdir_attr(dir_name or '.'):
+                if fnmatch.fnmatch(attr.filename, base_name):
+                    path = posixpath.join(dir_name, attr.filename)
+                    if stat.S_ISDIR(attr.st_mode):
+                        files.extend(self._walk_remote(sftp, path))
+                    else:
+                        files.append((path, attr.st_size))
+            return dir_name, files
+        attr = sftp.stat(remote_path)
+        if stat.S_ISDIR(attr.st_mode):
+            return dir_name, self._walk_remote(sftp, remote_path)
+        return dir_name, [(remote_path, attr.st_size)]
+
+    def _walk_remote(self, sftp, remote_dir):
+        files = []
+        for attr in sftp.listdir_attr(remote_dir):
+            path = posixpath.join(remote_dir, attr.filename)
+            if stat.S_ISDIR(attr.st_mode):
+                files.extend(self._walk_remote(sftp, path))
+            else:
+                files.append((path, attr.st_size))
+        return files
+
+    def get(self, remote_path, local_path):
+        """
+        Copy remote files to the local system.
+
+        When a single file is copied and local_path is not a directory, the file is copied to local_path.
+        Otherwise the files are copied into the local_path directory keeping their paths relative to the
+        remote path's directory.
+
+        :param remote_path: a remote file, directory, or glob pattern
+        :type remote_path: str
+        :param local_path: the local destination
+        :type local_path: str
+        :returns: the remote files copied
+        :rtype: list[str]
+        """
+        sftp = SFTPClient.from_transport(self.transport)
+        root, files = self.list_remote(remote_path, sftp=sftp)
+        if len(files) == 1 and files[0][0] == remote_path and not os.path.isdir(local_path):
+            pairs = [(files[0][0], local_path, files[0][1])]
+        else:
+            pairs = [(path, os.path.join(local_path, *posixpath.relpath(path, root or '.').split('/')), size)
+                     for path, size in files]
+        for directory in sorted(set(os.path.dirname(local) for remote, local, size in pairs)):
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+        self._transfer(pairs, self._get_file, first_client=sftp)
+        return [remote for remote, local, size in pairs]
+
+    def put(self, local_path, remote_path):
+        """
+        Copy local files to the remote system.
+
+        When a single file is copied and remote_path is not a remote directory, the file is copied to remote_path.
+        A directory is copied into remote_path if it is an existing remote directory, otherwise remote_path
+        becomes the copy of the directory.
+
+        :param local_path: a local file, directory, or list of them
+        :type local_path: str or list[str]
+        :param remote_path: the remote destination
+        :type remote_path: str
+        :returns: the local files copied
+        :rtype: list[str]
+        """
+        sftp = SFTPClient.from_transport(self.transport)
+        local_paths = [local_path] if isinstance(local_path, str) else list(local_path)
+        remote_is_dir = self._remote_is_dir(sftp, remote_path)
+        pairs = []
+        directories = []
+        for path in local_paths:
+            if os.path.isdir(path):
+                root = posixpath.join(remote_path, os.path.basename(os.path.normpath(path))) \
+                    if remote_is_dir else remote_path
+                for dir_path, dir_names, file_names in os.walk(path):
+                    relative = os.path.relpath(dir_path, path)
+                    remote_dir = root if relative == '.' else posixpath.join(root, *relative.split(os.sep))
+                    directories.append(remote_dir)
+                    for name in file_names:
+                        local = os.path.join(dir_path, name)
+                        pairs.append((local, posixpath.join(remote_dir, name), os.path.getsize(local)))
+            elif remote_is_dir or len(local_paths) > 1:
+                pairs.append((path, posixpath.join(remote_path, os.path.basename(path)), os.path.getsize(path)))
+            else:
+                pairs.append((path, remote_path, os.path.getsize(path)))
+        for directory in directories:
+            if not self._remote_is_dir(sftp, directory):
+                sftp.mkdir(directory)
+        self._transfer(pairs, self._put_file, first_client=sftp)
+        return [local for local, remote, size in pairs]
+
+    def put_files(self, pairs):
+        """
+        Copy each local file to it's remote path.  The remote directories must already exist.
+
+        :param pairs: the (local path, remote path) of each file
+        :type pairs: list[tuple(str, str)]
+        """
+        self._transfer([(local, remote, os.path.getsize(local)) for local, remote in pairs], self._put_file)
+
+    # noinspection PyMethodMayBeStatic
+    def _remote_is_dir(self, sftp, remote_path):
+        try:
+            return stat.S_ISDIR(sftp.stat(remote_path).st_mode)
+        except IOError:
+            return False
+
+    def _transfer(self, pairs, copy_file, first_client=None):
+        """
+        Copy each (source, destination, size) with copy_file(sftp, source, destination, size, progress) using
+        up to *channels* sftp clients at the same time.  With a scheduler the smallest files are copied first, each
+        in one of the scheduler's slots.
+        """
+        if self.scheduler is not None:
+            pairs = sorted(pairs, key=lambda pair: pair[2])
+        progress = TransferProgress(len(pairs), sum(size for source, destination, size in pairs))
+        clients = Queue()
+        workers = min(self.channels, len(pairs)) or 1
+        opened = []
+        for index in range(workers):
+            client = first_client if index == 0 and first_client is not None \
+                else SFTPClient.from_transport(self.transport)
+            opened.append(client)
+            clients.put(client)
+
+        # noinspection PyDocstring
+        def copy(pair):
+            client = clients.get()
+            try:
+                if self.scheduler is None:
+                    copy_file(client, pair[0], pair[1], pair[2], progress)
+                else:
+                    with self.scheduler.slot(self.host, pair[2]):
+                        copy_file(client, pair[0], pair[1], pair[2], progress)
+            finally:
+                clients.put(client)
+            with self._lock:
+                progress.files_done += 1
+            self._report(progress)
+
+        try:
+            thread_map(copy, pairs, max_workers=workers)
+        finally:
+            for client in opened:
+                client.close()
+
+    def _get_file(self, sftp, remote, local, size, progress):
+        with sftp.open(remote, 'rb') as remote_file:
+            if size >= PREFETCH_THRESHOLD:
+                remote_file.prefetch(size)
+            with open(local, 'wb') as local_file:
+                for data in iter(lambda: remote_file.read(BLOCK_SIZE), b''):
+                    local_file.write(data)
+                    self._advance(progress, len(data))
+
+    def _put_file(self, sftp, local, remote, size, progress):
+        with open(local, 'rb') as local_file:
+            with sftp.open(remote, 'wb') as remote_file:
+                remote_file.set_pipelined(True)
+                for data in iter(lambda: local_file.read(BLOCK_SIZE), b''):
+                    remote_file.write(data)
+                    self._advance(progress, len(data))
+        local_stat = os.stat(local)
+        sftp.chmod(remote, stat.S_IMODE(local_stat.st_mode))
+        if self.preserve_times:
+            sftp.utime(remote, (local_stat.st_atime, local_stat.st_mtime))
+
+    def _advance(self, progress, count):
+        if self.scheduler is not None:
+            self.scheduler.throttle(self.host, count)
+        with self._lock:
+            progress.bytes_done += count
+        self._report(progress)
+
+    def _report(self, progress):
+        if self.progress is not None:
+            self.progress(progress)
@@ -1,39 +1,405 @@
 # coding=utf-8
 """
 A simple logger that supports multiple output streams on a per level basis.
+
+A message at a level without output streams is discarded before anything is formatted, so the arguments of
+a message are best passed separately to be %-formatted only when it is emitted::
+
+    debug("read %d bytes from %s", count, path)
+
+Components are dotted names with their own lowest output level, inherited down the hierarchy, so one subsystem
+can be debugged without the rest::
+
+    Logger.set_component_level('remote', 'debug')
+    Logger.component('remote.sftp').debug("opened %s", path)
 """
+import atexit
+import gzip
+import json
+import os
+import shutil
 import sys
+import threading
+import weakref
 
-from time import strftime, time, localtime
+from time import gmtime, strftime, time, localtime
 import traceback
+from collections import deque
 
 __docformat__ = 'restructuredtext en'
-__all__ = ('FileLogger', 'SimpleLogger', 'Logger', 'debug', 'info', 'warning', 'error', 'fatal', 'progress', 'flush')
+__all__ = ('FileLogger', 'SimpleLogger', 'ComponentLogger', 'AsyncWriter', 'OVERFLOW_BLOCK', 'OVERFLOW_DROP_OLDEST',
+           'OVERFLOW_DROP', 'Logger', 'debug', 'info', 'warning', 'error', 'fatal', 'progress', 'flush')
 
 STEP = '.'
 
+#: the most (component, level) entries in a logger's dispatch table before it is cleared
+DISPATCH_LIMIT = 4096
+
+#: the keys of a JSON record that set_json fields and extra fields may not use
+_JSON_RESERVED = frozenset(('timestamp', 'level', 'component', 'message', 'exception', 'traceback'))
+
+#: the open FileLoggers, closed at exit
+_file_loggers = weakref.WeakSet()
+
+#: the running AsyncWriters, stopped at exit
+_async_writers = weakref.WeakSet()
+
+
+def _shutdown():
+    """at exit, write the queued messages then close the FileLoggers they may be written to"""
+    for writer in list(_async_writers):
+        writer.stop()
+    for file_logger in list(_file_loggers):
+        file_logger.close()
+
+
+atexit.register(_shutdown)
+
 
 class FileLogger(object):
-    """ Very basic file logger class that simply appends messages to a file """
+    """
+    File logger that appends messages to a file through a persistent buffered handle.
+
+    The buffer is written when it holds *buffer_size* bytes, by a timer *flush_interval* seconds after a message
+    is buffered, on *flush* and on *close* (also called at exit).  The file is rotated when it reaches *max_bytes*
+    or every *rotate_interval* seconds, keeping *backup_count* generations named filename.1 (the newest) to
+    filename.N, which are gzipped in a background thread if *compress* is asserted.
+
+    :param filename: the log file
+    :type filename: str
+    :param mode: 'w' to truncate the file or 'a' to append to it
+    :type mode: str
+    :param max_bytes: rotate the file when it reaches this size, 0 to not rotate by size
+    :type max_bytes: int
+    :param rotate_interval: rotate the file every this many seconds, 0 to not rotate by time
+    :type rotate_interval: float
+    :param backup_count: the number of rotated files kept.  With 0 no rotated file is kept, the file is truncated
+        when it is rotated and it's messages are lost.
+    :type backup_count: int
+    :param compress: asserted to gzip the rotated files
+    :type compress: bool
+    :param buffer_size: the bytes buffered before writing to the file
+    :type buffer_size: int
+    :param flush_interval: the most seconds a message stays buffered.  None only writes the buffer when it is
+        full or flushed.
+    :type flush_interval: float
+    """
 
-    def __init__(self, filename):
+    def __init__(self, filename, mode='w', max_bytes=0, rotate_interval=0, backup_count=5, compress=False,
+                 buffer_size=65536, flush_interval=1.0):
+        if backup_count < 0:
+            raise ValueError("backup_count must not be negative: {count}".format(count=backup_count))
         self.filename = filename
-        fh = open(self.filename, 'w')
-        fh.close()
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._compressor = None
+        self._flush_timer = None
+        self._file = None
+        self._open(mode)
+        _file_loggers.add(self)
+
+    def _open(self, mode):
+        self._file = open(self.filename, mode + 'b', self.buffer_size)
+        self._size = self._file.tell() if mode == 'a' else 0
+        self._last_flush = time()
+        self._rollover_at = time() + self.rotate_interval if self.rotate_interval else None
 
     def write(self, buf):
         """append message to a file
         :param buf: message to write
         """
-        with open(self.filename, 'a') as output:
-            output.write(buf)
+        data = buf.encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._open('a')
+            if (self.max_bytes and self._size and self._size + len(data) > self.max_bytes) or \
+                    (self._rollover_at is not None and time() >= self._rollover_at):
+                self.rotate()
+            self._file.write(data)
+            self._size += len(data)
+            if self.flush_interval is not None:
+                if time() - self._last_flush >= self.flush_interval:
+                    self._flush()
+                elif self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
 
-    # noinspection PyMethodMayBeStatic
     def flush(self):
-        """do nothing"""
+        """write the buffered messages to the file"""
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def _flush(self):
+        self._file.flush()
+        self._last_flush = time()
+        self._cancel_flush_timer()
+
+    def _cancel_flush_timer(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def close(self):
+        """flush and close the file, a later write reopens it for appending"""
+        with self._lock:
+            self._cancel_flush_timer()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self._compressor is not None:
+            self._compressor.join()
+
+    def _generation(self, index):
+        """:returns: the existing path of the rotated file generation or None"""
+        for path in ['{0}.{1}'.format(self.filename, index), '{0}.{1}.gz'.format(self.filename, index)]:
+            if os.path.exists(path):
+                return path
+        return None
+
+    def rotate(self):
+        """Close the file, shift the rotated generations, then start a new file."""
+        with self._lock:
+            self._cancel_flush_timer()
+            if self._file is not None:
+                self._file.close()
+            if self._compressor is not None:
+                # the previous generation is renamed below
+                self._compressor.join()
+                self._compressor = None
+            if self.backup_count > 0:
+                oldest = self._generation(self.backup_count)
+                if oldest is not None:
+                    os.remove(oldest)
+                for index in range(self.backup_count - 1, 0, -1):
+                    path = self._generation(index)
+                    if path is not None:
+                        os.rename(path, path.replace('{0}.{1}'.format(self.filename, index),
+                                                     '{0}.{1}'.format(self.filename, index + 1), 1))
+                rotated = '{0}.1'.format(self.filename)
+                os.rename(self.filename, rotated)
+                if self.compress:
+                    self._compressor = threading.Thread(target=_gzip_file, args=(rotated,))
+                    self._compressor.daemon = True
+                    self._compressor.start()
+            self._open('w')
+
+
+def _gzip_file(path):
+    """replace the file with a gzipped copy, path.gz"""
+    with open(path, 'rb') as in_file:
+        with gzip.open(path + '.gz', 'wb') as out_file:
+            shutil.copyfileobj(in_file, out_file)
+    os.remove(path)
+
+
+def _notify_after(method):
+    """wrap a mutating method to call the object's *_changed* after it"""
+
+    # noinspection PyDocstring
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._changed()
+        return result
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class _Outputters(list):
+    """
+    The output streams of a level, changes call *changed*.
+
+    :param streams: the streams
+    :type streams: list
+    :param changed: called after the list is changed
+    :type changed: callable
+    """
+
+    def __init__(self, streams, changed):
+        super(_Outputters, self).__init__(streams)
+        self._changed = changed
+
+    append = _notify_after(list.append)
+    extend = _notify_after(list.extend)
+    insert = _notify_after(list.insert)
+    remove = _notify_after(list.remove)
+    pop = _notify_after(list.pop)
+    sort = _notify_after(list.sort)
+    reverse = _notify_after(list.reverse)
+    __setitem__ = _notify_after(list.__setitem__)
+    __delitem__ = _notify_after(list.__delitem__)
+    __iadd__ = _notify_after(list.__iadd__)
+    __imul__ = _notify_after(list.__imul__)
+    if hasattr(list, 'clear'):
+        clear = _notify_after(list.clear)
+    if hasattr(list, '__setslice__'):
+        # python2 slice assignment
+        __setslice__ = _notify_after(list.__setslice__)
+        __delslice__ = _notify_after(list.__delslice__)
+
+
+class _LevelOutputters(dict):
+    """
+    The output streams of each level, changes to the dictionary or to a level's list call *changed*.
+
+    :param outputters: the streams of each level
+    :type outputters: dict[str, list]
+    :param changed: called after the dictionary or a list is changed
+    :type changed: callable
+    """
+
+    def __init__(self, outputters, changed):
+        super(_LevelOutputters, self).__init__()
+        self._changed = changed
+        for level, streams in outputters.items():
+            dict.__setitem__(self, level, _Outputters(streams, changed))
+
+    def __setitem__(self, level, streams):
+        dict.__setitem__(self, level, _Outputters(streams, self._changed))
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        for level, streams in dict(*args, **kwargs).items():
+            self[level] = streams
+
+    def setdefault(self, level, streams=None):
+        if level not in self:
+            self[level] = [] if streams is None else streams
+        return self[level]
+
+    __delitem__ = _notify_after(dict.__delitem__)
+    pop = _notify_after(dict.pop)
+    popitem = _notify_after(dict.popitem)
+    clear = _notify_after(dict.clear)
+
+
+#: serializes a JSON value on one line, values that are not JSON types are serialized as their str
+_json_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str).encode
+
+#: overflow policies of the asynchronous writer's queue
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_DROP = 'drop'
+
+
+def _report_write_error(outputter):
+    """write the exception raised writing to the outputter to stderr"""
+    # noinspection PyBroadException
+    try:
+        sys.stderr.write("AsyncWriter: writing to {outputter!r} failed\n".format(outputter=outputter))
+        traceback.print_exc(file=sys.stderr)
+    except Exception:
         pass
 
 
+class AsyncWriter(object):
+    """
+    Writes the formatted messages of a SimpleLogger to their streams on a background thread.
+
+    The messages are queued, up to *queue_size* of them, and the thread writes them in batches of up to
+    *batch_size*.  When the queue is full the *overflow* policy either blocks the caller (OVERFLOW_BLOCK), drops
+    the oldest queued message (OVERFLOW_DROP_OLDEST) or drops the new message (OVERFLOW_DROP), the dropped messages
+    being counted in *dropped*.
+
+    :param queue_size: the most messages queued
+    :type queue_size: int
+    :param overflow: OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST or OVERFLOW_DROP
+    :type overflow: str
+    :param batch_size: the most messages written at a time
+    :type batch_size: int
+    """
+
+    def __init__(self, queue_size=10000, overflow=OVERFLOW_BLOCK, batch_size=256):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP):
+            raise ValueError("unknown overflow policy: {overflow}".format(overflow=overflow))
+        self.queue_size = max(1, queue_size)
+        self.overflow = overflow
+        self.batch_size = max(1, batch_size)
+        self.dropped = 0
+        """:type dropped: int"""
+        self._records = deque()
+        self._writing = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='AsyncWriter')
+        self._thread.daemon = True
+        self._thread.start()
+        _async_writers.add(self)
+
+    def put(self, outputters, line):
+        """
+        Queue the message for the streams.
+
+        :param outputters: the streams
+        :type outputters: list
+        :param line: the formatted message
+        :type line: str
+        """
+        with self._condition:
+            if len(self._records) >= self.queue_size and not self._stopped:
+                if self.overflow == OVERFLOW_DROP:
+                    self.dropped += 1
+                    return
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._records.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._records) >= self.queue_size and not self._stopped:
+                        self._condition.wait()
+            if not self._stopped:
+                self._records.append((outputters, line))
+                self._condition.notify_all()
+                return
+        # after the writer has stopped at exit, write inline
+        for outputter in outputters:
+            outputter.write(line)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._records and not self._stopped:
+                    self._condition.wait()
+                if not self._records:
+                    return
+                batch = [self._records.popleft() for _ in range(min(self.batch_size, len(self._records)))]
+                self._writing = len(batch)
+                # the callers blocked on a full queue may continue
+                self._condition.notify_all()
+            for outputters, line in batch:
+                for outputter in outputters:
+                    # noinspection PyBroadException
+                    try:
+                        outputter.write(line)
+                    except Exception:
+                        # there is no caller to raise to
+                        _report_write_error(outputter)
+            with self._condition:
+                self._writing = 0
+                self._condition.notify_all()
+
+    def drain(self):
+        """Wait for the queued messages to be written."""
+        with self._condition:
+            while (self._records or self._writing) and self._thread.is_alive():
+                self._condition.wait(0.1)
+
+    def stop(self):
+        """Write the queued messages then stop the thread."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+        _async_writers.discard(self)
+
+
 class SimpleLogger(object):
     """
     A simple logger that supports multiple output streams on a per level basis.
@@ -57,6 +423,20 @@ class SimpleLogger(object):
         self.last_message_time = time()
         self.trace_level = 'error'
         self.verbosity = 2
+        self.levels = ['debug', 'info', 'warning', 'error', 'fatal']
+        self.component_levels = {}
+        """:type component_levels: dict[str, str]"""
+        self._dispatch = {}
+        self._component_loggers = {}
+        self._timestamp_second = None
+        self._timestamp = ''
+        self._writer = None
+        self.json_output = False
+        self._json_fields = ''
+        self._json_field_names = frozenset()
+        self._json_timestamp = (None, '')
+        self._json_components = {}
+        self._json_levels = dict((level, ',"level":"{level}"'.format(level=level)) for level in self.levels)
         self.log_outputter = {
             'debug': [],
             'info': [out_stream],
@@ -64,7 +444,162 @@ class SimpleLogger(object):
             'error': [err_stream],
             'fatal': [err_stream],
         }
-        self.levels = ['debug', 'info', 'warning', 'error', 'fatal']
+
+    @property
+    def log_outputter(self):
+        """
+        The output streams of each level.  Changes to the dictionary or to a level's list take effect with the
+        next message.
+
+        The dictionary and the lists assigned to it are copied, so change them through this attribute.  Changing a
+        list after assigning it, as in ``streams = [out]; Logger.log_outputter = {'info': streams};
+        streams.append(other)``, no longer affects the logger.
+
+        :rtype: dict[str, list]
+        """
+        return self._log_outputter
+
+    @log_outputter.setter
+    def log_outputter(self, value):
+        self._log_outputter = _LevelOutputters(value, self.update_levels)
+        self.update_levels()
+
+    def update_levels(self):
+        """
+        Clear the dispatch table of the output streams by component and level, it is rebuilt as messages are
+        output.  The levels without any streams are discarded without formatting.  Called when log_outputter
+        changes, call it after changing component_levels directly.
+        """
+        self._dispatch = {}
+
+    def _outputters(self, level, component):
+        """
+        Resolve the output streams of the level for the component.  The threshold of the component's longest
+        dotted prefix in component_levels applies: levels below it have no streams, levels at or above it the
+        level's streams or out_stream if the level has none.  Without a threshold the level's streams are used.
+
+        :returns: the output streams
+        :rtype: list
+        """
+        # update_levels may replace the table while resolving, the result then lands in the discarded table
+        dispatch = self._dispatch
+        key = (None if component is None else str(component), level)
+        outputters = dispatch.get(key)
+        if outputters is None:
+            outputters = self._log_outputter.get(level, [])
+            if component and self.component_levels:
+                name = str(component)
+                while name:
+                    if name in self.component_levels:
+                        if self.levels.index(level) < self.levels.index(self.component_levels[name]):
+                            outputters = []
+                        elif not outputters:
+                            outputters = [self.out_stream]
+                        break
+                    name = name.rpartition('.')[0]
+            if len(dispatch) >= DISPATCH_LIMIT:
+                # many distinct components, start over rather than grow without limit
+                dispatch.clear()
+            dispatch[key] = outputters
+        return outputters
+
+    def is_enabled(self, level, component=None):
+        """
+        :param level: the log level ('debug', 'info', 'warning', 'error', 'fatal')
+        :type level: str
+        :param component: the component, defaults to the current component
+        :type component: str
+        :returns: True if messages at the level are output
+        :rtype: bool
+        """
+        return bool(self._outputters(level, self.current_component if component is None else component))
+
+    def set_component_level(self, component, level=None):
+        """
+        Set the lowest level output for a component and the components below it in the dotted hierarchy, for
+        example 'debug' for 'remote' applies to 'remote.sftp' unless 'remote.sftp' has its own level.
+
+        :param component: the dotted component name
+        :type component: str
+        :param level: the log level ('debug', 'info', 'warning', 'error', 'fatal') or None to use the global levels
+        :type level: str
+        """
+        if level is None:
+            self.component_levels.pop(component, None)
+        else:
+            if level not in self.levels:
+                raise ValueError("unknown level: {level}".format(level=level))
+            self.component_levels[component] = level
+        self.update_levels()
+
+    def component(self, name):
+        """
+        A logger for the component that shares this logger's configuration and streams.
+
+        Usage::
+
+            log = Logger.component('remote.sftp')
+            log.debug("opened %s", path)
+
+        :param name: the dotted component name
+        :type name: str
+        :rtype: ComponentLogger
+        """
+        component_logger = self._component_loggers.get(name)
+        if component_logger is None:
+            component_logger = self._component_loggers[name] = ComponentLogger(self, name)
+        return component_logger
+
+    def set_async(self, enable=True, queue_size=10000, overflow=OVERFLOW_BLOCK, batch_size=256):
+        """
+        Set asynchronous mode.  The messages are formatted in the caller's thread then written to the streams by
+        an AsyncWriter's thread, so a slow stream does not block the caller.  The queued messages are written by
+        *flush* and at exit.
+
+        :param enable: asserted to write on a background thread, else the queued messages are written and
+            messages are written inline again
+        :type enable: bool
+        :param queue_size: the most messages queued
+        :type queue_size: int
+        :param overflow: the policy when the queue is full, OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST or OVERFLOW_DROP
+        :type overflow: str
+        :param batch_size: the most messages written at a time
+        :type batch_size: int
+        """
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer = None
+        if enable:
+            self._writer = AsyncWriter(queue_size=queue_size, overflow=overflow, batch_size=batch_size)
+
+    @property
+    def dropped(self):
+        """the number of messages the asynchronous writer dropped because it's queue was full"""
+        return self._writer.dropped if self._writer is not None else 0
+
+    def set_json(self, enable=True, **fields):
+        """
+        Set JSON lines mode, each message is output as one JSON object per line instead of text.  The keys are in
+        a fixed order: timestamp (UTC ISO 8601), level, component, message, exception (the chained exceptions),
+        traceback, the fields given here, then the extra fields of the message::
+
+            {"timestamp":"2016-01-02T03:04:05.678Z","level":"info","message":"started","host":"web1"}
+
+        Neither these fields nor the extra fields of a message may use the keys above, a ValueError is raised
+        instead of writing a duplicate key.  Progress output is skipped in JSON mode.
+
+        :param enable: asserted to output JSON
+        :type enable: bool
+        :param fields: the fields added to every record, serialized once here
+        :raises ValueError: a field uses a reserved key
+        """
+        reserved = _JSON_RESERVED.intersection(fields)
+        if reserved:
+            raise ValueError("reserved JSON keys: {keys}".format(keys=', '.join(sorted(reserved))))
+        self.json_output = enable
+        self._json_field_names = frozenset(fields)
+        self._json_fields = ''.join(',{key}:{value}'.format(key=_json_encode(key), value=_json_encode(fields[key]))
+                                    for key in sorted(fields))
 
     def add_logger(self, logger):
         """
@@ -168,12 +703,14 @@ class SimpleLogger(object):
         """
         self.show_level = show_level
 
-    def _output_prefix(self, level):
+    def _output_prefix(self, level, component=None):
         """
         generate the prefix for a log message
 
         :param level: the log level ('debug', 'info', 'warning', 'error', 'fatal')
         :type level: str
+        :param component: the component of the message
+        :type component: str
         :returns: the prefix for a log message
         :rtype: str
         """
@@ -184,18 +721,107 @@ class SimpleLogger(object):
 
         buf = []
         if self.enable_timestamp:
-            buf.append("{now} ".format(now=strftime("%H:%M:%S", localtime(now))))
+            second = int(now)
+            if second != self._timestamp_second:
+                self._timestamp_second = second
+                self._timestamp = "{now} ".format(now=strftime("%H:%M:%S", localtime(now)))
+            buf.append(self._timestamp)
         if self.enable_elapsed_time:
             buf.append("%.3f " % diff_time)
         if self.show_level:
             buf.append("{level}:  ".format(level=level.upper()))
-        if self.current_component:
-            buf.append("[{component}]  ".format(component=str(self.current_component)))
+        if component:
+            buf.append("[{component}]  ".format(component=str(component)))
+        return ''.join(buf)
+
+    # noinspection PyMethodMayBeStatic
+    def _exception_chain(self, message):
+        """:returns: the str of each exception the message's exception was raised from or during"""
+        chained = []
+        # support python3 chained exceptions
+        for chain in ['__cause__', '__context__']:
+            exc = getattr(message, chain, None)
+            while exc is not None:
+                chained.append(str(exc))
+                exc = getattr(exc, chain, None)
+        return chained
+
+    def _traceback(self, level, message):
+        """:returns: the traceback lines for Exception messages where the message level >= trace_level"""
+        if isinstance(message, Exception):
+            if self.levels.index(level) >= self.levels.index(self.trace_level):
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                return traceback.format_exception(exc_type, exc_value, exc_traceback)
+        return []
+
+    def _text_line(self, level, message, text, newline, component):
+        """:returns: the message as text with the configured prefix"""
+        buf = []
+        if newline and not self.previous_newline:
+            buf.append("\n")
+        self.previous_newline = newline
+        buf.append(self._output_prefix(level, component))
+        buf.append(text)
+        for chained in self._exception_chain(message):
+            buf.append(' - ')
+            buf.append(chained)
+        buf.extend(self._traceback(level, message))
+        if newline:
+            buf.append("\n")
         return ''.join(buf)
 
-    def _output(self, level, message, newline=True):
+    def _json_line(self, level, message, text, extra, component):
         """
-        Assemble the message and send it to the appropriate stream(s).
+        :returns: the message as a JSON object on one line.  The keys are in a fixed order: timestamp, level,
+            component, message, exception, traceback, the fields set with set_json, then the message's extra fields.
+        :rtype: str
+        :raises ValueError: an extra field uses a reserved key or the key of a set_json field
+        """
+        if extra:
+            duplicates = _JSON_RESERVED.union(self._json_field_names).intersection(extra)
+            if duplicates:
+                raise ValueError("duplicate JSON keys: {keys}".format(keys=', '.join(sorted(duplicates))))
+        now = time()
+        second = int(now)
+        # the (second, prefix) and component caches are read and replaced whole, so threads can share them
+        cached_second, timestamp = self._json_timestamp
+        if second != cached_second:
+            timestamp = strftime('{"timestamp":"%Y-%m-%dT%H:%M:%S', gmtime(now))
+            self._json_timestamp = (second, timestamp)
+        buf = [timestamp, '.%03dZ"' % ((now - second) * 1000), self._json_levels[level]]
+        if component:
+            name = str(component)
+            encoded = self._json_components.get(name)
+            if encoded is None:
+                if len(self._json_components) >= DISPATCH_LIMIT:
+                    self._json_components = {}
+                encoded = ',"component":' + _json_encode(name)
+                self._json_components[name] = encoded
+            buf.append(encoded)
+        buf.append(',"message":')
+        buf.append(_json_encode(text))
+        chained = self._exception_chain(message)
+        if chained:
+            buf.append(',"exception":')
+            buf.append(_json_encode(chained))
+        trace = self._traceback(level, message)
+        if trace:
+            buf.append(',"traceback":')
+            buf.append(_json_encode(''.join(trace)))
+        buf.append(self._json_fields)
+        if extra:
+            for key in sorted(extra):
+                buf.append(',')
+                buf.append(_json_encode(key))
+                buf.append(':')
+                buf.append(_json_encode(extra[key]))
+        buf.append('}\n')
+        return ''.join(buf)
+
+    def _output(self, level, message, newline=True, args=(), extra=None, component=None):
+        """
+        Assemble the message and send it to the appropriate stream(s).  Nothing is done when the level has no
+        streams.
 
         Configuration attributes:
 
@@ -208,10 +834,14 @@ class SimpleLogger(object):
         * self.show_level
           Output the message level in this message.
         * self.current_component
-          Output the current_component in this message.
+          Output the current_component, unless the message has its own component, in this message.
+        * self.component_levels
+          The lowest level output by each component, see set_component_level.
         * self.trace_level
           If the message is an exception and the message level is equal to or greater than the trace_level, then
           output a back trace in this message.
+        * self.json_output
+          Output the message as a JSON object instead of text, see set_json.
 
         :param level: the log level ('debug', 'info', 'warning', 'error', 'fatal')
         :type level: str
@@ -219,40 +849,39 @@ class SimpleLogger(object):
         :type message: str
         :param newline: if asserted then append a newline to the end of the message
         :type newline: bool
+        :param args: the arguments the message is %-formatted with, if any
+        :type args: tuple
+        :param extra: the fields added to the record in JSON mode
+        :type extra: dict
+        :param component: the component of the message, defaults to the current component
+        :type component: str
         """
-
-        buf = []
-        if newline and not self.previous_newline:
-            buf.append("\n")
-        self.previous_newline = newline
-        buf.append(self._output_prefix(level))
-        buf.append(str(message))
-
-        # support python3 chained exceptions
-        for chain in ['__cause__', '__context__']:
-            exc = getattr(message, chain, None)
-            while exc is not None:
-                buf.append(' - ')
-                buf.append(str(exc))
-                exc = getattr(exc, chain, None)
-
-        # add traceback for Exception messages where the message level >= trace_level
-        if isinstance(message, Exception):
-            if self.levels.index(level) >= self.levels.index(self.trace_level):
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                buf.extend(traceback.format_exception(exc_type, exc_value, exc_traceback))
-
-        if newline:
-            buf.append("\n")
-        line = ''.join(buf)
-        for outputter in self.log_outputter[level]:
+        if component is None:
+            component = self.current_component
+        outputters = self._dispatch.get((None if component is None else str(component), level))
+        if outputters is None:
+            outputters = self._outputters(level, component)
+        if not outputters:
+            return
+        text = str(message) % args if args else str(message)
+        if self.json_output:
+            line = self._json_line(level, message, text, extra, component)
+        else:
+            line = self._text_line(level, message, text, newline, component)
+        if self._writer is not None:
+            self._writer.put(outputters, line)
+            return
+        for outputter in outputters:
             outputter.write(line)
 
     def flush(self):
         """
-        flush the output streams.
+        flush the output streams, after writing the queued messages in asynchronous mode.
         """
-        for stream in set([strm for strm_list in self.log_outputter.values() for strm in strm_list]):
+        if self._writer is not None:
+            self._writer.drain()
+        strm_lists = list(self.log_outputter.values()) + list(self._dispatch.values())
+        for stream in set([strm for strm_list in strm_lists for strm in strm_list]):
             try:
                 stream.flush()
             except AttributeError:
@@ -260,59 +889,128 @@ class SimpleLogger(object):
 
     def progress(self, message=STEP):
         """
-        Progress usually displays a dot ('.') each time it is called.
+        Progress usually displays a dot ('.') each time it is called.  Nothing is output in JSON mode.
         :param message: progress character
         :type message: str
         """
-        self._output('info', message, newline=False)
+        if not self.json_output:
+            self._output('info', message, newline=False)
 
-    def debug(self, message):
+    def debug(self, message, *args, **extra):
         """
         Debug message.
 
         :param message: the message to emit
         :type message: object that can be converted to a string using str()
+        :param args: the arguments the message is %-formatted with, only when it is emitted
+        :param extra: the fields added to the record in JSON mode
         """
-        self._output('debug', message)
+        self._output('debug', message, args=args, extra=extra)
 
-    def info(self, message):
+    def info(self, message, *args, **extra):
         """
         Info message.
 
         :param message: the message to emit
         :type message: object that can be converted to a string using str()
+        :param args: the arguments the message is %-formatted with, only when it is emitted
+        :param extra: the fields added to the record in JSON mode
         """
-        self._output('info', message)
+        self._output('info', message, args=args, extra=extra)
 
-    def warning(self, message):
+    def warning(self, message, *args, **extra):
         """
         Warning message.
 
         :param message: the message to emit
         :type message: object that can be converted to a string using str()
+        :param args: the arguments the message is %-formatted with, only when it is emitted
+        :param extra: the fields added to the record in JSON mode
         """
-        self._output('warning', message)
+        self._output('warning', message, args=args, extra=extra)
 
-    def error(self, message):
+    def error(self, message, *args, **extra):
         """
         Error message.
 
         :param message: the message to emit
         :type message: object that can be converted to a string using str()
+        :param args: the arguments the message is %-formatted with, only when it is emitted
+        :param extra: the fields added to the record in JSON mode
         """
-        self._output('error', message)
+        self._output('error', message, args=args, extra=extra)
 
-    def fatal(self, message):
+    def fatal(self, message, *args, **extra):
         """
         Fatal message.
 
         :param message: the message to emit
         :type message: object that can be converted to a string using str()
+        :param args: the arguments the message is %-formatted with, only when it is emitted
+        :param extra: the fields added to the record in JSON mode
         """
-        self._output('fatal', message)
+        self._output('fatal', message, args=args, extra=extra)
+        if self._writer is not None:
+            self._writer.drain()
         exit(1)
 
 
+class ComponentLogger(object):
+    """
+    The messages of a component, output through a SimpleLogger.  Create with SimpleLogger.component(name).
+
+    :param logger: the logger the messages are output through
+    :type logger: SimpleLogger
+    :param name: the dotted component name
+    :type name: str
+    """
+
+    def __init__(self, logger, name):
+        self.logger = logger
+        self.name = name
+
+    def is_enabled(self, level):
+        """
+        :param level: the log level ('debug', 'info', 'warning', 'error', 'fatal')
+        :type level: str
+        :returns: True if messages of the component at the level are output
+        :rtype: bool
+        """
+        return self.logger.is_enabled(level, self.name)
+
+    def debug(self, message, *args, **extra):
+        """Debug message, see SimpleLogger.debug"""
+        self.logger._output('debug', message, args=args, extra=extra, component=self.name)
+
+    def info(self, message, *args, **extra):
+        """Info message, see SimpleLogger.info"""
+        self.logger._output('info', message, args=args, extra=extra, component=self.name)
+
+    def warning(self, message, *args, **extra):
+        """Warning message, see SimpleLogger.warning"""
+        self.logger._output('warning', message, args=args, extra=extra, component=self.name)
+
+    def error(self, message, *args, **extra):
+        """Error message, see SimpleLogger.error"""
+        self.logger._output('error', message, args=args, extra=extra, component=self.name)
+
+    def fatal(self, message, *args, **extra):
+        """Fatal message then exit, see SimpleLogger.fatal"""
+        self.logger._output('fatal', message, args=args, extra=extra, component=self.name)
+        if self.logger._writer is not None:
+            self.logger._writer.drain()
+        exit(1)
+
+    def progress(self, message=STEP):
+        """Progress message, see SimpleLogger.progress"""
+        if not self.logger.json_output:
+            self.logger._output('info', message, newline=False, component=self.name)
+
+    def flush(self):
+        """Flush the logger's output streams, see SimpleLogger.flush"""
+        self.logger.flush()
+
+
 Logger = SimpleLogger()
 
 # pylint: disable=C0103
@@ -0,0 +1,189 @@
+# coding=utf-8
+
+"""
+Bulk directory transfers as a tar stream over a single exec channel.
+
+Per file open/close round trips dominate when copying trees of many small files, even over SFTP.  TarTransfer
+instead packs the tree into a tar stream, optionally gzipped, on one end of an exec channel and unpacks it on the
+other.  The archive is never written to disk on either end.
+
+Include and exclude filters are fnmatch patterns that are matched against both the path relative to the
+directory and the file name.  An excluded directory is skipped with all of it's contents.  When include patterns
+are given, only the files that match an include pattern are copied.
+
+Usage
+-----
+
+.. code-block:: python
+
+    transfer = TarTransfer(remote.transport(), compress=True, exclude=['*.pyc', '.git'])
+    transfer.put('node_modules', '/opt/app/node_modules')
+    transfer.get('/var/cache/app', 'cache')
+
+"""
+import fnmatch
+import os
+import tarfile
+
+from fullmonty.channel_io import StderrDrain
+
+try:
+    from shlex import quote
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from pipes import quote
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('TarTransfer',)
+
+#: the extraction filter, which refuses unsafe members and modes, where tarfile has them (3.12 and security releases)
+if hasattr(tarfile, 'data_filter'):
+    EXTRACT_KWARGS = {'filter': 'data'}
+    # noinspection PyUnresolvedReferences
+    FILTER_ERRORS = (tarfile.FilterError,)
+else:
+    EXTRACT_KWARGS = {}
+    FILTER_ERRORS = ()
+
+
+class TarTransfer(object):
+    """
+    Copy directories as tar streams over exec channels of one transport.
+
+    The remote system needs a tar that supports *--null* and *-T* (GNU or BSD tar).
+
+    :param transport: an authenticated transport
+    :type transport: paramiko.Transport
+    :param compress: asserted to gzip the stream
+    :type compress: bool
+    :param include: fnmatch patterns of the files to copy, None copies all files
+    :type include: list[str]
+    :param exclude: fnmatch patterns of the files and directories not to copy
+    :type exclude: list[str]
+    """
+
+    def __init__(self, transport, compress=False, include=None, exclude=None):
+        self.transport = transport
+        self.compress = compress
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+
+    # noinspection PyMethodMayBeStatic
+    def _matches(self, relative, patterns):
+        name = relative.rsplit('/', 1)[-1]
+        return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+    def put(self, local_dir, remote_dir):
+        """
+        Copy the contents of the local directory into the remote directory, creating it if needed.
+
+        :param local_dir: the local directory
+        :type local_dir: str
+        :param remote_dir: the remote directory
+        :type remote_dir: str
+        :returns: the number of files copied
+        :rtype: int
+        """
+        command = "mkdir -p {dir} && tar -x{z}f - -C {dir}".format(dir=quote(remote_dir),
+                                                                   z='z' if self.compress else '')
+        channel = self.transport.open_session()
+        try:
+            channel.exec_command(command)
+            stderr = StderrDrain(channel)
+            stream = channel.makefile('wb')
+            count = 0
+            tar = tarfile.open(fileobj=stream, mode='w|gz' if self.compress else 'w|')
+            try:
+                for dir_path, dir_names, file_names in os.walk(local_dir):
+                    relative_dir = os.path.relpath(dir_path, local_dir).replace(os.sep, '/')
+                    prefix = '' if relative_dir == '.' else relative_dir + '/'
+                    dir_names[:] = [name for name in dir_names if not self._matches(prefix + name, self.exclude)]
+                    if prefix and not self.include:
+                        tar.add(dir_path, arcname=relative_dir, recursive=False)
+                    for name in file_names:
+                        relative = prefix + name
+                        if self._matches(relative, self.exclude):
+                            continue
+                        if self.include and not self._matches(relative, self.include):
+                            continue
+                        tar.add(os.path.join(dir_path, name), arcname=relative, recursive=False)
+                        count += 1
+            finally:
+                tar.close()
+            stream.close()
+            channel.shutdown_write()
+            self._check(channel, command, stderr)
+            return count
+        finally:
+            channel.close()
+
+    def get(self, remote_dir, local_dir):
+        """
+        Copy the contents of the remote directory into the local directory, creating it if needed.
+
+        :param remote_dir: the remote directory
+        :type remote_dir: str
+        :param local_dir: the local directory
+        :type local_dir: str
+        :returns: the number of files copied
+        :rtype: int
+        """
+        z = 'z' if self.compress else ''
+        excludes = ''.join(' --exclude={pattern}'.format(pattern=quote(pattern)) for pattern in self.exclude)
+        if self.include:
+            predicate = ' -o '.join('-path {path} -o -name {name}'.format(path=quote('./' + pattern),
+                                                                          name=quote(pattern))
+                                    for pattern in self.include)
+            command = "cd {dir} && find . ! -type d \\( {predicate} \\) -print0 | " \
+                      "tar -c{z}f - --null{excludes} -T -".format(dir=quote(remote_dir), predicate=predicate, z=z,
+                                                                  excludes=excludes)
+        else:
+            command = "tar -c{z}f - -C {dir}{excludes} .".format(dir=quote(remote_dir), z=z, excludes=excludes)
+
+        if not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+        channel = self.transport.open_session()
+        try:
+            channel.exec_command(command)
+            # stderr is read while the archive streams so a noisy remote tar can not stall the channel
+            stderr = StderrDrain(channel)
+            count = 0
+            try:
+                tar = tarfile.open(fileobj=channel.makefile('rb'), mode='r|*')
+            except tarfile.ReadError:
+                # report the remote error instead of the empty stream
+                self._check(channel, command, stderr)
+                raise
+            try:
+                for member in tar:
+                    name = os.path.normpath(member.name)
+                    if os.path.isabs(name) or name.split(os.sep)[0] == '..':
+                        continue
+                    if member.issym() or member.islnk():
+                        if os.path.isabs(member.linkname) or '..' in member.linkname.split('/'):
+                            continue
+                    try:
+                        tar.extract(member, local_dir, **EXTRACT_KWARGS)
+                    except FILTER_ERRORS:
+                        continue
+                    if not member.isdir():
+                        count += 1
+            finally:
+                tar.close()
+            self._check(channel, command, stderr)
+            return count
+        finally:
+            channel.close()
+
+    # noinspection PyMethodMayBeStatic
+    def _check(self, channel, command, stderr):
+        """
+        Wait for the remote command to exit.
+
+        :raises IOError: if the remote command failed
+        """
+        exit_status = channel.recv_exit_status()
+        stderr.join()
+        if exit_status != 0:
+            raise IOError("'{command}' failed with exit status {status}: {stderr}".format(
+                command=command, status=exit_status, stderr=stderr.text()))
@@ -0,0 +1,65 @@
+# coding=utf-8
+
+"""
+Map a function over items using a bounded number of threads.
+
+Usage::
+
+    results = thread_map(remote.exec_command, ['uptime', 'df -h', 'free -m'], max_workers=3)
+
+"""
+import sys
+import threading
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('thread_map',)
+
+
+def thread_map(func, items, max_workers=8, return_exceptions=False):
+    """
+    Call func on each item using up to max_workers threads and wait for all of them to complete.
+
+    :param func: the function to call with each item
+    :type func: callable
+    :param items: the items
+    :type items: list
+    :param max_workers: the maximum number of concurrent calls
+    :type max_workers: int
+    :param return_exceptions: if asserted, an exception raised by func is returned in place of the result,
+        otherwise the first exception is re-raised after all of the calls complete.
+    :type return_exceptions: bool
+    :returns: the results in the same order as the items
+    :rtype: list
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    lock = threading.Lock()
+    indexes = iter(range(len(items)))
+
+    # noinspection PyDocstring
+    def worker():
+        while True:
+            with lock:
+                index = next(indexes, None)
+            if index is None:
+                return
+            try:
+                results[index] = func(items[index])
+            except Exception as ex:
+                if return_exceptions:
+                    results[index] = ex
+                else:
+                    with lock:
+                        errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(max_workers, len(items))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.1)
+    if errors:
+        raise errors[0][1]
+    return results
@@ -0,0 +1,212 @@
+# coding=utf-8
+
+"""
+A bandwidth-aware scheduler shared by the file transfers of many RemoteShells.
+
+The files of all of the transfers that use the scheduler wait in one queue, smallest file first, for one of
+*max_concurrent* transfer slots, so a bulk deploy of large files does not hold up the small ones.  The bytes moved
+are metered through token buckets, one for all of the hosts and one per host, to cap the bandwidth the transfers
+may use.  The live throughput, over the last *window* seconds, is reported for all of the hosts and per host.
+
+Usage
+-----
+
+.. code-block:: python
+
+    scheduler = TransferScheduler(max_rate=50 * 1024 * 1024, host_rate=10 * 1024 * 1024, max_concurrent=16)
+    shells = [RemoteShell(host, transfer_scheduler=scheduler) for host in hosts]
+    thread_map(lambda remote: remote.put('dist', '/opt/app'), shells)
+    print(scheduler.throughput())
+
+"""
+import heapq
+import itertools
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import sleep, time
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('TransferScheduler', 'TokenBucket')
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket rate limiter.
+
+    :param rate: the tokens added per second
+    :type rate: float
+    :param burst: the most tokens the bucket holds, defaults to a second's worth
+    :type burst: float
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._last = time()
+        self._lock = threading.Lock()
+
+    def consume(self, count):
+        """
+        Take the tokens from the bucket, waiting for them to be added if needed.  A count larger than the burst
+        is taken in burst sized parts.
+
+        :param count: the number of tokens
+        :type count: float
+        """
+        while count > 0:
+            with self._lock:
+                now = time()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                take = min(count, self.burst)
+                if self._tokens >= take:
+                    self._tokens -= take
+                    count -= take
+                    continue
+                wait = (take - self._tokens) / self.rate
+            sleep(wait)
+
+
+class _Meter(object):
+    """the bytes moved over a sliding window"""
+
+    def __init__(self, window):
+        self.window = window
+        self.total = 0
+        self._samples = deque()
+
+    def add(self, now, count):
+        self.total += count
+        self._samples.append((now, count))
+        self._expire(now)
+
+    def _expire(self, now):
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+
+    def rate(self, now):
+        self._expire(now)
+        return sum(count for sample_time, count in self._samples) / self.window
+
+
+class TransferScheduler(object):
+    """
+    Queue and throttle the file transfers of many shells.
+
+    :param max_rate: the bytes per second all of the transfers may use, None for no limit
+    :type max_rate: float
+    :param host_rate: the bytes per second the transfers to or from each host may use, None for no limit
+    :type host_rate: float
+    :param host_rates: the bytes per second of particular hosts, overriding host_rate
+    :type host_rates: dict[str, float]
+    :param max_concurrent: the number of files transferred at the same time over all of the hosts
+    :type max_concurrent: int
+    :param window: the seconds the live throughput is measured over
+    :type window: float
+    """
+
+    def __init__(self, max_rate=None, host_rate=None, host_rates=None, max_concurrent=8, window=5.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.host_rate = host_rate
+        self.host_rates = dict(host_rates or {})
+        self.window = window
+        self._global_bucket = TokenBucket(max_rate) if max_rate else None
+        self._host_buckets = {}
+        self._global_meter = _Meter(window)
+        self._host_meters = {}
+        self._waiting = []
+        self._sequence = itertools.count()
+        self.active = 0
+        """:type active: int"""
+        self._condition = threading.Condition()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        """the number of files waiting for a slot"""
+        with self._condition:
+            return len(self._waiting)
+
+    @contextmanager
+    def slot(self, host, size):
+        """
+        Wait for a transfer slot for a file.  The waiting file with the smallest size gets the next free slot.
+
+        Usage::
+
+            with scheduler.slot(host, size):
+                copy the file, calling scheduler.throttle(host, count) for each block
+
+        :param host: the host the file is transferred to or from
+        :type host: str
+        :param size: the size of the file in bytes
+        :type size: int
+        """
+        entry = (size, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while self._waiting[0] is not entry or self.active >= self.max_concurrent:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self.active += 1
+            # the next smallest file may also have a free slot
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.active -= 1
+                self._condition.notify_all()
+
+    def throttle(self, host, count):
+        """
+        Account for bytes transferred, waiting as needed to keep within the bandwidth caps.
+
+        :param host: the host the bytes are transferred to or from
+        :type host: str
+        :param count: the number of bytes
+        :type count: int
+        """
+        with self._lock:
+            bucket = self._host_buckets.get(host)
+            if bucket is None and self.host_rates.get(host, self.host_rate):
+                bucket = self._host_buckets[host] = TokenBucket(self.host_rates.get(host, self.host_rate))
+        if bucket is not None:
+            bucket.consume(count)
+        if self._global_bucket is not None:
+            self._global_bucket.consume(count)
+        now = time()
+        with self._lock:
+            self._global_meter.add(now, count)
+            self._host_meters.setdefault(host, _Meter(self.window)).add(now, count)
+
+    def throughput(self, host=None):
+        """
+        :param host: the host or None for all of the hosts
+        :type host: str
+        :returns: the bytes per second transferred over the last *window* seconds
+        :rtype: float
+        """
+        now = time()
+        with self._lock:
+            meter = self._global_meter if host is None else self._host_meters.get(host)
+            return meter.rate(now) if meter is not None else 0.0
+
+    def report(self, out_stream=sys.stdout):
+        """
+        Write the live and total transfers per host.
+
+        :param out_stream: the output stream
+        :type out_stream: file
+        """
+        now = time()
+        with self._lock:
+            rows = [(host, meter.rate(now), meter.total) for host, meter in sorted(self._host_meters.items())]
+            rows.append(('total', self._global_meter.rate(now), self._global_meter.total))
+        out_stream.write("{host:<30} {rate:>14} {total:>16}\n".format(host='host', rate='bytes/s', total='bytes'))
+        for host, rate, total in rows:
+            out_stream.write("{host:<30} {rate:>14.0f} {total:>16}\n".format(host=host, rate=rate, total=total))
+        out_stream.write("{active} active, {waiting} waiting\n".format(active=self.active, waiting=self.waiting))
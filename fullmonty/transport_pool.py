@@ -0,0 +1,119 @@
+# coding=utf-8
+
+"""
+A pool of authenticated paramiko transports keyed by (host, port, user).
+
+A transport is connected on first use then reused by every operation that asks for the same key until it is
+closed.  Idle transports are kept open with SSH keepalive packets.
+
+Usage
+-----
+
+.. code-block:: python
+
+    pool = TransportPool(keepalive=30)
+    transport = pool.get(host, 22, user, password)
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    ...
+    pool.close_all()
+
+"""
+import socket
+import threading
+
+import paramiko
+from paramiko import SSHClient
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('TransportPool',)
+
+
+class TransportPool(object):
+    """
+    Pooled, reusable paramiko transports.
+
+    :param keepalive: seconds between keepalive packets on idle transports, 0 disables keepalives
+    :type keepalive: int
+    :param connect_timeout: seconds to wait for the TCP connection, None waits forever
+    :type connect_timeout: float
+    """
+
+    def __init__(self, keepalive=30, connect_timeout=None):
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port, user, password=None):
+        """
+        Get the active transport for the key, connecting a new one if needed.
+
+        :param host: the remote host
+        :type host: str
+        :param port: the ssh port
+        :type port: int
+        :param user: the remote user
+        :type user: str
+        :param password: the user's password, None to use keys only
+        :type password: str
+        :returns: an authenticated transport
+        :rtype: paramiko.Transport
+        """
+        key = (host, port, user)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    return transport
+                client.close()
+                del self._clients[key]
+
+            client = SSHClient()
+            client.load_system_host_keys()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(host, port, user, password, timeout=self.connect_timeout,
+                           banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout)
+            transport = client.get_transport()
+            try:
+                # small requests and replies (exec, sftp) otherwise wait on delayed acks
+                transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (AttributeError, socket.error):
+                pass
+            if self.keepalive:
+                transport.set_keepalive(self.keepalive)
+            self._clients[key] = client
+            return transport
+
+    def active(self):
+        """
+        :returns: the keys of the active transports
+        :rtype: list[tuple(str, int, str)]
+        """
+        with self._lock:
+            return [key for key, client in self._clients.items()
+                    if client.get_transport() is not None and client.get_transport().is_active()]
+
+    def close(self, host, port, user):
+        """
+        Close the transport for the key if any.
+
+        :param host: the remote host
+        :type host: str
+        :param port: the ssh port
+        :type port: int
+        :param user: the remote user
+        :type user: str
+        """
+        with self._lock:
+            client = self._clients.pop((host, port, user), None)
+        if client is not None:
+            client.close()
+
+    def close_all(self):
+        """Close all of the transports."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients = {}
+        for client in clients:
+            client.close()
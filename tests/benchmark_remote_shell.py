@@ -0,0 +1,152 @@
+# coding=utf-8
+
+"""
+Benchmarks of RemoteShell against the in-process SSH/SFTP server.
+
+Measures connection setup, command round trip latency, concurrent commands per second, and SFTP throughput for
+one large file and for many small files, without a network or a real remote host.  Since client and server share
+the machine, the numbers are for comparing changes to the transports and protocols, not absolute.
+
+Usage::
+
+    PYTHONPATH=. python tests/benchmark_remote_shell.py --iterations 50 --large-size 64 --small-count 500
+
+The test suite only runs the benchmarks as a smoke test when FULLMONTY_BENCHMARK is set in the environment.
+
+"""
+import argparse
+import os
+import sys
+from time import time
+
+from fullmonty.host_facts import HostFactsCache
+from fullmonty.remote_shell import RemoteShell
+from fullmonty.tmp_dir import TmpDir
+from fullmonty.transport_pool import TransportPool
+
+from ssh_server import LocalSSHServer
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('run_benchmarks', 'BENCHMARK_UNITS')
+
+#: the unit of each benchmark result
+BENCHMARK_UNITS = [
+    ('connect', 'seconds per connection'),
+    ('latency', 'seconds per command'),
+    ('commands_per_second', 'commands per second'),
+    ('sftp_large_put', 'bytes per second'),
+    ('sftp_large_get', 'bytes per second'),
+    ('sftp_small_put', 'files per second'),
+    ('sftp_small_get', 'files per second'),
+]
+
+
+def _shell(server):
+    return RemoteShell(server.host, user=server.user, password=server.password, port=server.port,
+                       lazy=True, use_channels=True, facts_cache=HostFactsCache())
+
+
+def _write(path, size):
+    with open(path, 'wb') as out_file:
+        out_file.write(os.urandom(size))
+
+
+def bench_connect(server, iterations):
+    """:returns: the mean seconds to connect and authenticate a transport"""
+    start = time()
+    for _ in range(iterations):
+        pool = TransportPool()
+        pool.get(server.host, server.port, server.user, server.password)
+        pool.close_all()
+    return (time() - start) / iterations
+
+
+def bench_latency(remote, iterations):
+    """:returns: the mean seconds for a command's round trip on an exec channel"""
+    remote.exec_command('true')
+    start = time()
+    for _ in range(iterations):
+        remote.exec_command('true')
+    return (time() - start) / iterations
+
+
+def bench_commands_per_second(remote, iterations):
+    """:returns: the commands completed per second when ran concurrently over one transport"""
+    start = time()
+    remote.exec_commands(['true'] * iterations)
+    return iterations / (time() - start)
+
+
+def bench_sftp(remote, tmp_dir, file_size, file_count, name):
+    """
+    Upload then download a directory of file_count files of file_size bytes each.
+
+    :returns: the upload and the download seconds
+    :rtype: tuple(float, float)
+    """
+    source = os.path.join(tmp_dir, name)
+    os.mkdir(source)
+    for index in range(file_count):
+        _write(os.path.join(source, 'file{index}'.format(index=index)), file_size)
+    remote_dir = os.path.join(tmp_dir, name + '_remote')
+    start = time()
+    remote.put(source, remote_dir)
+    put_seconds = time() - start
+    local_dir = os.path.join(tmp_dir, name + '_local')
+    os.mkdir(local_dir)
+    start = time()
+    remote.get(remote_dir, local_dir)
+    return put_seconds, time() - start
+
+
+def run_benchmarks(server, iterations=50, large_size=64 * 1024 * 1024, small_count=500, small_size=1024):
+    """
+    Run the benchmarks against the server.
+
+    :param server: the running server
+    :type server: LocalSSHServer
+    :param iterations: the number of connections and commands to time
+    :type iterations: int
+    :param large_size: the size in bytes of the large file
+    :type large_size: int
+    :param small_count: the number of small files
+    :type small_count: int
+    :param small_size: the size in bytes of each small file
+    :type small_size: int
+    :returns: the result of each benchmark, see BENCHMARK_UNITS
+    :rtype: dict[str, float]
+    """
+    results = {'connect': bench_connect(server, iterations)}
+    remote = _shell(server)
+    try:
+        results['latency'] = bench_latency(remote, iterations)
+        results['commands_per_second'] = bench_commands_per_second(remote, iterations)
+        with TmpDir() as tmp_dir:
+            put_seconds, get_seconds = bench_sftp(remote, tmp_dir, large_size, 1, 'large')
+            results['sftp_large_put'] = large_size / put_seconds
+            results['sftp_large_get'] = large_size / get_seconds
+            put_seconds, get_seconds = bench_sftp(remote, tmp_dir, small_size, small_count, 'small')
+            results['sftp_small_put'] = small_count / put_seconds
+            results['sftp_small_get'] = small_count / get_seconds
+    finally:
+        remote.logout()
+    return results
+
+
+def main(args=None):
+    """run the benchmarks and print the results"""
+    parser = argparse.ArgumentParser(description='Benchmark RemoteShell against an in-process SSH server.')
+    parser.add_argument('--iterations', type=int, default=50, help='the number of connections and commands to time')
+    parser.add_argument('--large-size', type=int, default=64, help='the size of the large file in MB')
+    parser.add_argument('--small-count', type=int, default=500, help='the number of small (1KB) files')
+    settings = parser.parse_args(args)
+    with LocalSSHServer() as server:
+        results = run_benchmarks(server, iterations=settings.iterations, large_size=settings.large_size * 1024 * 1024,
+                                 small_count=settings.small_count)
+    for name, unit in BENCHMARK_UNITS:
+        print("{name:<20} {value:>16.4f}  {unit}".format(name=name, value=results[name], unit=unit))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+# coding=utf-8
+
+"""
+Shared test fixtures
+"""
+import sys
+
+import pytest
+
+from fullmonty.host_facts import HostFactsCache
+from fullmonty.remote_shell import RemoteShell
+
+from ssh_server import LocalSSHServer
+
+# AsyncRemoteShell uses async generators, a SyntaxError before Python 3.6
+collect_ignore = ['test_async_remote_shell.py'] if sys.version_info < (3, 6) else []
+
+
+@pytest.fixture(scope='session')
+def ssh_server():
+    """an in-process SSH/SFTP server on localhost that runs the commands locally"""
+    with LocalSSHServer() as server:
+        yield server
+
+
+@pytest.fixture
+def remote_shell(ssh_server):
+    """a RemoteShell using exec channels to the in-process server"""
+    remote = RemoteShell(ssh_server.host, user=ssh_server.user, password=ssh_server.password, port=ssh_server.port,
+                         lazy=True, use_channels=True, facts_cache=HostFactsCache())
+    yield remote
+    remote.logout()
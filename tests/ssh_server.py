@@ -0,0 +1,330 @@
+# coding=utf-8
+
+"""
+An in-process SSH/SFTP server bound to localhost that executes commands locally.
+
+It stands in for a real remote host when testing and benchmarking RemoteShell's paramiko based operations
+(exec channels, sftp, transports).  Password authentication is accepted for the configured user.  Interactive
+shells are not supported so the pxssh based operations are not available; create the RemoteShell with *lazy=True*.
+
+The *ssh_server* and *remote_shell* fixtures in conftest.py provide a running server and a RemoteShell
+connected to it.
+
+Usage::
+
+    with LocalSSHServer(user='test', password='secret') as server:
+        remote = RemoteShell(server.host, user=server.user, password=server.password, port=server.port,
+                             lazy=True, use_channels=True)
+
+"""
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+from paramiko import Channel, SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, SFTP_OK, ServerInterface
+from paramiko.common import MSG_CHANNEL_REQUEST
+
+__docformat__ = 'restructuredtext en'
+__all__ = ('LocalSSHServer',)
+
+
+class _LocalSFTPHandle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as ex:
+            return SFTPServer.convert_errno(ex.errno)
+
+    def chattr(self, attr):
+        try:
+            SFTPServer.set_file_attr(self.filename, attr)
+            return SFTP_OK
+        except OSError as ex:
+            return SFTPServer.convert_errno(ex.errno)
+
+
+class _LocalSFTPServer(SFTPServerInterface):
+    """sftp on the local file system"""
+
+    # noinspection PyMethodMayBeStatic
+    def _errno(self, ex):
+        return SFTPServer.convert_errno(ex.errno)
+
+    def list_folder(self, path):
+        try:
+            attrs = []
+            for name in os.listdir(path):
+                attr = SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)))
+                attr.filename = name
+                attrs.append(attr)
+            return attrs
+        except OSError as ex:
+            return self._errno(ex)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(path))
+        except OSError as ex:
+            return self._errno(ex)
+
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as ex:
+            return self._errno(ex)
+
+    def open(self, path, flags, attr):
+        try:
+            binary_flag = getattr(os, 'O_BINARY', 0)
+            flags |= binary_flag
+            mode = getattr(attr, 'st_mode', None) or 0o666
+            fd = os.open(path, flags, mode)
+        except OSError as ex:
+            return self._errno(ex)
+        if (flags & os.O_CREAT) and (attr is not None):
+            attr._flags &= ~attr.FLAG_PERMISSIONS
+            SFTPServer.set_file_attr(path, attr)
+        if flags & os.O_WRONLY:
+            fstr = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            fstr = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            fstr = 'rb'
+        try:
+            handle_file = os.fdopen(fd, fstr)
+        except OSError as ex:
+            return self._errno(ex)
+        handle = _LocalSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle_file
+        handle.writefile = handle_file
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as ex:
+            return self._errno(ex)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as ex:
+            return self._errno(ex)
+        return SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        return self.rename(oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+            if attr is not None:
+                SFTPServer.set_file_attr(path, attr)
+        except OSError as ex:
+            return self._errno(ex)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(path)
+        except OSError as ex:
+            return self._errno(ex)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            SFTPServer.set_file_attr(path, attr)
+        except OSError as ex:
+            return self._errno(ex)
+        return SFTP_OK
+
+    def canonicalize(self, path):
+        return os.path.normpath(os.path.join(os.getcwd(), path))
+
+    def readlink(self, path):
+        try:
+            return os.readlink(path)
+        except OSError as ex:
+            return self._errno(ex)
+
+    def symlink(self, target_path, path):
+        try:
+            os.symlink(target_path, path)
+        except OSError as ex:
+            return self._errno(ex)
+        return SFTP_OK
+
+
+class _ServerInterface(ServerInterface):
+    """password authentication for one user and exec channels that run the command locally"""
+
+    def __init__(self, user, password, signal_status=True):
+        self.user = user
+        self.password = password
+        self.signal_status = signal_status
+        self.pending = {}
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == self.user and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        # started by _Transport once the request has been acknowledged
+        self.pending[channel.get_id()] = command.decode('utf-8')
+        return True
+
+
+def _handle_request(channel, message):
+    Channel._handle_request(channel, message)
+    command = channel.get_transport().server_object.pending.pop(channel.get_id(), None)
+    if command is not None:
+        thread = threading.Thread(target=_run_command, args=(channel, command))
+        thread.daemon = True
+        thread.start()
+
+
+class _Transport(paramiko.Transport):
+    """
+    Starts an exec'd command after the success reply to the exec request is sent.  A command started by the
+    request handler could otherwise output and close the channel before the client sees the reply.
+    """
+    _channel_handler_table = dict(paramiko.Transport._channel_handler_table)
+    _channel_handler_table[MSG_CHANNEL_REQUEST] = _handle_request
+
+
+def _pump(read, write, close=None):
+    for chunk in iter(lambda: read(32768), b''):
+        write(chunk)
+    if close is not None:
+        close()
+
+
+def _run_command(channel, command):
+    """run the command locally, connecting it's stdin, stdout and stderr to the channel"""
+    process = subprocess.Popen(command, shell=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # noinspection PyDocstring
+    def write_stdin(chunk):
+        try:
+            process.stdin.write(chunk)
+            process.stdin.flush()
+        except (IOError, OSError):
+            pass
+
+    # noinspection PyDocstring
+    def close_stdin():
+        try:
+            process.stdin.close()
+        except (IOError, OSError):
+            pass
+
+    stdin_thread = threading.Thread(target=_pump, args=(channel.recv, write_stdin, close_stdin))
+    stdin_thread.daemon = True
+    stdin_thread.start()
+    stderr_thread = threading.Thread(target=_pump, args=(lambda size: os.read(process.stderr.fileno(), size),
+                                                         channel.sendall_stderr))
+    stderr_thread.daemon = True
+    stderr_thread.start()
+    try:
+        _pump(lambda size: os.read(process.stdout.fileno(), size), channel.sendall)
+        stderr_thread.join()
+        status = process.wait()
+        if status >= 0:
+            channel.send_exit_status(status)
+        elif channel.get_transport().server_object.signal_status:
+            # a command killed by a signal has a negative return code, report it like a shell does
+            channel.send_exit_status(128 - status)
+    except (socket.error, EOFError):
+        process.kill()
+    finally:
+        channel.close()
+
+
+class LocalSSHServer(object):
+    """
+    SSH/SFTP server on localhost in a background thread.
+
+    :param user: the user name to accept
+    :type user: str
+    :param password: the password to accept
+    :type password: str
+    :param signal_status: asserted to report a command killed by a signal with the exit status 128 + signum.
+        Otherwise no exit status is sent, like OpenSSH which sends an exit-signal that paramiko ignores, so the
+        client sees -1.
+    :type signal_status: bool
+    """
+
+    def __init__(self, user='test', password='secret', signal_status=True):
+        self.user = user
+        self.password = password
+        self.signal_status = signal_status
+        self.host = '127.0.0.1'
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._socket = None
+        self._thread = None
+        self._transports = []
+        self.port = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self):
+        """listen on an ephemeral port and start accepting connections"""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, 0))
+        self._socket.listen(100)
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """stop accepting connections and close the open ones"""
+        if self._socket is not None:
+            try:
+                # wakes the thread blocked in accept
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self._socket.close()
+            self._socket = None
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+    def _accept(self):
+        while self._socket is not None:
+            try:
+                sock, address = self._socket.accept()
+            except (socket.error, AttributeError):
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = _Transport(sock)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', SFTPServer, _LocalSFTPServer)
+            self._transports.append(transport)
+            try:
+                server = _ServerInterface(self.user, self.password, self.signal_status)
+                transport.start_server(event=threading.Event(), server=server)
+            except (paramiko.SSHException, EOFError, socket.error):
+                pass
@@ -0,0 +1,81 @@
+# coding=utf-8
+
+"""
+Test AsyncRemoteShell against the in-process SSH server
+"""
+import asyncio
+import io
+import os
+
+from fullmonty.async_remote_shell import AsyncRemoteShell
+from fullmonty.tmp_dir import TmpDir
+
+
+def run_async(ssh_server, coroutine_function):
+    """run coroutine_function(remote) on a new event loop with a connected AsyncRemoteShell"""
+    # noinspection PyDocstring
+    async def main():
+        async with AsyncRemoteShell(ssh_server.host, user=ssh_server.user, password=ssh_server.password,
+                                    port=ssh_server.port) as remote:
+            return await coroutine_function(remote)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+def test_exec_command(ssh_server):
+    # noinspection PyDocstring
+    async def check(remote):
+        result = await remote.exec_command('echo out; echo err >&2; exit 3', env={'GREETING': 'hi there'})
+        assert result == ('out\n', 'err\n', 3)
+        result = await remote.exec_command('echo "$GREETING"', env={'GREETING': 'hi there'})
+        assert result.stdout == 'hi there\n'
+        result = await remote.exec_command('sleep 5', timeout=0.5)
+        assert result.exit_status == -1
+
+    run_async(ssh_server, check)
+
+
+def test_run_generator(ssh_server):
+    # noinspection PyDocstring
+    async def check(remote):
+        out_stream = io.StringIO()
+        lines = []
+        async for line in remote.run_generator("printf 'one\\ntwo\\r\\nthree'; exit 2", out_stream=out_stream):
+            lines.append(line)
+        assert lines == ['one\n', 'two\r\n', 'three']
+        assert remote.exit_status == 2
+        assert out_stream.getvalue().endswith('one\ntwo\r\nthree')
+
+    run_async(ssh_server, check)
+
+
+def test_run_pattern_response(ssh_server):
+    # noinspection PyDocstring
+    async def check(remote):
+        output = await remote.run("printf 'Continue? [Y] '; read answer; echo \"got $answer\"",
+                                  pattern_response={r'Continue\? \[Y\]': 'yes'}, verbose=False, timeout=10)
+        assert output.endswith('got yes\n')
+        output = await remote.run("printf 'Install [Y]'; read answer; echo \"got $answer\"",
+                                  accept_defaults=True, verbose=False, timeout=10)
+        assert output.endswith('got \n')
+
+    run_async(ssh_server, check)
+
+
+def test_put_get(ssh_server):
+    with TmpDir() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source.bin')
+        with open(source, 'wb') as out_file:
+            out_file.write(os.urandom(100000))
+
+        # noinspection PyDocstring
+        async def check(remote):
+            await remote.put(source, os.path.join(tmp_dir, 'remote.bin'))
+            await remote.get(os.path.join(tmp_dir, 'remote.bin'), os.path.join(tmp_dir, 'back.bin'))
+
+        run_async(ssh_server, check)
+        assert open(os.path.join(tmp_dir, 'back.bin'), 'rb').read() == open(source, 'rb').read()
@@ -0,0 +1,74 @@
+# coding=utf-8
+
+"""
+Test the ForkExecutor
+"""
+import time
+
+import pytest
+
+from fullmonty.fork_executor import ForkExecutor, ForkExecutorError, ForkExecutorTimeout
+
+
+def add(a, b):
+    """print and return the sum"""
+    print("adding {a} and {b}".format(a=a, b=b))
+    return a + b
+
+
+def fail():
+    """raise an exception"""
+    raise ValueError("bad value")
+
+
+def nap(seconds):
+    """sleep for the given seconds"""
+    time.sleep(seconds)
+
+
+def hog(size):
+    """allocate size bytes"""
+    return len(bytearray(size))
+
+
+def test_run():
+    with ForkExecutor(preload=['json']) as executor:
+        result = executor.run(add, args=(1, 2))
+        assert result.value == 3
+        assert result.output == "adding 1 and 2\n"
+        assert executor.run(add, kwargs={'a': 'x', 'b': 'y'}).value == 'xy'
+
+
+def test_exception():
+    with ForkExecutor() as executor:
+        with pytest.raises(ForkExecutorError) as exc_info:
+            executor.run(fail)
+        assert 'bad value' in str(exc_info.value)
+        assert 'ValueError' in exc_info.value.remote_traceback
+
+
+def test_timeout():
+    with ForkExecutor() as executor:
+        start = time.time()
+        with pytest.raises(ForkExecutorTimeout):
+            executor.run(nap, args=(10,), timeout=0.5)
+        assert time.time() - start < 5
+
+
+def test_memory_limit():
+    with ForkExecutor() as executor:
+        with pytest.raises(ForkExecutorError) as exc_info:
+            executor.run(hog, args=(1024 * 1024 * 1024,), memory_limit=256 * 1024 * 1024)
+        assert 'MemoryError' in str(exc_info.value)
+
+
+def test_exit_stops_forkserver():
+    with ForkExecutor() as executor:
+        assert executor.run(add, args=(1, 2)).value == 3
+        if executor.start_method != 'forkserver':
+            return
+        from multiprocessing import forkserver
+        assert forkserver._forkserver._forkserver_pid is not None
+    assert forkserver._forkserver._forkserver_pid is None
+    with ForkExecutor() as executor:
+        assert executor.run(add, args=(2, 2)).value == 4
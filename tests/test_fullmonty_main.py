@@ -0,0 +1,49 @@
+# coding=utf-8
+
+"""
+Test the fullmonty parallel command runner
+"""
+import os
+from io import StringIO
+
+from fullmonty.fullmonty_main import Job, ParallelRunner, build_jobs, read_joblog
+from fullmonty.tmp_dir import TmpDir
+
+
+def test_build_jobs():
+    assert build_jobs([], ['echo a', 'echo b']) == [Job(1, 'echo a'), Job(2, 'echo b')]
+    assert build_jobs(['gzip'], ['a b']) == [Job(1, "gzip 'a b'")]
+    assert build_jobs(['cp', '{}', '{}.bak'], ['x']) == [Job(1, 'cp x x.bak')]
+
+
+def test_run_grouped():
+    out_stream = StringIO()
+    jobs = build_jobs(['echo'], ['one', 'two', 'three'])
+    results = ParallelRunner(jobs=3, out_stream=out_stream).run(jobs)
+    assert results == {1: 0, 2: 0, 3: 0}
+    assert sorted(out_stream.getvalue().splitlines()) == ['one', 'three', 'two']
+
+
+def test_run_line_buffer():
+    out_stream = StringIO()
+    jobs = build_jobs([], ['echo a; sleep 0.2; echo b', 'sleep 0.1; echo c'])
+    ParallelRunner(jobs=2, output_mode='line-buffer', out_stream=out_stream).run(jobs)
+    assert out_stream.getvalue() == 'a\nc\nb\n'
+
+
+def test_joblog_resume():
+    with TmpDir() as tmp_dir:
+        joblog = os.path.join(tmp_dir, 'joblog')
+        jobs = build_jobs([], ['true', 'exit 3'])
+        results = ParallelRunner(jobs=2, joblog=joblog, out_stream=StringIO()).run(jobs)
+        assert results == {1: 0, 2: 3}
+        assert read_joblog(joblog) == {1: 0, 2: 3}
+
+        completed = read_joblog(joblog)
+        failed = [job for job in jobs if completed[job.seq] != 0]
+        ParallelRunner(joblog=joblog, resume=True, out_stream=StringIO()).run(failed)
+        with open(joblog) as in_file:
+            lines = in_file.read().splitlines()
+        assert len(lines) == 4
+        assert lines[0].startswith('Seq\t')
+        assert lines[3].split('\t')[0] == '2'
@@ -0,0 +1,52 @@
+# coding=utf-8
+
+"""
+Test the host facts parsing and cache
+"""
+import os
+import subprocess
+
+from fullmonty.host_facts import FACTS_COMMAND, HostFacts, HostFactsCache
+from fullmonty.tmp_dir import TmpDir
+
+
+def test_parse_local_facts():
+    output = subprocess.check_output(['/bin/sh', '-c', FACTS_COMMAND]).decode('utf-8')
+    facts = HostFacts.parse(output)
+    assert facts.env['PATH'] == os.environ['PATH']
+    assert facts.uname
+    assert facts.cpu_count >= 1
+    if os.path.isfile('/proc/meminfo'):
+        assert facts.memory['MemTotal'] > 0
+    assert '/' in facts.disk
+    assert len(facts.load_average) == 3
+    assert HostFacts.parse("--fullmonty-facts-loadavg\n 10:01:02 up 3 days,  2 users,  load average: 0,52, 1,05, 2,00"
+                           ).load_average == (0.52, 1.05, 2.0)
+
+
+def test_cache_ttl_and_invalidate():
+    calls = []
+
+    # noinspection PyDocstring
+    def gather():
+        calls.append(1)
+        return HostFacts(cpu_count=len(calls))
+
+    cache = HostFactsCache(ttl=60)
+    assert cache.get('host', gather).cpu_count == 1
+    assert cache.get('host', gather).cpu_count == 1
+    cache.invalidate('host')
+    assert cache.get('host', gather).cpu_count == 2
+
+    cache.ttl = 0.000001
+    assert cache.get('host', gather).cpu_count == 3
+
+
+def test_cache_persistence():
+    with TmpDir() as tmp_dir:
+        path = os.path.join(tmp_dir, 'facts.json')
+        HostFactsCache(path=path).get('host', lambda: HostFacts(os_release={'ID': 'debian'}, cpu_count=4))
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        facts = HostFactsCache(path=path).get('host', lambda: HostFacts())
+        assert facts.cpu_count == 4
+        assert facts.os == {'ID': 'debian'}
@@ -0,0 +1,69 @@
+# coding=utf-8
+
+"""
+Test HostScheduler against in-process ssh servers
+"""
+import io
+import threading
+
+from fullmonty.host_facts import HostFacts, HostFactsCache
+from fullmonty.host_scheduler import HostScheduler
+
+from ssh_server import LocalSSHServer
+
+
+def test_schedule(ssh_server):
+    hosts = ['127.0.0.1:{port}'.format(port=ssh_server.port), 'localhost:{port}'.format(port=ssh_server.port),
+             '127.0.0.1:1']
+    with HostScheduler(hosts, slots=2, user=ssh_server.user, password=ssh_server.password,
+                       connect_timeout=2) as scheduler:
+        assert list(scheduler.failures) == ['127.0.0.1:1']
+        results = scheduler.run(['sleep 0.2; echo {index}'.format(index=index) for index in range(8)] + ['exit 3'])
+        assert [result.stdout for result in results[:8]] == ['{index}\n'.format(index=index) for index in range(8)]
+        assert results[8].exit_status == 3
+        # the jobs are spread evenly over the two hosts
+        assert sorted(stats.completed for stats in scheduler.stats.values()) == [4, 5]
+        out_stream = io.StringIO()
+        scheduler.report(out_stream)
+        assert 'failed to connect' in out_stream.getvalue()
+
+
+def test_retry_on_host_death(ssh_server):
+    with LocalSSHServer() as dying_server:
+        hosts = ['127.0.0.1:{port}'.format(port=ssh_server.port), '127.0.0.1:{port}'.format(port=dying_server.port)]
+        with HostScheduler(hosts, slots=2, user=ssh_server.user, password=ssh_server.password,
+                           reconnect_retries=0) as scheduler:
+            threading.Timer(0.3, dying_server.stop).start()
+            results = scheduler.run(['sleep 1; echo {index}'.format(index=index) for index in range(4)])
+    assert [result.stdout for result in results] == ['{index}\n'.format(index=index) for index in range(4)]
+    assert sorted(result.attempts for result in results) == [1, 1, 2, 2]
+    assert not scheduler.stats[hosts[1]].alive
+
+
+def test_signal_is_a_result():
+    with LocalSSHServer(signal_status=False) as server:
+        hosts = ['127.0.0.1:{port}'.format(port=server.port)]
+        with HostScheduler(hosts, slots=1, user=server.user, password=server.password) as scheduler:
+            results = scheduler.run(['kill -9 $$', 'echo after'])
+            assert results[0].exit_status == -1 and results[0].error is None and results[0].attempts == 1
+            assert results[1].stdout == 'after\n'
+            assert scheduler.stats[hosts[0]].alive
+
+
+def test_no_live_hosts():
+    with LocalSSHServer() as server:
+        hosts = ['127.0.0.1:{port}'.format(port=server.port)]
+        with HostScheduler(hosts, user=server.user, password=server.password) as scheduler:
+            scheduler.stats[hosts[0]].alive = False
+            results = scheduler.run(['echo never'])
+    assert results[0].attempts == 0 and isinstance(results[0].error, IOError)
+
+
+def test_fresh_load_average(ssh_server):
+    hosts = ['127.0.0.1:{port}'.format(port=ssh_server.port)]
+    facts_cache = HostFactsCache()
+    facts_cache.get('{user}@127.0.0.1:{port}'.format(user=ssh_server.user, port=ssh_server.port),
+                    lambda: HostFacts(cpu_count=1, load_average=(99.0, 99.0, 99.0)))
+    with HostScheduler(hosts, user=ssh_server.user, password=ssh_server.password,
+                       facts_cache=facts_cache) as scheduler:
+        assert scheduler.stats[hosts[0]].base_load < 99.0
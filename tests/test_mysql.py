@@ -0,0 +1,80 @@
+# coding=utf-8
+
+"""
+Test AShell.mysql batch mode against a stand-in mysql executable.
+"""
+import os
+import stat
+import sys
+
+from fullmonty.local_shell import LocalShell
+from fullmonty.tmp_dir import TmpDir
+
+# A stand-in for the mysql client that records each invocation and the defaults file's mode, then echoes each
+# statement.  Marker queries, "SELECT 'value' AS 'header';", output the header and value lines like mysql --batch.
+# A statement starting with FAIL writes an error to stderr.  Like mysql on a pipe, stdout is held until exit unless
+# --unbuffered is given.
+FAKE_MYSQL = '''\
+#!{python}
+import os
+import re
+import sys
+
+config = [arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--defaults-file=')][0]
+unbuffered = '--unbuffered' in sys.argv[1:]
+pending = []
+
+
+def write(text):
+    pending.append(text)
+    if unbuffered:
+        sys.stdout.write(''.join(pending))
+        sys.stdout.flush()
+        del pending[:]
+
+
+with open(os.path.join({log_dir!r}, 'invocations.log'), 'a') as log:
+    log.write('%o %s\\n' % (os.stat(config).st_mode & 0o777, open(config).read().count('password=secret')))
+for number, line in enumerate(sys.stdin, 1):
+    match = re.match(r"SELECT '(.*)' AS '(.*)';", line)
+    if match:
+        write(match.group(2) + '\\n' + match.group(1) + '\\n')
+    elif line.startswith('FAIL'):
+        sys.stderr.write('ERROR 1064 (42000) at line %d: syntax error\\n' % number)
+        sys.stderr.flush()
+    else:
+        write('ran: ' + line.strip() + '\\n')
+sys.stdout.write(''.join(pending))
+'''
+
+
+def install_fake_mysql(monkeypatch, tmp_dir):
+    mysql_path = os.path.join(tmp_dir, 'mysql')
+    with open(mysql_path, 'w') as out_file:
+        out_file.write(FAKE_MYSQL.format(python=sys.executable, log_dir=tmp_dir))
+    os.chmod(mysql_path, stat.S_IRWXU)
+    monkeypatch.setenv('PATH', tmp_dir + os.pathsep + os.environ['PATH'])
+    monkeypatch.chdir(tmp_dir)
+
+
+def test_mysql_batch(monkeypatch):
+    with TmpDir() as tmp_dir:
+        install_fake_mysql(monkeypatch, tmp_dir)
+
+        with LocalShell() as local:
+            results = local.mysql('root', 'secret', "SELECT 1\n\nUSE {user};\nSELECT 2;\n", batch=True)
+
+        assert results == ['ran: SELECT 1;\n', 'ran: USE root;\n', 'ran: SELECT 2;\n']
+        with open(os.path.join(tmp_dir, 'invocations.log')) as log:
+            assert log.read() == '600 1\n'
+        assert not [name for name in os.listdir(tmp_dir) if name.startswith('.my.cnf')]
+
+
+def test_mysql_batch_error(monkeypatch):
+    with TmpDir() as tmp_dir:
+        install_fake_mysql(monkeypatch, tmp_dir)
+
+        with LocalShell() as local:
+            results = local.mysql('root', 'secret', "SELECT 1;\nFAIL 2;\nSELECT 3;\n", batch=True)
+
+        assert results == ['ran: SELECT 1;\n', 'ERROR 1064 (42000) at line 3: syntax error\n', 'ran: SELECT 3;\n']
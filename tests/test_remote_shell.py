@@ -3,8 +3,29 @@
 """
 Test the remote shell
 """
+import hashlib
+import io
+import os
+import re
+import threading
+from time import sleep
+
+try:
+    from shutil import which
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from distutils.spawn import find_executable as which
+
+import pexpect
+import pytest
+
+from fullmonty.channel_io import LineDecoder
 from fullmonty.local_shell import LocalShell
-from fullmonty.remote_shell import RemoteShell
+from fullmonty.remote_agent import RemoteAgentError
+from fullmonty.remote_shell import SYNC_MARKER, RemoteShell
+from fullmonty.tmp_dir import TmpDir
+
+from benchmark_remote_shell import BENCHMARK_UNITS, run_benchmarks
 
 
 def test_remote_run():
@@ -14,3 +35,383 @@ def test_remote_run():
     with RemoteShell(user='wrighroy', password='yakityYak52', host='localhost') as remote:
         remote_ls = remote.run("/bin/ls -1 {dir}".format(dir=dir))
     assert local_ls == remote_ls
+
+
+def test_channel_run(remote_shell):
+    assert remote_shell.run("echo hello", verbose=False) == "hello\n"
+    assert remote_shell.run("echo $FOO", env={'FOO': 'a b'}, verbose=False) == "a b\n"
+
+
+def test_exec_command_killed(remote_shell):
+    assert remote_shell.exec_command('kill -9 $$').exit_status == 137
+
+
+def test_exec_command(remote_shell):
+    result = remote_shell.exec_command("echo out; echo err >&2; exit 3")
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+    assert result.exit_status == 3
+    assert remote_shell.exec_command("sleep 5", timeout=0.5).exit_status == -1
+    results = remote_shell.exec_commands(["echo {index}".format(index=index) for index in range(20)])
+    assert [result.stdout for result in results] == ["{index}\n".format(index=index) for index in range(20)]
+
+
+def test_run_generator(remote_shell):
+    lines = list(remote_shell.run_generator("printf 'a\\nb\\nc'; exit 2", verbose=False))
+    assert lines == ['a\n', 'b\n', 'c']
+    assert remote_shell.exit_status == 2
+
+
+def test_line_decoder_split_crlf():
+    decoder = LineDecoder()
+    assert decoder.decode(b'one\r') == []
+    assert decoder.decode(b'\ntwo\rthree\r') == ['one\r\n', 'two\r']
+    assert decoder.decode(b'\xc3') == []
+    assert decoder.decode(b'\xa9\n') == ['three\r', '\xe9\n']
+    assert decoder.decode(b'end\r') == []
+    assert decoder.finish() == ['end\r']
+    assert decoder.decode(u'a\fb\u2028c\x85d\ne'.encode('utf-8')) == [u'a\fb\u2028c\x85d\n']
+    assert decoder.finish() == ['e']
+
+
+def test_run_generator_split_crlf(remote_shell):
+    lines = list(remote_shell.run_generator("printf 'a\\r'; sleep 0.2; printf '\\nb\\r\\n'", verbose=False))
+    assert lines == ['a\r\n', 'b\r\n']
+
+
+def test_env(remote_shell, ssh_server):
+    assert remote_shell.env()['PATH'] == os.environ['PATH']
+    assert remote_shell.cached_env()['PATH'] == os.environ['PATH']
+
+    unreachable = RemoteShell('127.0.0.1', user=ssh_server.user, password=ssh_server.password, port=1, lazy=True,
+                              use_channels=True, connect_timeout=2)
+    assert unreachable.env() == {}
+
+
+def test_connect_all_prompts_on_calling_thread(monkeypatch):
+    prompts = []
+
+    # noinspection PyDocstring
+    class FakePxssh(object):
+        def __init__(self, **kwargs):
+            pass
+
+        # noinspection PyUnusedLocal
+        def login(self, host, user, password='', **kwargs):
+            if password != 'secret':
+                raise IOError("permission denied")
+
+    # noinspection PyDocstring
+    def fake_getpass(prompt):
+        prompts.append((prompt, threading.current_thread().name))
+        return 'secret'
+
+    monkeypatch.setattr('fullmonty.remote_shell.pxssh', FakePxssh)
+    monkeypatch.setattr('fullmonty.remote_shell.getpass', fake_getpass)
+    shells, failures = RemoteShell.connect_all(['web1', 'web2', 'web3'], user='deploy', password='')
+    assert sorted(shells) == ['web1', 'web2', 'web3']
+    assert failures == {}
+    assert sorted(prompt for prompt, thread in prompts) == ['password for deploy@web{0}: '.format(index)
+                                                            for index in range(1, 4)]
+    assert set(thread for prompt, thread in prompts) == {threading.current_thread().name}
+
+
+# noinspection PyDocstring
+class ScriptedPxssh(object):
+    """
+    A pxssh stand in that answers each line sent from a script.  A script entry is a list of output chunks, a
+    None chunk is a timeout when the output is expected.  Each session starts with stale output pending and, if
+    it synchronizes, echoes the sentinel.
+    """
+    PROMPT = r'\[PEXPECT\][\$\#] '
+    #: the (script, synchronizes) of each session in the order they are logged in
+    sessions = []
+
+    def __init__(self, **kwargs):
+        self.script, self.synchronizes = ScriptedPxssh.sessions.pop(0)
+        self.buffer = 'stale output\r\n[PEXPECT]$ '
+        self.pending = []
+        self.sent = []
+        self.before = ''
+        self.after = ''
+
+    # noinspection PyUnusedLocal
+    def login(self, host, user, password='', **kwargs):
+        pass
+
+    def sendline(self, line=''):
+        self.sent.append(line)
+        if line.startswith('echo ' + SYNC_MARKER):
+            if self.synchronizes:
+                self.pending.append(line.replace("''", '')[5:] + '\r\n[PEXPECT]$ ')
+        else:
+            self.pending.extend(self.script.get(line, []))
+
+    def _search(self, regexes):
+        """:returns: the index of the regex matching earliest in the output, reading chunks up to a timeout"""
+        while True:
+            found = [(match.start(), index, match) for index, match in
+                     ((index, re.search(regex, self.buffer)) for index, regex in enumerate(regexes)) if match]
+            if found:
+                start, index, match = min(found, key=lambda item: item[:2])
+                self.before, self.after = self.buffer[:start], match.group(0)
+                self.buffer = self.buffer[match.end():]
+                return index
+            if not self.pending or self.pending[0] is None:
+                if self.pending:
+                    self.pending.pop(0)
+                raise pexpect.TIMEOUT('timed out')
+            self.buffer += self.pending.pop(0)
+
+    # noinspection PyUnusedLocal
+    def expect(self, patterns, timeout=None):
+        regexes = [pattern if isinstance(pattern, str) else '(?!)' for pattern in patterns]
+        try:
+            return self._search(regexes)
+        except pexpect.TIMEOUT:
+            if pexpect.TIMEOUT in patterns:
+                return patterns.index(pexpect.TIMEOUT)
+            raise
+
+    def expect_exact(self, text, timeout=None):
+        return self._search([re.escape(text)])
+
+    def prompt(self, timeout=None):
+        try:
+            self._search([self.PROMPT])
+            return True
+        except pexpect.TIMEOUT:
+            return False
+
+    def isalive(self):
+        return True
+
+
+def test_run_pattern_response(monkeypatch):
+    warnings = []
+    monkeypatch.setattr('fullmonty.remote_shell.pxssh', ScriptedPxssh)
+    monkeypatch.setattr('fullmonty.remote_shell.warning', warnings.append)
+
+    # noinspection PyDocstring
+    def no_sleep(seconds):
+        raise AssertionError("slept {seconds} seconds".format(seconds=seconds))
+
+    monkeypatch.setattr('fullmonty.remote_shell.sleep', no_sleep)
+    ScriptedPxssh.sessions = [({'install': ['install\r\nContinue? [y/n] '],
+                                'y': ['y\r\n', None, 'done\r\n[PEXPECT]$ ']}, True)]
+    remote = RemoteShell('web1', user='deploy', password='secret', lazy=True)
+    out_stream = io.StringIO()
+    output = remote.run('install', pattern_response={r'Continue\? \[y/n\] ': 'y'}, out_stream=out_stream)
+    session = remote._ssh
+    assert session.sent[0].startswith('echo ' + SYNC_MARKER)
+    # the response follows the prompt's match, the sentinel's echo and the stale output are not the command's
+    assert session.sent[1:] == ['install', 'y']
+    assert 'stale' not in ''.join(output)
+    assert 'done' in ''.join(output)
+    assert len(warnings) == 1 and 'no output' in warnings[0]
+    assert 'no output' not in out_stream.getvalue()
+
+
+def test_run_reconnects_when_out_of_sync(monkeypatch):
+    monkeypatch.setattr('fullmonty.remote_shell.pxssh', ScriptedPxssh)
+    monkeypatch.setattr('fullmonty.remote_shell.warning', lambda message: None)
+    ScriptedPxssh.sessions = [({}, False), ({'echo hi': ['echo hi\r\nhi\r\n[PEXPECT]$ ']}, True)]
+    remote = RemoteShell('web1', user='deploy', password='secret', lazy=True, reconnect_retries=0)
+    first = remote.ssh
+    assert 'hi' in remote.run('echo hi', verbose=False)
+    assert 'echo hi' not in first.sent
+    assert remote.reconnect_count == 1
+
+    ScriptedPxssh.sessions = [({}, False), ({}, False)]
+    remote = RemoteShell('web1', user='deploy', password='secret', lazy=True, reconnect_retries=0)
+    with pytest.raises(IOError):
+        remote.run('echo hi', verbose=False)
+    assert 'echo hi' not in remote._ssh.sent
+
+
+def test_put_get(remote_shell):
+    with TmpDir() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source')
+        os.makedirs(os.path.join(source, 'sub'))
+        for name in ['one.txt', 'sub/two.txt']:
+            with open(os.path.join(source, name), 'w') as out_file:
+                out_file.write(name * 1000)
+        remote_dir = os.path.join(tmp_dir, 'remote')
+        remote_shell.put(source, remote_dir)
+        assert open(os.path.join(remote_dir, 'sub', 'two.txt')).read() == 'sub/two.txt' * 1000
+
+        local_dir = os.path.join(tmp_dir, 'local')
+        os.mkdir(local_dir)
+        remote_shell.get(os.path.join(remote_dir, '*.txt'), local_dir)
+        assert os.listdir(local_dir) == ['one.txt']
+
+        assert remote_shell.get_tar(remote_dir, os.path.join(tmp_dir, 'tar'), compress=True) == 2
+        assert open(os.path.join(tmp_dir, 'tar', 'sub', 'two.txt')).read() == 'sub/two.txt' * 1000
+
+
+def test_tar_noisy_stderr(remote_shell, monkeypatch):
+    with TmpDir() as tmp_dir:
+        # a remote tar that writes more to stderr than the channel's window before packing the archive
+        bin_dir = os.path.join(tmp_dir, 'bin')
+        os.mkdir(bin_dir)
+        with open(os.path.join(bin_dir, 'tar'), 'w') as out_file:
+            out_file.write("#!/bin/sh\nhead -c 4000000 /dev/zero | tr '\\0' x >&2\nexec {tar} \"$@\"\n".format(
+                tar=which('tar')))
+        os.chmod(os.path.join(bin_dir, 'tar'), 0o755)
+        monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ['PATH'])
+
+        source = os.path.join(tmp_dir, 'source')
+        os.mkdir(source)
+        with open(os.path.join(source, 'file'), 'w') as out_file:
+            out_file.write('data')
+        assert remote_shell.get_tar(source, os.path.join(tmp_dir, 'copy')) == 1
+        assert open(os.path.join(tmp_dir, 'copy', 'file')).read() == 'data'
+        assert remote_shell.put_tar(source, os.path.join(tmp_dir, 'put')) == 1
+
+
+def test_sync(remote_shell):
+    with TmpDir() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source')
+        os.mkdir(source)
+        for name in ['one', 'two']:
+            with open(os.path.join(source, name), 'w') as out_file:
+                out_file.write(name)
+        remote_dir = os.path.join(tmp_dir, 'remote')
+        assert len(remote_shell.sync(source, remote_dir).uploads) == 2
+        with open(os.path.join(source, 'two'), 'w') as out_file:
+            out_file.write('changed')
+        plan = remote_shell.sync(source, remote_dir)
+        assert [remote for local, remote in plan.uploads] == [os.path.join(remote_dir, 'two')]
+        assert open(os.path.join(remote_dir, 'two')).read() == 'changed'
+
+
+def test_sync_modes_directories(remote_shell):
+    with TmpDir() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source')
+        os.makedirs(os.path.join(source, 'empty'))
+        with open(os.path.join(source, 'script'), 'w') as out_file:
+            out_file.write('echo hi')
+        # the remote directory's parents do not exist
+        remote_dir = os.path.join(tmp_dir, 'a', 'b', 'remote')
+        remote_shell.sync(source, remote_dir)
+        assert sorted(os.listdir(remote_dir)) == ['empty', 'script']
+
+        os.chmod(os.path.join(source, 'script'), 0o755)
+        os.makedirs(os.path.join(remote_dir, 'extra', 'deeper'))
+        with open(os.path.join(remote_dir, 'extra', 'deeper', 'file'), 'w') as out_file:
+            out_file.write('extra')
+        plan = remote_shell.sync(source, remote_dir, delete=True)
+        assert plan.uploads == []
+        assert plan.updates == [(os.path.join(source, 'script'), os.path.join(remote_dir, 'script'))]
+        assert plan.rmdirs == [os.path.join(remote_dir, 'extra', 'deeper'), os.path.join(remote_dir, 'extra')]
+        assert os.stat(os.path.join(remote_dir, 'script')).st_mode & 0o777 == 0o755
+        assert sorted(os.listdir(remote_dir)) == ['empty', 'script']
+
+        plan = remote_shell.sync(source, remote_dir, delete=True)
+        assert plan.uploads == plan.updates == plan.deletes == plan.rmdirs == []
+
+
+def test_stream_remote_file(remote_shell):
+    with TmpDir() as tmp_dir:
+        path = os.path.join(tmp_dir, 'big.log')
+        with open(path, 'w') as out_file:
+            for index in range(100000):
+                out_file.write("line {index}\n".format(index=index))
+        lines = list(remote_shell.iter_lines(path))
+        assert len(lines) == 100000
+        assert lines[-1] == "line 99999\n"
+        assert next(remote_shell.iter_lines(path, start_offset=len("line 0\n"))) == "line 1\n"
+        with remote_shell.open_remote(path) as remote_file:
+            assert remote_file.read() == open(path, 'rb').read()
+        assert list(remote_shell.tail(path, lines=2, follow=False)) == ["line 99998\n", "line 99999\n"]
+
+
+def test_tail_follow(remote_shell):
+    with TmpDir() as tmp_dir:
+        path = os.path.join(tmp_dir, 'follow.log')
+        with open(path, 'w') as out_file:
+            out_file.write("a\nb\n")
+        lines = remote_shell.tail(path, lines=1, interval=0.01)
+        assert next(lines) == "b\n"
+        with open(path, 'a') as out_file:
+            out_file.write("c\n")
+        assert next(lines) == "c\n"
+        with open(path, 'w') as out_file:
+            out_file.write("x\n")
+        assert next(lines) == "x\n"
+        lines.close()
+
+
+def test_agent(remote_shell):
+    with TmpDir() as tmp_dir:
+        path = os.path.join(tmp_dir, 'data')
+        with open(path, 'wb') as out_file:
+            out_file.write(b'agent data')
+        agent = remote_shell.agent()
+        assert agent.stat(path).st_size == 10
+        assert agent.listdir(tmp_dir) == ['data']
+        assert agent.listdir_stat(tmp_dir)[0][1].st_size == 10
+        assert agent.hash(path) == hashlib.md5(b'agent data').hexdigest()
+        assert agent.read(path, 6, 2) == b'da'
+        assert agent.call('os.path.getsize', path) == 10
+        with pytest.raises(OSError):
+            agent.stat(os.path.join(tmp_dir, 'missing'))
+        with pytest.raises(RemoteAgentError):
+            agent.call('json.loads', 'not json')
+        assert remote_shell.agent() is agent
+        assert agent.running
+    remote_shell.logout()
+    assert not agent.running
+
+
+def test_agent_prints(remote_shell):
+    agent = remote_shell.agent()
+    # more than the channel's 2MB window
+    for _ in range(4):
+        assert agent.call('builtins.print', 'x' * 1024 * 1024) is None
+    assert agent.call('os.getcwd')
+    assert len(agent._stderr.data()) == agent._stderr.limit
+    with pytest.raises(RemoteAgentError) as info:
+        agent.call('os._exit', 1)
+    assert info.value.args[0].startswith('the agent exited: xxx')
+    remote_shell.logout()
+
+
+def test_facts(remote_shell):
+    facts = remote_shell.facts()
+    assert facts.cpu_count >= 1
+    assert remote_shell.facts() is facts
+    assert remote_shell.facts(refresh=True) is not facts
+
+
+def test_reconnect(remote_shell):
+    assert remote_shell.run("echo one", verbose=False) == "one\n"
+    remote_shell.transport().sock.close()
+    assert remote_shell.run("echo two", verbose=False) == "two\n"
+    assert remote_shell.reconnect_count == 1
+
+
+def test_reconnect_threads(remote_shell, monkeypatch):
+    assert remote_shell.run("echo one", verbose=False) == "one\n"
+    remote_shell.probe_interval = 0
+
+    # noinspection PyDocstring
+    def is_alive():
+        sleep(0.1)
+        return remote_shell.reconnect_count > 0
+
+    monkeypatch.setattr(remote_shell, 'is_alive', is_alive)
+    threads = [threading.Thread(target=remote_shell._ensure_alive) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert remote_shell.reconnect_count == 1
+    assert remote_shell.run("echo two", verbose=False) == "two\n"
+
+
+@pytest.mark.skipif(not os.environ.get('FULLMONTY_BENCHMARK'), reason="set FULLMONTY_BENCHMARK to run the benchmarks")
+def test_benchmarks(ssh_server):
+    results = run_benchmarks(ssh_server, iterations=5, large_size=1024 * 1024, small_count=10)
+    assert sorted(results) == sorted(name for name, unit in BENCHMARK_UNITS)
+    assert all(value > 0 for value in results.values())
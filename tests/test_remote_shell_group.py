@@ -0,0 +1,69 @@
+# coding=utf-8
+
+"""
+Test RemoteShellGroup against the in-process ssh server
+"""
+import io
+import os
+
+from fullmonty.remote_shell_group import HostResult, RemoteShellGroup, parse_host
+from fullmonty.tmp_dir import TmpDir
+
+
+def test_parse_host():
+    assert parse_host('web1') == (None, 'web1', None)
+    assert parse_host('deploy@db1:2222') == ('deploy', 'db1', 2222)
+    assert parse_host('::1') == (None, '::1', None)
+
+
+def test_group_run(ssh_server):
+    out_stream = io.StringIO()
+    hosts = ['127.0.0.1:{port}'.format(port=ssh_server.port), 'localhost:{port}'.format(port=ssh_server.port),
+             '127.0.0.1:1']
+    with RemoteShellGroup(hosts, user=ssh_server.user, password=ssh_server.password, out_stream=out_stream,
+                          connect_timeout=2) as group:
+        results = group.run('echo hello; exit 2')
+        assert results[hosts[0]].output == 'hello\n'
+        assert results[hosts[1]].exit_status == 2
+        assert results[hosts[2]].error is not None
+        assert "{host}: hello\n".format(host=hosts[1]) in out_stream.getvalue()
+        summary = group.summarize(results)
+        assert summary[0][0] == sorted(hosts[:2])
+        assert summary[1][0] == [hosts[2]]
+
+        results = group.run('echo started; sleep 5', timeout=0.5, verbose=False)
+        assert results[hosts[0]].output == 'started\n'
+        assert 'timed out' in str(results[hosts[0]].error)
+        assert results[hosts[0]].exit_status == -1
+
+
+def test_group_timeout_blocks_reconnect(ssh_server):
+    hosts = ['127.0.0.1:{port}'.format(port=ssh_server.port)]
+    with TmpDir() as tmp_dir:
+        marker = os.path.join(tmp_dir, 'marker')
+
+        # noinspection PyDocstring
+        def operation(host, shell):
+            shell.exec_command('sleep 5')
+            shell.exec_command(['touch', marker])
+            return HostResult(host, None, 0, None)
+
+        with RemoteShellGroup(hosts, user=ssh_server.user, password=ssh_server.password) as group:
+            results = group._each(operation, 0.5)
+            assert 'timed out' in str(results[hosts[0]].error)
+            assert not os.path.exists(marker)
+            assert group.run('echo again', verbose=False)[hosts[0]].output == 'again\n'
+
+
+def test_group_put_get(ssh_server):
+    hosts = ['127.0.0.1:{port}'.format(port=ssh_server.port), 'localhost:{port}'.format(port=ssh_server.port)]
+    with TmpDir() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source.txt')
+        with open(source, 'w') as out_file:
+            out_file.write('data')
+        with RemoteShellGroup(hosts, user=ssh_server.user, password=ssh_server.password) as group:
+            results = group.put(source, os.path.join(tmp_dir, 'remote.txt'))
+            assert all(result.error is None for result in results.values())
+            group.get(os.path.join(tmp_dir, 'remote.txt'), os.path.join(tmp_dir, 'local'))
+        for host in hosts:
+            assert open(os.path.join(tmp_dir, 'local', host, 'remote.txt')).read() == 'data'
@@ -0,0 +1,336 @@
+# coding=utf-8
+
+"""
+Test SimpleLogger
+"""
+import atexit
+import gc
+import gzip
+import io
+import json
+import os
+import threading
+import weakref
+from time import sleep
+
+import pytest
+
+from fullmonty import simple_logger
+from fullmonty.simple_logger import FileLogger, SimpleLogger, OVERFLOW_DROP, OVERFLOW_DROP_OLDEST
+from fullmonty.tmp_dir import TmpDir
+
+
+# noinspection PyDocstring
+class Unprintable(object):
+    def __str__(self):
+        raise AssertionError("formatted a disabled message")
+
+
+def test_disabled_level_is_not_formatted():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    assert not logger.is_enabled('debug')
+    logger.debug(Unprintable())
+    logger.debug("value %s", Unprintable())
+    assert out_stream.getvalue() == ''
+
+
+def test_deferred_arguments():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    logger.set_verbosity(3)
+    assert logger.is_enabled('debug')
+    logger.debug("x=%s y=%d", 'a', 2)
+    logger.info("100%")
+    assert out_stream.getvalue() == "x=a y=2\n100%\n"
+
+
+def test_levels_follow_outputters():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    logger.set_verbose(False)
+    assert not logger.is_enabled('info')
+    logger.log_outputter['info'].append(out_stream)
+    logger.update_levels()
+    logger.info("shown")
+    assert out_stream.getvalue() == "shown\n"
+
+
+def test_outputter_changes_take_effect():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    logger.set_component_level('remote', 'info')
+    logger.debug("hidden")
+    logger.component('remote').info("one")
+    logger.log_outputter['debug'] = [out_stream]
+    logger.debug("two")
+    other = io.StringIO()
+    logger.log_outputter['info'].append(other)
+    logger.component('remote').info("three")
+    logger.log_outputter['debug'].remove(out_stream)
+    logger.debug("hidden")
+    del logger.log_outputter['info'][:]
+    logger.info("hidden")
+    assert out_stream.getvalue() == "[remote]  one\ntwo\n[remote]  three\n"
+    assert other.getvalue() == "[remote]  three\n"
+
+    # the assigned lists are copied
+    streams = []
+    logger.log_outputter = {'info': streams}
+    streams.append(other)
+    logger.info("hidden")
+    assert other.getvalue() == "[remote]  three\n"
+
+
+def test_timestamp():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    logger.enable_timestamp = True
+    logger.info("one")
+    logger.info("two")
+    first, second = out_stream.getvalue().splitlines()
+    assert first.endswith(" one") and len(first.split()[0]) == 8
+    assert second.endswith(" two")
+
+
+def test_file_logger_buffers():
+    with TmpDir() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'test.log')
+        file_logger = FileLogger(filename, flush_interval=None)
+        file_logger.write("one\n")
+        assert open(filename).read() == ''
+        file_logger.flush()
+        assert open(filename).read() == "one\n"
+        file_logger.close()
+        file_logger.write("two\n")
+        file_logger.close()
+        assert open(filename).read() == "one\ntwo\n"
+
+
+def test_file_logger_flush_interval():
+    with TmpDir() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'test.log')
+        file_logger = FileLogger(filename, flush_interval=0.2)
+        file_logger.write("one\n")
+        assert open(filename).read() == ''
+        sleep(0.5)
+        assert open(filename).read() == "one\n"
+        file_logger.close()
+
+
+def test_file_logger_not_kept_alive():
+    with TmpDir() as tmp_dir:
+        file_logger = FileLogger(os.path.join(tmp_dir, 'test.log'))
+        file_logger.write("one\n")
+        file_logger.close()
+        reference = weakref.ref(file_logger)
+        del file_logger
+        gc.collect()
+        assert reference() is None
+
+
+def test_file_logger_rotates():
+    with TmpDir() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'test.log')
+        file_logger = FileLogger(filename, max_bytes=10, backup_count=2, compress=True)
+        for index in range(4):
+            file_logger.write("{0}23456789\n".format(index))
+        file_logger.close()
+        assert sorted(os.listdir(tmp_dir)) == ['test.log', 'test.log.1.gz', 'test.log.2.gz']
+        assert open(filename).read() == "323456789\n"
+        assert gzip.open(filename + '.1.gz').read() == b"223456789\n"
+        assert gzip.open(filename + '.2.gz').read() == b"123456789\n"
+
+
+# noinspection PyDocstring
+class SlowStream(object):
+    def __init__(self):
+        self.lines = []
+        self.release = threading.Event()
+
+    def write(self, buf):
+        self.release.wait()
+        self.lines.append(buf)
+
+    def flush(self):
+        pass
+
+
+def test_async_drains_on_flush():
+    stream = SlowStream()
+    logger = SimpleLogger(out_stream=stream, err_stream=stream)
+    logger.set_async()
+    for index in range(100):
+        logger.info("message %d", index)
+    assert len(stream.lines) < 100
+    stream.release.set()
+    logger.flush()
+    assert stream.lines == ["message {0}\n".format(index) for index in range(100)]
+    logger.set_async(False)
+
+
+def test_async_overflow():
+    for overflow, expected in [(OVERFLOW_DROP, ["0\n", "1\n", "2\n"]), (OVERFLOW_DROP_OLDEST, ["0\n", "8\n", "9\n"])]:
+        stream = SlowStream()
+        logger = SimpleLogger(out_stream=stream, err_stream=stream)
+        logger.set_async(queue_size=2, overflow=overflow, batch_size=1)
+        logger.info("0")
+        # the writer thread is blocked writing the first message
+        while logger._writer._records:
+            sleep(0.01)
+        for index in range(1, 10):
+            logger.info(str(index))
+        stream.release.set()
+        logger.flush()
+        assert stream.lines == expected
+        assert logger.dropped == 7
+        logger.set_async(False)
+
+
+# noinspection PyDocstring
+class BrokenStream(object):
+    def write(self, buf):
+        raise IOError("disk full")
+
+    def flush(self):
+        pass
+
+
+def test_async_reports_write_errors(capsys):
+    logger = SimpleLogger(out_stream=BrokenStream(), err_stream=BrokenStream())
+    logger.set_async()
+    logger.info("lost")
+    logger.flush()
+    logger.set_async(False)
+    err = capsys.readouterr().err
+    assert 'BrokenStream' in err and 'disk full' in err
+
+
+def test_async_drains_before_files_close(monkeypatch):
+    registered = []
+    monkeypatch.setattr(atexit, 'register', registered.append)
+    with TmpDir() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'test.log')
+        file_logger = FileLogger(filename, flush_interval=None)
+        stream = SlowStream()
+        logger = SimpleLogger(out_stream=stream, err_stream=stream)
+        logger.add_logger(file_logger)
+        logger.set_async()
+        logger.set_async()
+        for index in range(100):
+            logger.info("message %d", index)
+        threading.Timer(0.1, stream.release.set).start()
+        simple_logger._shutdown()
+        assert open(filename).read() == ''.join("message {0}\n".format(index) for index in range(100))
+    assert registered == []
+
+
+def test_json_lines():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    logger.set_json(host='web1')
+    logger.set_component('db')
+    logger.info('took %d ms "fast"', 5, request_id=42)
+    try:
+        try:
+            raise KeyError('inner')
+        except KeyError:
+            raise ValueError('outer')
+    except ValueError as ex:
+        logger.error(ex)
+    lines = out_stream.getvalue().splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert list(record) == ['timestamp', 'level', 'component', 'message', 'host', 'request_id']
+    assert record['level'] == 'info' and record['component'] == 'db' and record['host'] == 'web1'
+    assert record['message'] == 'took 5 ms "fast"' and record['request_id'] == 42
+    assert record['timestamp'].endswith('Z')
+    record = json.loads(lines[1])
+    assert record['message'] == 'outer'
+    assert record['exception'] == ["'inner'"]
+    assert 'ValueError: outer' in record['traceback']
+
+
+def test_json_lines_keys_and_progress():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    with pytest.raises(ValueError):
+        logger.set_json(level='custom')
+    assert not logger.json_output
+    logger.set_json(host='web1')
+    with pytest.raises(ValueError):
+        logger.info('started', traceback='duplicate')
+    with pytest.raises(ValueError):
+        logger.info('started', host='web2')
+    logger.progress()
+    logger.component('db').progress()
+    assert out_stream.getvalue() == ''
+    for name in ('db', 'web', 'db'):
+        logger.component(name).info('started')
+    assert [json.loads(line)['component'] for line in out_stream.getvalue().splitlines()] == ['db', 'web', 'db']
+
+
+def test_component_levels():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    logger.set_component_level('remote', 'debug')
+    logger.set_component_level('remote.sftp', 'warning')
+    logger.component('remote.exec').debug("exec %s", 'ls')
+    logger.component('remote.sftp').info("hidden")
+    logger.component('remote.sftp.channel').warning("shown")
+    logger.component('local').debug(Unprintable())
+    logger.debug("hidden")
+    assert logger.is_enabled('debug', 'remote')
+    assert not logger.is_enabled('debug')
+    assert out_stream.getvalue() == "[remote.exec]  exec ls\n[remote.sftp.channel]  shown\n"
+
+    logger.set_component_level('remote.sftp')
+    logger.component('remote.sftp').debug("now shown")
+    assert out_stream.getvalue().endswith("[remote.sftp]  now shown\n")
+
+    logger.set_component('remote.exec')
+    logger.debug("current component")
+    assert out_stream.getvalue().endswith("[remote.exec]  current component\n")
+
+
+def test_component_keys():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    logger.set_component(['web1', 'web2'])
+    logger.info("unhashable")
+    logger.set_component(None)
+    for index in range(simple_logger.DISPATCH_LIMIT + 10):
+        logger.component('host{index}'.format(index=index)).debug("hidden")
+    assert len(logger._dispatch) <= simple_logger.DISPATCH_LIMIT
+    assert out_stream.getvalue() == "[['web1', 'web2']]  unhashable\n"
+
+
+def test_levels_updated_while_resolving():
+    out_stream = io.StringIO()
+    info_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+
+    class ChangingLevels(dict):
+        def __contains__(self, name):
+            if 'info' not in logger.log_outputter or logger.log_outputter['info'] != [info_stream]:
+                logger.log_outputter['info'] = [info_stream]
+            return dict.__contains__(self, name)
+
+    logger.component_levels = ChangingLevels(db='info')
+    logger.update_levels()
+    logger.component('db').info("stale")
+    logger.component('db').info("current")
+    assert info_stream.getvalue() == "[db]  current\n"
+
+
+def test_component_logger_methods():
+    out_stream = io.StringIO()
+    logger = SimpleLogger(out_stream=out_stream, err_stream=out_stream)
+    log = logger.component('deploy')
+    log.progress()
+    log.progress()
+    log.flush()
+    assert out_stream.getvalue() == "[deploy]  .[deploy]  ."
+    with pytest.raises(SystemExit):
+        log.fatal("stopped %s", 'now')
+    assert out_stream.getvalue().endswith("\n[deploy]  stopped now\n")
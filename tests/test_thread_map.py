@@ -0,0 +1,35 @@
+# coding=utf-8
+
+"""
+Test thread_map
+"""
+import time
+
+import pytest
+
+from fullmonty.thread_map import thread_map
+
+
+def test_thread_map_order():
+    assert thread_map(lambda x: x * 2, range(20), max_workers=4) == [x * 2 for x in range(20)]
+    assert thread_map(lambda x: x, []) == []
+
+
+def test_thread_map_concurrent():
+    start = time.time()
+    thread_map(time.sleep, [0.2] * 10, max_workers=10)
+    assert time.time() - start < 1
+
+
+def test_thread_map_exceptions():
+    # noinspection PyDocstring
+    def check(x):
+        if x == 3:
+            raise ValueError(x)
+        return x
+
+    with pytest.raises(ValueError):
+        thread_map(check, range(5))
+    results = thread_map(check, range(5), return_exceptions=True)
+    assert results[:3] == [0, 1, 2]
+    assert isinstance(results[3], ValueError)
@@ -0,0 +1,78 @@
+# coding=utf-8
+
+"""
+Test TransferScheduler
+"""
+import io
+import os
+import threading
+from time import sleep, time
+
+from fullmonty.host_facts import HostFactsCache
+from fullmonty.remote_shell import RemoteShell
+from fullmonty.tmp_dir import TmpDir
+from fullmonty.transfer_scheduler import TokenBucket, TransferScheduler
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(100000)
+    start = time()
+    for _ in range(30):
+        bucket.consume(10000)
+    # the first second's worth is the burst, the other 200000 tokens take 2 seconds
+    assert 1.8 < time() - start < 3.0
+
+
+def test_small_files_first():
+    scheduler = TransferScheduler(max_concurrent=1)
+    started = []
+    order = []
+    release = threading.Event()
+
+    # noinspection PyDocstring
+    def transfer(size):
+        with scheduler.slot('host', size):
+            started.append(size)
+            if size == 0:
+                release.wait()
+            order.append(size)
+
+    blocker = threading.Thread(target=transfer, args=(0,))
+    blocker.start()
+    while not started:
+        sleep(0.01)
+    threads = [threading.Thread(target=transfer, args=(size,)) for size in [300, 100, 200]]
+    for thread in threads:
+        thread.start()
+    while scheduler.waiting < 3:
+        sleep(0.01)
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join()
+    assert order == [0, 100, 200, 300]
+    assert scheduler.active == 0
+
+
+def test_throttled_put(ssh_server):
+    scheduler = TransferScheduler(host_rate=256 * 1024, max_concurrent=2)
+    remote = RemoteShell(ssh_server.host, user=ssh_server.user, password=ssh_server.password, port=ssh_server.port,
+                         lazy=True, use_channels=True, facts_cache=HostFactsCache(), transfer_scheduler=scheduler)
+    try:
+        with TmpDir() as tmp_dir:
+            source = os.path.join(tmp_dir, 'source')
+            os.mkdir(source)
+            for index in range(4):
+                with open(os.path.join(source, '{index}.bin'.format(index=index)), 'wb') as out_file:
+                    out_file.write(os.urandom(192 * 1024))
+            start = time()
+            remote.put(source, os.path.join(tmp_dir, 'remote'))
+            # 768KB at 256KB/s after the first second's burst
+            assert time() - start > 1.5
+            assert sorted(os.listdir(os.path.join(tmp_dir, 'remote'))) == ['0.bin', '1.bin', '2.bin', '3.bin']
+            assert scheduler.throughput(ssh_server.host) > 0
+            assert scheduler.throughput('other') == 0.0
+            report = io.StringIO()
+            scheduler.report(out_stream=report)
+            assert ssh_server.host in report.getvalue()
+    finally:
+        remote.logout()